@@ -1,38 +1,56 @@
 import os
 import time
-import google.generativeai as genai
-from google.generativeai import types
 import uuid
-import sys
 import tempfile
 import shutil
-import requests
 import json
+import hashlib
 from datetime import datetime, timezone
 import time
 import random
-from typing import List, Dict, Any, Optional
+import threading
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse, unquote,urlunparse
+from .registry import configure_auth, get_model, http_session
+from .singleflight import SingleFlight
+from .grading_memo import (
+    answer_memo,
+    split_by_question,
+    normalize_answer,
+    normalize_label,
+    rubric_entry_hash,
+    rubric_fingerprint,
+    MEMO_MAX_ANSWER_CHARS,
+)
+from .rubric_rules import apply_rules
+from .usage import usage_ledger, usage_scope, TokenBudgetExceeded
+from .hedging import hedged_generate
+from .cascade import run_cascade, TRANSCRIBE_MODEL_TIERS, GRADING_MODEL_TIERS, MIN_TRANSCRIPT_CHARS
+from .memory_budget import memory_budget
+from .file_cleanup import file_cleaner, upload_display_name
+from .transcription_store import get_transcription_store
+from .gradebook_stats import record_result
+from .duplicates import pdf_fingerprint, grading_key, duplicate_gradings, fetch_representative_grading
 
 
 
 
 def setup_auth():
-    """Sets up authentication for the Gemini API by checking for an env var."""
-    try:
-        api_key = os.environ["GEMINI_API_KEY"]
-        genai.configure(api_key=api_key)
-        print("Authentication configured using GOOGLE_API_KEY.")
-    except KeyError:
-        print("Error: GOOGLE_API_KEY environment variable not set.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"An error occurred during authentication setup: {e}")
-        sys.exit(1)
+    """Sets up authentication for the Gemini API by checking for an env var (once per process)."""
+    configure_auth()
 
 
-def grade_student_answer(rubric_text: str, question_text: str, student_answer: str, model_name: str = "gemini-2.5-flash"):
-    model = genai.GenerativeModel(model_name=model_name)
+def grade_student_answer(rubric_text: str, question_text: str, student_answer: str, model_name: str = "gemini-2.5-flash",
+                         skip_questions: Optional[List[str]] = None):
+    from google.generativeai import types
+
+    model = get_model(model_name)
+    skip_note = ""
+    if skip_questions:
+        skip_note = (
+            f"Questions {', '.join(skip_questions)} have already been graded. "
+            "Do not include them in results."
+        )
     grading_prompt = f"""
     You are an expert teacher grading a student's submission.
     
@@ -54,7 +72,7 @@ def grade_student_answer(rubric_text: str, question_text: str, student_answer: s
     5. Be extremely strict in the marking. If a question mentions do not add anything in your report for this question, give the student full marks.
 
     Only use numeric scores listed in the rubric. Do not invent new scales.
-
+    {skip_note}
     OUTPUT FORMAT:
     {{
       "results": [
@@ -92,7 +110,8 @@ def grade_student_answer(rubric_text: str, question_text: str, student_answer: s
     ]
     
     try:
-        response = model.generate_content(
+        response = hedged_generate(
+            model, "grading", model_name,
             grading_prompt,
             generation_config=types.GenerationConfig(
                 temperature=0.1,
@@ -132,26 +151,204 @@ def grade_student_answer(rubric_text: str, question_text: str, student_answer: s
         
         return response.text
         
+    except TokenBudgetExceeded:
+        # Not a model failure: the cascade must not escalate to a pricier tier.
+        raise
     except Exception as e:
         return {
             "error": "Exception during generation",
             "detail": str(e)
         }
 
-def transcribe_pdf_from_path(pdf_path: str, system_prompt: str, model_name: str = "gemini-2.5-flash"):
+def merge_grading(model_results: List[Dict[str, Any]], local_results: Dict[str, Dict[str, Any]],
+                  order: List[str], overall_feedback: str = "") -> Dict[str, Any]:
+    """Combine model-graded and locally decided per-question results into one grading dict."""
+    by_label: Dict[str, Dict[str, Any]] = {}
+    for item in model_results:
+        by_label.setdefault(normalize_label(item.get("question")) or str(item.get("question")), item)
+    for label, item in local_results.items():
+        by_label[label] = item
+    rank = {label: i for i, label in enumerate(order)}
+    results = sorted(by_label.items(), key=lambda kv: rank.get(kv[0], len(rank)))
+    results = [item for _, item in results]
+    return {
+        "results": results,
+        "overall_feedback": overall_feedback,
+        "total_score": sum(item.get("score", 0) or 0 for item in results),
+    }
+
+
+def _grading_check(expected_labels: List[str]):
+    """Cascade check for grading: completed, parseable, and covering every expected question."""
+    def check(grading) -> Optional[str]:
+        if not isinstance(grading, str):
+            return f"finish_reason:{grading['finish_reason']}" if grading.get("finish_reason") else "error"
+        try:
+            data = parse_grading_json(grading)
+        except (json.JSONDecodeError, AttributeError):
+            return "json_parse"
+        returned = {normalize_label(item.get("question")) for item in data.get("results", []) if isinstance(item, dict)}
+        if any(label not in returned for label in expected_labels):
+            return "missing_questions"
+        return None
+    return check
+
+
+def grade_answers(assignment_id: Optional[str], rubric_text: str, question_text: str, student_answer: str,
+                  model_name: Optional[str] = None, sync_memo: bool = True):
+    """
+    grade_student_answer, but questions that can be settled without the model
+    are scored locally first:
+      - rubric_rules.py decides blank, fixed-score, full-marks and exact-match items;
+      - short answers matching one already graded for this assignment reuse the
+        stored score and reason (grading_memo.py; skipped when assignment_id is None).
+    The model gets the original transcript with the locally scored questions
+    listed as already graded, through the GRADING_MODEL_TIERS cascade unless model_name pins one model. Returns the
+    same JSON text (or error dict) as grade_student_answer.
+
+    sync_memo=False skips dropping memo entries of rubric lines not in
+    rubric_text; pass it when rubric_text is only part of the rubric.
+    """
+    rubric_sections = split_by_question(rubric_text)
+    answers = split_by_question(student_answer, list(rubric_sections) or None)
+    local = apply_rules(rubric_sections, answers)
+
+    pending: Dict[str, Tuple[str, str]] = {}
+    if assignment_id is not None and sync_memo:
+        answer_memo.sync_rubric(assignment_id, rubric_text)
+    for label, text in answers.items():
+        if label in local:
+            continue
+        normalized = normalize_answer(text)
+        rubric_hash = rubric_entry_hash(rubric_sections, label, rubric_text)
+        hit = None
+        if assignment_id is not None and normalized and len(normalized) <= MEMO_MAX_ANSWER_CHARS:
+            hit = answer_memo.lookup(assignment_id, label, rubric_hash, normalized)
+        if hit:
+            hit["question"] = label
+            hit["graded_by"] = "memo"
+            local[label] = hit
+        else:
+            pending[label] = (normalized, rubric_hash)
+
+    order = list(rubric_sections) + [label for label in answers if label not in rubric_sections]
+    outstanding = [label for label in rubric_sections if label not in local]
+    outstanding += [label for label in pending if label not in rubric_sections]
+    if answers and local and not outstanding:
+        merged = merge_grading([], local, order, "All questions were graded from the rubric rules or earlier identical answers.")
+        return json.dumps(merged)
+
+    tiers = [model_name] if model_name else GRADING_MODEL_TIERS
+    grading = run_cascade(
+        "grading", tiers,
+        lambda tier_model: grade_student_answer(rubric_text=rubric_text, question_text=question_text,
+                                                student_answer=student_answer, model_name=tier_model,
+                                                skip_questions=list(local) or None),
+        _grading_check(outstanding),
+    )
+    if not isinstance(grading, str):
+        return grading
+
+    try:
+        data = parse_grading_json(grading)
+    except (json.JSONDecodeError, AttributeError):
+        return grading
+
+    if assignment_id is not None:
+        for item in data.get("results", []):
+            label = normalize_label(item.get("question"))
+            if label in pending:
+                normalized, rubric_hash = pending[label]
+                answer_memo.store(assignment_id, label, rubric_hash, normalized, item)
+
+    if not local:
+        return grading
+    merged = merge_grading(data.get("results", []), local, order, data.get("overall_feedback", ""))
+    return json.dumps(merged)
+
+
+# Identical transcriptions already in progress (same bytes, prompt and models)
+# are shared instead of being sent to Gemini again.
+_transcription_flights = SingleFlight()
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def transcription_flight_stats() -> Dict[str, int]:
+    return _transcription_flights.stats()
+
+
+def transcribe_pdf_from_path(pdf_path: str, system_prompt: str, model_name: Optional[str] = None):
+    """
+    Transcribe a PDF with Gemini. By default the TRANSCRIBE_MODEL_TIERS cascade
+    is used (cheapest model first, see cascade.py); pass model_name to pin one
+    model. Concurrent calls for the same file contents, prompt and models wait
+    on one shared in-progress call and get its result.
+    """
+    tiers = (model_name,) if model_name else tuple(TRANSCRIBE_MODEL_TIERS)
     try:
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=system_prompt
+        key = (file_sha256(pdf_path), hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(), tiers)
+    except OSError as e:
+        return f"Error: {e}"
+    return _transcription_flights.do(key, _transcribe_pdf_uncoalesced, pdf_path, system_prompt, tiers)
+
+
+def _finish_reason_name(candidate) -> str:
+    reason = getattr(candidate, "finish_reason", None)
+    return getattr(reason, "name", None) or ("STOP" if reason == 1 else str(reason))
+
+
+def _generate_transcript(pdf_file, system_prompt: str, model_name: str) -> Tuple[str, Optional[str]]:
+    """One transcription attempt on an already uploaded file: (text, finish reason)."""
+    from google.generativeai import types
+
+    try:
+        model = get_model(model_name, system_prompt)
+    except Exception as e:
+        return f"Error: Could not instantiate model {model_name}.", None
+
+    try:
+        response = hedged_generate(
+            model, "transcription", model_name,
+            [pdf_file, "Please transcribe this document following all instructions."],
+            generation_config=types.GenerationConfig(
+                max_output_tokens=15000,
+                temperature=0.0
+            )
         )
+        finish_reason = _finish_reason_name(response.candidates[0]) if response.candidates else "NO_CANDIDATES"
+        return response.text, finish_reason
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
-        return f"Error: Could not instantiate model {model_name}."
+        return f"Error: {e}", None
+
+
+def _check_transcript(attempt: Tuple[str, Optional[str]]) -> Optional[str]:
+    text, finish_reason = attempt
+    if text.startswith("Error:"):
+        return "error"
+    if finish_reason != "STOP":
+        return f"finish_reason:{finish_reason}"
+    if len(text.strip()) < MIN_TRANSCRIPT_CHARS:
+        return "too_short"
+    return None
+
+
+def _transcribe_pdf_uncoalesced(pdf_path: str, system_prompt: str, tiers: Tuple[str, ...]):
+    import google.generativeai as genai
 
     pdf_file = None
     try:
         pdf_file = genai.upload_file(
             path=pdf_path,
-            display_name=os.path.basename(pdf_path)
+            display_name=upload_display_name(pdf_path)
         )
 
         while pdf_file.state.name == "PROCESSING":
@@ -161,25 +358,25 @@ def transcribe_pdf_from_path(pdf_path: str, system_prompt: str, model_name: str
         if pdf_file.state.name != "ACTIVE":
             raise Exception(f"File processing failed. Final state: {pdf_file.state.name}")
 
-        response = model.generate_content(
-            [pdf_file, "Please transcribe this document following all instructions."],
-            generation_config=types.GenerationConfig(
-                max_output_tokens=15000,
-                temperature=0.0
-            )
+        # The file is uploaded once and reused by every tier of the cascade.
+        text_output, _ = run_cascade(
+            "transcription", list(tiers),
+            lambda tier_model: _generate_transcript(pdf_file, system_prompt, tier_model),
+            _check_transcript,
         )
-        text_output = response.text
 
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
         text_output = f"Error: {e}"
     finally:
+        # Deleted in the background (file_cleanup.py), off the request path.
         if pdf_file:
-            try:
-                genai.delete_file(name=pdf_file.name)
-            except Exception:
-                pass
+            file_cleaner.delete_later(pdf_file.name)
 
     return text_output
+
+
 def construct_full_storage_url(file_path: str, supabase_url: str, bucket_name: str) -> str:
     """Construct full Supabase storage URL from various input formats."""
     if file_path.startswith("http://") or file_path.startswith("https://"):
@@ -227,7 +424,7 @@ def get_signed_url(file_path: str, supabase_url: str, supabase_key: str,
     payload = {"expiresIn": expires_in}
     
     print(f"   Requesting signed URL from: {sign_url}")
-    resp = requests.post(sign_url, json=payload, headers=headers, timeout=10)
+    resp = http_session().post(sign_url, json=payload, headers=headers, timeout=10)
     
     if resp.status_code != 200:
         raise Exception(f"Sign request failed: {resp.status_code} - {resp.text}")
@@ -240,22 +437,58 @@ def get_signed_url(file_path: str, supabase_url: str, supabase_key: str,
     
     return sign_url+"?token"+signed_path
 
-def grade_submissions_for_assignment(assignment_id: str) -> Dict[str, Any]:
+PROMPT_SUBMISSION_ANSWERSCRIPT = (
+    "You are an expert transcriptionist specializing in handwritten documents."
+    "Transcribe the attached PDF, which contains handwritten answers."
+    "Start each answer with 'Answer:' on a new line and convert math to LaTeX."
+)
+
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def download_file(url: str, local_name: str, timeout: int = 10) -> Tuple[int, str]:
     """
-    Fetch submissions for an assignment from Supabase, transcribe, and grade each one.
-    Only requires assignment_id. Uses environment variables for Supabase URL and key.
+    GET url into local_name, streamed to disk one DOWNLOAD_CHUNK_BYTES chunk
+    at a time. The chunk buffer is held against the shared memory budget
+    (waiting for room if needed) until the file is on disk. Returns
+    (status_code, error_text); raises MemoryBudgetFull if no room frees up in
+    time. A partly written file is removed if the download fails.
     """
-    setup_auth()
+    resp = http_session().get(url, timeout=timeout, stream=True)
+    try:
+        if resp.status_code != 200:
+            return resp.status_code, resp.text
+        content_length = int(resp.headers.get("Content-Length") or DOWNLOAD_CHUNK_BYTES)
+        with memory_budget.reserve(min(content_length, DOWNLOAD_CHUNK_BYTES)):
+            try:
+                with open(local_name, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        f.write(chunk)
+            except BaseException:
+                if os.path.exists(local_name):
+                    os.remove(local_name)
+                raise
+        return resp.status_code, ""
+    finally:
+        resp.close()
+
 
+def get_supabase_credentials():
+    """Reads the Supabase URL and key from environment variables."""
     SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL") or os.environ.get("SUPABASE_URL")
     SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise Exception("Supabase URL or key not provided in environment variables")
+    return SUPABASE_URL, SUPABASE_KEY
 
-    tmpdir = tempfile.mkdtemp(prefix="submissions_")
 
-    # Fetch assignment questions
-    questions_resp = requests.get(
+def load_assignment_texts(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str):
+    """
+    Download and transcribe the question and rubric PDFs for an assignment.
+    Returns a (question_txt, rubric_txt) tuple.
+    """
+    questions_resp = http_session().get(
         f"{SUPABASE_URL.rstrip('/')}/rest/v1/assignments",
         params={"select": "*", "id": f"eq.{assignment_id}"},
         headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}", "Accept": "application/json"},
@@ -265,117 +498,528 @@ def grade_submissions_for_assignment(assignment_id: str) -> Dict[str, Any]:
         raise Exception(f"Failed to fetch questions: {questions_resp.status_code} {questions_resp.text}")
 
     questions = questions_resp.json()
+    with usage_scope(assignment=assignment_id):
+        question_txt, rubric_txt = _transcribe_assignment_files(questions, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+    return question_txt, rubric_txt
+
+
+def _transcribe_assignment_files(questions: List[Dict[str, Any]], SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str):
     question_txt, rubric_txt = "", ""
     for question in questions:
         try:
             # Transcribe question
             file_url = question.get("file_url")
             signed_url = get_signed_url(file_url, SUPABASE_URL, SUPABASE_KEY, "assignments")
-            signed_resp = requests.get(signed_url, timeout=10)
-            if signed_resp.status_code == 200:
-                local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(file_url)}")
-                with open(local_name, "wb") as f:
-                    f.write(signed_resp.content)
+            local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(file_url)}")
+            status, _ = download_file(signed_url, local_name)
+            if status == 200:
                 question_txt = transcribe_pdf_from_path(local_name, "question")
 
             # Transcribe rubric
             rubric_url = question.get("rubric_path")
             signed_url = get_signed_url(rubric_url, SUPABASE_URL, SUPABASE_KEY, "rubric")
-            signed_resp = requests.get(signed_url, timeout=10)
-            if signed_resp.status_code == 200:
-                local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(rubric_url)}")
-                with open(local_name, "wb") as f:
-                    f.write(signed_resp.content)
+            local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(rubric_url)}")
+            status, _ = download_file(signed_url, local_name)
+            if status == 200:
                 rubric_txt = transcribe_pdf_from_path(local_name, "rubric")
         except Exception as e:
             print(f"❌ Failed to download or transcribe question/rubric: {e}")
 
-    # Fetch submissions
-    submissions_resp = requests.get(
+    return question_txt, rubric_txt
+
+
+# Transcribed (question_txt, rubric_txt) per assignment, so event-driven and
+# worker grading don't re-transcribe the same PDFs for every submission.
+ASSIGNMENT_TEXT_TTL_SECONDS = int(os.environ.get("ASSIGNMENT_TEXT_TTL_SECONDS", "3600"))
+_assignment_text_cache: Dict[str, Tuple[float, str, str]] = {}
+_assignment_text_locks: Dict[str, threading.Lock] = {}
+_assignment_text_guard = threading.Lock()
+
+
+def rubric_usable(rubric_txt: Optional[str]) -> bool:
+    """False for a missing rubric or the "Error: ..." text a failed transcription returns."""
+    return bool(rubric_txt) and not rubric_txt.startswith("Error:")
+
+
+def get_assignment_texts(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str,
+                         refresh: bool = False) -> Tuple[str, str]:
+    """
+    Cached wrapper around load_assignment_texts; one transcription per
+    assignment at a time. A failed rubric transcription is returned but not cached.
+    """
+    with _assignment_text_guard:
+        lock = _assignment_text_locks.setdefault(assignment_id, threading.Lock())
+    with lock:
+        cached = _assignment_text_cache.get(assignment_id)
+        if cached and not refresh and time.time() - cached[0] < ASSIGNMENT_TEXT_TTL_SECONDS:
+            return cached[1], cached[2]
+        question_txt, rubric_txt = load_assignment_texts(assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+        if rubric_usable(rubric_txt):
+            _assignment_text_cache[assignment_id] = (time.time(), question_txt, rubric_txt)
+        return question_txt, rubric_txt
+
+
+def invalidate_assignment_texts(assignment_id: Optional[str] = None):
+    """Drop cached question/rubric text for one assignment, or for all of them."""
+    with _assignment_text_guard:
+        if assignment_id is None:
+            _assignment_text_cache.clear()
+        else:
+            _assignment_text_cache.pop(assignment_id, None)
+
+
+def grade_single_submission(sub: Dict[str, Any], assignment_id: str, question_txt: str, rubric_txt: str,
+                            SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str, record_failure: bool = True,
+                            still_owned: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Download, transcribe and grade one submission row, uploading its result.
+    Returns the per-submission result dict used in the batch report.
+
+    record_failure=False skips the "failed" results row (the queue worker
+    only writes it on the last attempt). still_owned, if given, is checked
+    right before anything is uploaded; when it returns False nothing is
+    written and the status is "lease_lost". Once the job's token budget is
+    spent the status is "not_attempted" and nothing is written either.
+    """
+    with usage_scope(assignment=assignment_id, submission=sub.get("id")):
+        result = _grade_single_submission(sub, assignment_id, question_txt, rubric_txt,
+                                          SUPABASE_URL, SUPABASE_KEY, tmpdir, record_failure, still_owned)
+    if sub.get("id") is not None:
+        result["token_usage"] = usage_ledger.totals("submission", sub.get("id"))
+    return result
+
+
+def transcription_model_version() -> str:
+    """Identifies what produced a stored transcription: the transcribe tiers plus the prompt's hash."""
+    prompt_hash = hashlib.sha256(PROMPT_SUBMISSION_ANSWERSCRIPT.encode("utf-8")).hexdigest()[:8]
+    return f"{','.join(TRANSCRIBE_MODEL_TIERS)}@{prompt_hash}"
+
+
+_duplicate_transcriptions = SingleFlight()
+
+
+def _transcribe_representative(local_name: str, submission_id: str, assignment_id: str, content_hash: str,
+                               fingerprint: Optional[str], model_version: str) -> Tuple[str, str]:
+    student_text = transcribe_pdf_from_path(local_name, PROMPT_SUBMISSION_ANSWERSCRIPT)
+    if not student_text.startswith("Error:"):
+        get_transcription_store().put(submission_id, assignment_id, content_hash, model_version, student_text,
+                                      fingerprint)
+    return student_text, submission_id
+
+
+def transcribe_submission(sub: Dict[str, Any], assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str,
+                          tmpdir: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Transcription stage for one submission row. Downloads the PDF and returns
+    the stored transcription for its content hash and the current model
+    version if there is one (status "stored"), so a re-uploaded PDF is never
+    answered with the old text; otherwise transcribes the PDF and stores the
+    text (status "transcribed"). Other statuses: skipped, download_failed, error.
+
+    A PDF that duplicates another submission of the assignment (duplicates.py)
+    reuses that submission's transcription, and the returned "duplicate_of"
+    names it. "duplicate_key" identifies the PDF's content for grading.
+    """
+    submission_id = sub.get("id")
+    file_url = sub.get("file_url")
+    model_version = transcription_model_version()
+    outcome = {"submission_id": submission_id, "user_id": sub.get("user_id")}
+    if not file_url:
+        return {**outcome, "status": "skipped", "reason": "no public file_url present"}
+
+    store = get_transcription_store()
+
+    # Approach 2: Signed URL
+    print(f"\n🔄 Attempt 2: Signed URL")
+    signed_url = get_signed_url(file_url, SUPABASE_URL, SUPABASE_KEY, "submissions")
+    print(f"   Signed URL: {signed_url}")
+
+    local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(file_url)}")
+    status, error_text = download_file(signed_url, local_name)
+    print(f"   Signed response status: {status}")
+    if status != 200:
+        print(f"   ❌ Signed download failed: {error_text[:200]}")
+        return {**outcome, "status": "download_failed", "detail": error_text[:200]}
+
+    print(f"   ✅ Signed download successful!")
+    try:
+        content_hash = file_sha256(local_name)
+        stored = None if force else store.get(submission_id, model_version=model_version, content_hash=content_hash)
+        if stored:
+            print(f"   📚 Using stored transcription ({model_version})")
+            return {**outcome, "status": "stored", "transcript": stored["transcript"],
+                    "content_hash": stored["content_hash"],
+                    "duplicate_key": stored.get("fingerprint") or stored["content_hash"],
+                    "duplicate_of": stored.get("duplicate_of")}
+        fingerprint = pdf_fingerprint(local_name)
+        duplicate_key = fingerprint or content_hash
+        representative = None if force else store.find_duplicate(
+            assignment_id, submission_id, content_hash, fingerprint, model_version
+        )
+        if representative:
+            student_text = representative["transcript"]
+            representative_id = representative.get("duplicate_of") or representative["submission_id"]
+        else:
+            # Duplicates transcribed at the same time wait for the first one.
+            student_text, representative_id = _duplicate_transcriptions.do(
+                (str(assignment_id), model_version, duplicate_key), _transcribe_representative,
+                local_name, submission_id, assignment_id, content_hash, fingerprint, model_version
+            )
+    finally:
+        os.remove(local_name)
+    if student_text.startswith("Error:"):
+        return {**outcome, "status": "error", "detail": student_text}
+    duplicate_of = representative_id if str(representative_id) != str(submission_id) else None
+    if duplicate_of is not None:
+        print(f"   ♻️ Duplicate of submission {duplicate_of}; reusing its transcription")
+        store.put(submission_id, assignment_id, content_hash, model_version, student_text, fingerprint,
+                  duplicate_of)
+    return {**outcome, "status": "transcribed", "transcript": student_text, "content_hash": content_hash,
+            "duplicate_key": duplicate_key, "duplicate_of": duplicate_of}
+
+
+def _usable_grading(grading) -> bool:
+    """A grading worth copying to duplicates: parseable JSON with per-question results."""
+    if not isinstance(grading, str):
+        return False
+    try:
+        return bool(parse_grading_json(grading).get("results"))
+    except (json.JSONDecodeError, AttributeError):
+        return False
+
+
+def grade_transcribed_submission(sub: Dict[str, Any], assignment_id: str, question_txt: str, rubric_txt: str,
+                                 student_text: str, SUPABASE_URL: str, SUPABASE_KEY: str,
+                                 duplicate_key: Optional[str] = None,
+                                 duplicate_of: Optional[str] = None,
+                                 still_owned: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Grading stage for one submission: grade its transcription and upload the
+    result. Submissions with the same duplicate_key share one grading; a
+    duplicate whose representative was already graded against this rubric
+    gets a copy of that result, recorded in results.duplicate_of.
+    """
+    submission_id = sub.get("id")
+    rubric_hashes = rubric_fingerprint(rubric_txt)
+
+    def grade():
+        if duplicate_of is not None:
+            copied = fetch_representative_grading(duplicate_of, rubric_hashes, SUPABASE_URL, SUPABASE_KEY)
+            if copied is not None:
+                return copied, duplicate_of
+        return grade_answers(assignment_id, rubric_txt, question_txt, student_text), submission_id
+
+    if duplicate_key is None:
+        grading, representative = grade()
+    else:
+        # Only a detected duplicate reuses a remembered grading; the representative is graded again.
+        grading, representative = duplicate_gradings.grade(
+            grading_key(assignment_id, rubric_hashes, duplicate_key), submission_id, grade,
+            reuse=duplicate_of is not None, cacheable=_usable_grading,
+        )
+    copied_from = representative if str(representative) != str(submission_id) else None
+    if copied_from is not None:
+        print(f"   ♻️ Copying the grading of duplicate submission {copied_from}")
+    print(grading)
+    if still_owned is not None and not still_owned():
+        print(f"   ⚠️ Lost the lease on submission {submission_id}; not uploading")
+        return {"submission_id": submission_id, "user_id": sub.get("user_id"), "status": "lease_lost"}
+    uploaded = upload_results(SUPABASE_URL, SUPABASE_KEY, submission_id, sub.get("user_id"), "graded", grading,
+                              assignment_id, token_usage=usage_ledger.totals("submission", submission_id),
+                              rubric_hashes=rubric_hashes, duplicate_of=copied_from)
+    return {
+        "submission_id": submission_id,
+        "user_id": sub.get("user_id"),
+        "status": "graded" if uploaded else "upload_failed",
+        "grading": grading,
+        "duplicate_of": copied_from
+    }
+
+
+def _grade_single_submission(sub: Dict[str, Any], assignment_id: str, question_txt: str, rubric_txt: str,
+                             SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str, record_failure: bool = True,
+                             still_owned: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    user_id = sub.get("user_id")
+    file_url = sub.get("file_url")
+    submission_id = sub.get("id")
+
+    try:
+        print(f"\n📄 Processing submission:")
+        print(f"   Submission ID: {submission_id}")
+        print(f"   User ID: {user_id}")
+        print(f"   Raw file_url: '{file_url}'")
+
+        try:
+            stage = transcribe_submission(sub, assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+        except TokenBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"   ❌ Signed URL failed: {e}")
+            stage = {"status": "download_failed", "detail": str(e)}
+        if stage["status"] == "skipped":
+            return stage
+        if stage["status"] in ("stored", "transcribed"):
+            return grade_transcribed_submission(sub, assignment_id, question_txt, rubric_txt, stage["transcript"],
+                                                SUPABASE_URL, SUPABASE_KEY, stage.get("duplicate_key"),
+                                                stage.get("duplicate_of"), still_owned)
+
+        if still_owned is not None and not still_owned():
+            return {"submission_id": submission_id, "user_id": user_id, "status": "lease_lost"}
+        if record_failure:
+            print("Upload Results starting")
+            upload_results(SUPABASE_URL, SUPABASE_KEY, submission_id, user_id, "failed", None, assignment_id,
+                           token_usage=usage_ledger.totals("submission", submission_id))
+        return {
+            "submission_id": submission_id,
+            "user_id": user_id,
+            "status": stage["status"],
+            "detail": stage.get("detail", "Both direct and signed URL approaches failed")
+        }
+    except TokenBudgetExceeded as e:
+        # The job's token budget is spent: nothing is written for this submission.
+        print(f"   🛑 Not attempted: {e}")
+        return {"submission_id": submission_id, "user_id": user_id, "status": "not_attempted", "detail": str(e)}
+    except Exception as e:
+        return {"submission_id": submission_id, "user_id": user_id, "status": "error", "detail": str(e)}
+
+
+# Only the columns grading uses are fetched, one keyset page (ordered by id) at a time.
+SUBMISSION_COLUMNS = "id,user_id,file_url,status"
+SUBMISSION_PAGE_SIZE = int(os.environ.get("SUBMISSION_PAGE_SIZE", "200"))
+
+
+def fetch_submission_page(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str, after_id: Any = None,
+                          page_size: int = SUBMISSION_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Any]:
+    """
+    One page of an assignment's submissions with id > after_id.
+    Returns (rows, next_after_id); next_after_id is None once a page comes
+    back empty. A short page is not taken as the end, since PostgREST's
+    max-rows can cap pages below page_size.
+    """
+    params = {
+        "select": SUBMISSION_COLUMNS,
+        "assignment_id": f"eq.{assignment_id}",
+        "order": "id.asc",
+        "limit": str(page_size),
+    }
+    if after_id is not None:
+        params["id"] = f"gt.{after_id}"
+    submissions_resp = http_session().get(
         f"{SUPABASE_URL.rstrip('/')}/rest/v1/submissions",
-        params={"select": "*", "assignment_id": f"eq.{assignment_id}"},
+        params=params,
         headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}", "Accept": "application/json"},
         timeout=30
     )
     if submissions_resp.status_code != 200:
         raise Exception(f"Failed to fetch submissions: {submissions_resp.status_code} {submissions_resp.text}")
+    rows = submissions_resp.json()
+    next_after = rows[-1]["id"] if rows else None
+    return rows, next_after
 
-    submissions = submissions_resp.json()
-    results = []
 
-    PROMPT_ANSWERSCRIPT = (
-        "You are an expert transcriptionist specializing in handwritten documents."
-        "Transcribe the attached PDF, which contains handwritten answers."
-        "Start each answer with 'Answer:' on a new line and convert math to LaTeX."
-    )
+def iter_submission_pages(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str,
+                          page_size: int = SUBMISSION_PAGE_SIZE):
+    """Yield an assignment's submissions page by page."""
+    after_id = None
+    while True:
+        rows, after_id = fetch_submission_page(assignment_id, SUPABASE_URL, SUPABASE_KEY, after_id, page_size)
+        if rows:
+            yield rows
+        if after_id is None:
+            return
+
+
+# How often a blocked prefetch producer checks whether the consumer went away.
+PREFETCH_PUT_TIMEOUT_S = 0.5
+
+
+class _Prefetch:
+    """Iterator returned by prefetch(); close() (or leaving a with block) stops the producer thread."""
+
+    _done = object()
+
+    def __init__(self, iterable, depth: int):
+        import queue as queue_module
+
+        self._items = queue_module.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _put(self, entry) -> bool:
+        import queue as queue_module
+
+        while not self._stop.is_set():
+            try:
+                self._items.put(entry, timeout=PREFETCH_PUT_TIMEOUT_S)
+                return True
+            except queue_module.Full:
+                continue
+        return False
+
+    def _produce(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put((item, None)):
+                    return
+        except BaseException as e:
+            self._put((None, e))
+            return
+        self._put((self._done, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._stop.is_set():
+            raise StopIteration
+        item, error = self._items.get()
+        if error is not None:
+            self.close()
+            raise error
+        if item is self._done:
+            self.close()
+            raise StopIteration
+        return item
+
+    def close(self):
+        self._stop.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def prefetch(iterable, depth: int = 1) -> _Prefetch:
+    """
+    Start consuming `iterable` on a background thread now, keeping up to
+    `depth` items ready, so the next page downloads while the caller works on
+    the current one. Exceptions are re-raised in the caller. Close the
+    returned iterator (or use it as a context manager) if you stop early, so
+    the producer stops too.
+    """
+    return _Prefetch(iterable, depth)
+
 
+def fetch_submissions(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str) -> List[Dict[str, Any]]:
+    """Fetch all submission rows for an assignment."""
+    return [sub for page in iter_submission_pages(assignment_id, SUPABASE_URL, SUPABASE_KEY) for sub in page]
+
+
+def grade_submissions_for_assignment(assignment_id: str) -> Dict[str, Any]:
+    """
+    Fetch submissions for an assignment from Supabase, transcribe, and grade each one.
+    Only requires assignment_id. Uses environment variables for Supabase URL and key.
+    Submission pages are fetched in the background (starting while the rubric
+    is transcribed), so grading starts with the first page.
+    """
+    setup_auth()
+
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+
+    tmpdir = tempfile.mkdtemp(prefix="submissions_")
+    results = []
+
+    pages = prefetch(iter_submission_pages(assignment_id, SUPABASE_URL, SUPABASE_KEY))
     try:
-        for sub in submissions:
+        question_txt, rubric_txt = load_assignment_texts(assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+
+        for page in pages:
+            for sub in page:
+                results.append(grade_single_submission(
+                    sub, assignment_id, question_txt, rubric_txt, SUPABASE_URL, SUPABASE_KEY, tmpdir
+                ))
+    finally:
+        pages.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {"count": len(results), "results": results}
+
+
+def _run_stage(assignment_id: str, fn, max_workers: int) -> List[Dict[str, Any]]:
+    """Run fn(sub) for every submission of an assignment on a thread pool, pages fetched in the background."""
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+
+    def in_scope(sub):
+        with usage_scope(assignment=assignment_id, submission=sub.get("id")):
             try:
-                user_id = sub.get("user_id")
-                file_url = sub.get("file_url")
-                submission_id = sub.get("id")
-                
-                print(f"\n📄 Processing submission:")
-                print(f"   Submission ID: {submission_id}")
-                print(f"   User ID: {user_id}")
-                print(f"   Raw file_url: '{file_url}'")
-                
-                if not file_url:
-                    results.append({
-                        "submission_id": submission_id,
-                        "user_id": user_id,
-                        "status": "skipped",
-                        "reason": "no public file_url present"
-                    })
-                    continue
-
-                # Approach 2: Signed URL
-                print(f"\n🔄 Attempt 2: Signed URL")
-                try:
-                    signed_url = get_signed_url(file_url, SUPABASE_URL, SUPABASE_KEY, "submissions")
-                    print(f"   Signed URL: {signed_url}")
-                    
-                    signed_resp = requests.get(signed_url, timeout=10)
-                    print(f"   Signed response status: {signed_resp.status_code}")
-                    
-                    if signed_resp.status_code == 200:
-                        print(f"   ✅ Signed download successful!")
-                        local_name = os.path.join(tmpdir, f"{uuid.uuid4()}_{os.path.basename(file_url)}")
-                        with open(local_name, "wb") as f:
-                            f.write(signed_resp.content)
-                        
-                        student_text = transcribe_pdf_from_path(local_name, PROMPT_ANSWERSCRIPT)
-                        grading = grade_student_answer(rubric_text=rubric_txt, question_text=question_txt, student_answer=student_text)
-                        print(grading)
-                        results.append({
-                            "submission_id": submission_id,
-                            "user_id": user_id,
-                            "status": "graded",
-                            "grading": grading
-                        })
-                        upload_results(SUPABASE_URL, SUPABASE_KEY, submission_id, user_id, "graded", grading, assignment_id)
-                        continue
-                    else:
-                        print(f"   ❌ Signed download failed: {signed_resp.text[:200]}")
-                except Exception as e:
-                    print(f"   ❌ Signed URL failed: {e}")
-
-                # If both failed
-                results.append({
-                    "submission_id": submission_id,
-                    "user_id": user_id,
-                    "status": "download_failed",
-                    "detail": "Both direct and signed URL approaches failed"
-                })
-                print("Upload Results starting")
-                upload_results(SUPABASE_URL, SUPABASE_KEY, submission_id, user_id, "failed", grading, assignment_id)
+                return fn(sub)
             except Exception as e:
-                results.append({"submission_id": submission_id, "user_id": user_id, "status": "error", "detail": str(e)})
+                return {"submission_id": sub.get("id"), "user_id": sub.get("user_id"), "status": "error",
+                        "detail": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            prefetch(iter_submission_pages(assignment_id, SUPABASE_URL, SUPABASE_KEY)) as pages:
+        futures = [
+            pool.submit(contextvars.copy_context().run, in_scope, sub)
+            for page in pages
+            for sub in page
+        ]
+        return [future.result() for future in futures]
+
+
+def _stage_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    counts: Dict[str, int] = {}
+    for result in results:
+        result.pop("transcript", None)
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"count": len(results), "counts": counts, "results": results}
+
+
+def transcribe_submissions_for_assignment(assignment_id: str, max_workers: int = 4,
+                                          force: bool = False) -> Dict[str, Any]:
+    """
+    Transcription stage only: make sure every submission of an assignment has
+    a stored transcription for the current model version. Nothing is graded.
+    """
+    setup_auth()
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    tmpdir = tempfile.mkdtemp(prefix="transcribe_")
+    try:
+        results = _run_stage(
+            assignment_id,
+            lambda sub: transcribe_submission(sub, assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir, force),
+            max_workers,
+        )
     finally:
         shutil.rmtree(tmpdir, ignore_errors=True)
+    return _stage_report(results)
+
+
+def grade_stored_transcriptions(assignment_id: str, max_workers: int = 4) -> Dict[str, Any]:
+    """
+    Grading stage only: grade every submission from its newest stored
+    transcription (any model version). Submissions without one are reported
+    as not_transcribed and left alone.
+    """
+    setup_auth()
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    tmpdir = tempfile.mkdtemp(prefix="grade_")
+    try:
+        question_txt, rubric_txt = get_assignment_texts(assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    store = get_transcription_store()
+
+    def grade(sub):
+        stored = store.get(sub.get("id"))
+        if not stored:
+            return {"submission_id": sub.get("id"), "user_id": sub.get("user_id"), "status": "not_transcribed"}
+        return grade_transcribed_submission(sub, assignment_id, question_txt, rubric_txt, stored["transcript"],
+                                            SUPABASE_URL, SUPABASE_KEY,
+                                            stored.get("fingerprint") or stored["content_hash"],
+                                            stored.get("duplicate_of"))
+
+    return _stage_report(_run_stage(assignment_id, grade, max_workers))
 
-    return {"count": len(results), "results": results}
 
 def generate_unique_bigint():
     timestamp_ms = int(time.time() * 1000)  # Current time in milliseconds
@@ -391,6 +1035,8 @@ def update_submission_status(
     submission_id: str,
     new_status: str
 ) -> bool:
+    import requests
+
     if not submission_id:
         print("Update Status Error: submission_id is missing. Skipping update.")
         return False
@@ -411,7 +1057,7 @@ def update_submission_status(
     }
 
     try:
-        response = requests.patch(rest_url, headers=headers, json=payload, timeout=30)
+        response = http_session().patch(rest_url, headers=headers, json=payload, timeout=30)
         
         # Check for success (2xx)
         response.raise_for_status()
@@ -427,13 +1073,32 @@ def update_submission_status(
     
     return False
 
+def parse_grading_json(raw_results_text: str) -> Dict[str, Any]:
+    """Strip markdown code fences from a model grading response and parse its JSON."""
+    # Remove leading/trailing whitespace
+    cleaned_text = raw_results_text.strip()
+
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[len("```json"):].strip()
+    elif cleaned_text.startswith("```"):
+        cleaned_text = cleaned_text[len("```"):].strip()
+
+    # Remove trailing ``` if present
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3].strip()
+
+    return json.loads(cleaned_text)
+
 def upload_results(SUPABASE_URL: str,
     SUPABASE_KEY: str,
     submission_id: str,
     user_id: str,
     processing_status: str,
     raw_results_text: str,
-    assignment_id: str
+    assignment_id: str,
+    token_usage: Optional[Dict[str, Any]] = None,
+    rubric_hashes: Optional[Dict[str, str]] = None,
+    duplicate_of: Optional[str] = None
 ):
     """
     Parses a raw result text, calculates the total score, and uploads the
@@ -446,8 +1111,16 @@ def upload_results(SUPABASE_URL: str,
         user_id: The UUID for the user.
         processing_status: The current status (e.g., "completed").
         raw_results_text: A string containing the JSON results from the model.
+        token_usage: Model token/cost totals for this submission, stored in 'token_usage'
+            (backend/supabase/results_token_usage.sql).
+        rubric_hashes: Per-question rubric entry hashes the result was graded with
+            (grading_memo.rubric_fingerprint), so regrade.py can tell which questions
+            a later rubric edit affects.
+        duplicate_of: For a duplicate submission whose result was copied, the
+            submission it was copied from (see duplicates.py).
     """
-    
+    import requests
+
     print("Starting results upload...")
 
     try:
@@ -489,27 +1162,7 @@ def upload_results(SUPABASE_URL: str,
             if not raw_results_text:
                 raise ValueError("Processing status is not 'failed' but raw_results_text is empty.")
             
-            # --- NEW: Add text processing to clean the raw string ---
-            # Remove leading/trailing whitespace
-            cleaned_text = raw_results_text.strip()
-            
-            cleaned_text = cleaned_text.lstrip()          # remove leading spaces/newlines
-
-            if cleaned_text.startswith("```json"):
-                cleaned_text = cleaned_text[len("```json"):].strip()
-            elif cleaned_text.startswith("```"):
-                cleaned_text = cleaned_text[len("```"):].strip()
-
-            # Remove trailing ``` if present
-            if cleaned_text.endswith("```"):
-                cleaned_text = cleaned_text[:-3].strip()
-            
-            # Slice the string from the first '{' to the last '}' to get the JSON
-            # results_data = cleaned_text[first_brace : last_brace + 1]
-            results_data = json.loads(cleaned_text)
-            
-            # # 1. Parse the raw text blob into a Python dictionary
-            # results_data = json.loads(raw_results_text)
+            results_data = parse_grading_json(raw_results_text)
 
             # 2. Extract the relevant fields from the parsed data
             result_json_list = results_data.get("results", [])
@@ -547,10 +1200,18 @@ def upload_results(SUPABASE_URL: str,
                 submission_id,
                 "graded" # "graded" or "failed"
             )
+        # Columns added by later migrations are only sent when set, so results
+        # can still be written before those migrations are applied.
+        for column, value in (("token_usage", token_usage), ("rubric_hashes", rubric_hashes),
+                              ("duplicate_of", duplicate_of)):
+            if value is not None:
+                payload[0][column] = value
         print(f"Sending data to Supabase at: {rest_url}")
-        response = requests.post(rest_url, headers=headers, data=json.dumps(payload), timeout=30)
+        response = http_session().post(rest_url, headers=headers, data=json.dumps(payload), timeout=30)
         response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
         print(f"Successfully uploaded submission! Status Code: {response.status_code}")
+        record_result(assignment_id, submission_id, processing_status, payload[0]["result_json"],
+                      payload[0]["overall_score"])
         return True
 
     except json.JSONDecodeError:
@@ -0,0 +1,305 @@
+"""
+Grade many assignments in one run.
+
+All submissions of all requested assignments share one worker pool. The
+scheduler hands out slots round-robin across assignments, so a class with 500
+submissions can't starve one with 20: every assignment keeps making progress
+from the start. Question/rubric transcription runs once per assignment
+(get_assignment_texts) and submissions of an assignment start as soon as its
+rubric is ready. Submissions are fetched a page at a time alongside the
+rubric transcription, and each page joins the backlog as it arrives.
+
+    python -m backend.fastapi_app.batch_grading <assignment_id> [<assignment_id> ...] [--workers N]
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional
+
+from .ai_utils import (
+    setup_auth,
+    get_supabase_credentials,
+    get_assignment_texts,
+    rubric_usable,
+    fetch_submission_page,
+    grade_single_submission,
+)
+from .usage import usage_ledger, usage_scope
+
+
+DEFAULT_WORKERS = 8
+MAX_WORKERS = 64
+# Question/rubric transcriptions run on their own small pool so they don't
+# hold grading slots while other assignments are ready to go.
+PREP_WORKERS = 4
+# Finished jobs stay pollable for this long; the most recent MAX_FINISHED_JOBS are kept.
+FINISHED_JOB_TTL_SECONDS = float(os.environ.get("BATCH_JOB_TTL_SECONDS", "3600"))
+MAX_FINISHED_JOBS = 100
+
+
+class BatchProgress:
+    """Thread-safe per-assignment and overall counters for one batch run."""
+
+    def __init__(self, job_id: str, assignment_ids: List[str]):
+        self.job_id = job_id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.state = "running"
+        self._lock = threading.Lock()
+        self.assignments = {
+            aid: {"state": "preparing", "total": 0, "done": 0, "graded": 0, "skipped": 0, "failed": 0,
+                  "not_attempted": 0, "fetching": True}
+            for aid in assignment_ids
+        }
+
+    def update(self, assignment_id: str, **fields):
+        with self._lock:
+            self.assignments[assignment_id].update(fields)
+
+    def texts_ready(self, assignment_id: str):
+        with self._lock:
+            entry = self.assignments[assignment_id]
+            entry["state"] = "grading" if entry["fetching"] or entry["done"] < entry["total"] else "done"
+
+    def add_page(self, assignment_id: str, count: int, more: bool):
+        with self._lock:
+            entry = self.assignments[assignment_id]
+            entry["total"] += count
+            entry["fetching"] = more
+            if not more and entry["done"] >= entry["total"] and entry["state"] != "error":
+                entry["state"] = "done"
+
+    def record(self, assignment_id: str, status: str):
+        with self._lock:
+            entry = self.assignments[assignment_id]
+            entry["done"] += 1
+            entry[status if status in ("graded", "skipped", "not_attempted") else "failed"] += 1
+            if entry["done"] >= entry["total"] and not entry["fetching"]:
+                entry["state"] = "done"
+
+    def finish(self, state: str = "done"):
+        with self._lock:
+            self.state = state
+            self.finished_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(a["total"] for a in self.assignments.values())
+            done = sum(a["done"] for a in self.assignments.values())
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                "job_id": self.job_id,
+                "state": self.state,
+                "total": total,
+                "done": done,
+                "graded": sum(a["graded"] for a in self.assignments.values()),
+                "skipped": sum(a["skipped"] for a in self.assignments.values()),
+                "failed": sum(a["failed"] for a in self.assignments.values()),
+                "not_attempted": sum(a["not_attempted"] for a in self.assignments.values()),
+                "elapsed_s": round(elapsed, 2),
+                "per_minute": round(done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+                "assignments": {aid: dict(a) for aid, a in self.assignments.items()},
+            }
+
+
+_jobs: Dict[str, BatchProgress] = {}
+_jobs_lock = threading.Lock()
+
+
+def _register_job(job_id: str, assignment_ids: List[str]) -> BatchProgress:
+    """Register (or return the existing) progress for job_id, evicting old finished jobs."""
+    now = time.time()
+    with _jobs_lock:
+        finished = sorted((p.finished_at, jid) for jid, p in _jobs.items() if p.finished_at is not None)
+        expired = [jid for at, jid in finished if now - at > FINISHED_JOB_TTL_SECONDS]
+        expired += [jid for _, jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]]
+        for jid in expired:
+            _jobs.pop(jid, None)
+        return _jobs.setdefault(job_id, BatchProgress(job_id, assignment_ids))
+
+
+def get_batch_progress(job_id: str) -> Optional[Dict[str, Any]]:
+    with _jobs_lock:
+        progress = _jobs.get(job_id)
+    if progress is None:
+        return None
+    snapshot = progress.snapshot()
+    snapshot["token_usage"] = usage_ledger.totals("job", job_id)
+    snapshot["token_budget"] = usage_ledger.budget_status(job_id)
+    return snapshot
+
+
+def _in_job(job_id: str, fn, *args):
+    with usage_scope(job=job_id):
+        return fn(*args)
+
+
+def grade_assignments(assignment_ids: List[str], max_workers: int = DEFAULT_WORKERS,
+                      job_id: Optional[str] = None, token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Grade every submission of every assignment through one fair, bounded pool.
+    With token_budget set, calls are throttled near the budget and no new
+    submissions are scheduled once it is spent.
+    Returns the final progress snapshot plus per-submission results.
+    """
+    assignment_ids = list(dict.fromkeys(assignment_ids))
+    job_id = job_id or str(uuid.uuid4())
+    progress = _register_job(job_id, assignment_ids)
+    if token_budget:
+        usage_ledger.set_budget(job_id, token_budget)
+    try:
+        setup_auth()
+        SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    except BaseException:
+        progress.finish("error")
+        raise
+    tmpdir = tempfile.mkdtemp(prefix="batch_")
+
+    contexts: Dict[str, tuple] = {}
+    backlog: Dict[str, deque] = {}
+    results: Dict[str, List[Dict[str, Any]]] = {aid: [] for aid in assignment_ids}
+    rotation = deque(assignment_ids)
+
+    prep_pool = ThreadPoolExecutor(max_workers=min(PREP_WORKERS, 2 * len(assignment_ids)) or 1)
+    grade_pool = ThreadPoolExecutor(max_workers=max_workers)
+    # ("texts", aid) futures transcribe question/rubric; ("page", aid) futures
+    # fetch the next page of submissions and chain the one after it.
+    prep_futures = {}
+    failed_prep = set()
+
+    def submit_prep(kind, aid, fn, *args):
+        future = prep_pool.submit(contextvars.copy_context().run, _in_job, job_id, fn, *args)
+        prep_futures[future] = (kind, aid)
+
+    for aid in assignment_ids:
+        backlog[aid] = deque()
+        submit_prep("texts", aid, get_assignment_texts, aid, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+        submit_prep("page", aid, fetch_submission_page, aid, SUPABASE_URL, SUPABASE_KEY)
+    in_flight = {}
+    last_report = 0.0
+    stopped_reason = None
+
+    def next_submission():
+        # Round-robin over assignments whose rubric is ready and that still have work.
+        for _ in range(len(rotation)):
+            aid = rotation[0]
+            rotation.rotate(-1)
+            if aid in contexts and backlog.get(aid):
+                return aid, backlog[aid].popleft()
+        return None, None
+
+    try:
+        while prep_futures or in_flight or any(backlog.values()):
+            budget = usage_ledger.budget_status(job_id)
+            if budget and budget["exceeded"] and stopped_reason is None:
+                print(f"🛑 Batch {job_id} token budget spent; not scheduling remaining submissions")
+                stopped_reason = "budget_exceeded"
+            if stopped_reason is not None:
+                # Everything still queued is counted, so each assignment's done reaches its total.
+                for aid, queue in backlog.items():
+                    while queue:
+                        sub = queue.popleft()
+                        results[aid].append({"submission_id": sub.get("id"), "user_id": sub.get("user_id"),
+                                             "status": "not_attempted", "detail": "job token budget spent"})
+                        progress.record(aid, "not_attempted")
+
+            while len(in_flight) < max_workers:
+                aid, sub = next_submission()
+                if aid is None:
+                    break
+                question_txt, rubric_txt = contexts[aid]
+                future = grade_pool.submit(
+                    contextvars.copy_context().run, _in_job, job_id,
+                    grade_single_submission, sub, aid, question_txt, rubric_txt, SUPABASE_URL, SUPABASE_KEY, tmpdir
+                )
+                in_flight[future] = aid
+
+            done, _ = wait(list(prep_futures) + list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in prep_futures:
+                    kind, aid = prep_futures.pop(future)
+                    if aid in failed_prep:
+                        continue
+                    try:
+                        if kind == "texts":
+                            question_txt, rubric_txt = future.result()
+                            if not rubric_usable(rubric_txt):
+                                raise Exception("the rubric could not be loaded")
+                            contexts[aid] = (question_txt, rubric_txt)
+                            progress.texts_ready(aid)
+                        else:
+                            rows, after_id = future.result()
+                            backlog[aid].extend(rows)
+                            if after_id is not None and stopped_reason is None:
+                                submit_prep("page", aid, fetch_submission_page, aid, SUPABASE_URL, SUPABASE_KEY,
+                                            after_id)
+                            progress.add_page(aid, len(rows), more=after_id is not None and stopped_reason is None)
+                    except Exception as e:
+                        print(f"❌ Failed to prepare assignment {aid}: {e}")
+                        failed_prep.add(aid)
+                        backlog[aid].clear()
+                        progress.update(aid, state="error", error=str(e), fetching=False)
+                else:
+                    aid = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"status": "error", "detail": str(e)}
+                    results[aid].append(result)
+                    progress.record(aid, result.get("status"))
+
+            if time.time() - last_report >= 10:
+                last_report = time.time()
+                snap = progress.snapshot()
+                print(f"📊 Batch {job_id}: {snap['done']}/{snap['total']} done, "
+                      f"{snap['failed']} failed, {snap['per_minute']}/min")
+        progress.finish(stopped_reason or "done")
+    except BaseException:
+        progress.finish("error")
+        raise
+    finally:
+        prep_pool.shutdown(wait=False, cancel_futures=True)
+        grade_pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report = progress.snapshot()
+    report["token_usage"] = usage_ledger.totals("job", job_id)
+    report["token_budget"] = usage_ledger.budget_status(job_id)
+    report["results"] = results
+    return report
+
+
+def start_batch(assignment_ids: List[str]) -> str:
+    """Register a batch job and return its id; run it with grade_assignments(..., job_id=id)."""
+    job_id = str(uuid.uuid4())
+    _register_job(job_id, list(dict.fromkeys(assignment_ids)))
+    return job_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade several assignments with one shared worker pool.")
+    parser.add_argument("assignment_ids", nargs="+")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--token-budget", type=int, default=None, help="Stop scheduling once this many tokens are used.")
+    args = parser.parse_args(argv)
+
+    report = grade_assignments(args.assignment_ids, args.workers, token_budget=args.token_budget)
+    print("\n✅ Finished batch grading!")
+    for aid, entry in report["assignments"].items():
+        print(f"   {aid}: {entry['graded']} graded, {entry['failed']} failed of {entry['total']} ({entry['state']})")
+    print(f"   Total: {report['done']}/{report['total']} in {report['elapsed_s']}s ({report['per_minute']}/min)")
+    usage = report["token_usage"]
+    print(f"   Tokens: {usage['total_tokens']} ({usage['prompt_tokens']} prompt, {usage['output_tokens']} output, "
+          f"{usage['cached_tokens']} cached), est. ${usage['cost_usd']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Tiered model cascade.
+
+Transcription and grading first run on the cheapest model tier and escalate to
+the next tier only when the result fails a check: the response didn't finish
+normally, the grading JSON doesn't parse, graded questions are missing, or a
+transcript is implausibly short. The last tier's result is returned as-is.
+
+Tiers are comma-separated model names, cheapest first:
+
+    TRANSCRIBE_MODEL_TIERS=gemini-2.5-flash-lite,gemini-2.5-flash
+    GRADING_MODEL_TIERS=gemini-2.5-flash-lite,gemini-2.5-flash,gemini-2.5-pro
+
+Set a single model to turn the cascade off.
+"""
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _tiers(env_var: str, default: str) -> List[str]:
+    return [name.strip() for name in os.environ.get(env_var, default).split(",") if name.strip()]
+
+
+TRANSCRIBE_MODEL_TIERS = _tiers("TRANSCRIBE_MODEL_TIERS", "gemini-2.5-flash-lite,gemini-2.5-flash")
+GRADING_MODEL_TIERS = _tiers("GRADING_MODEL_TIERS", "gemini-2.5-flash-lite,gemini-2.5-flash")
+# Transcripts shorter than this (in characters) are treated as failed reads.
+MIN_TRANSCRIPT_CHARS = int(os.environ.get("MIN_TRANSCRIPT_CHARS", "40"))
+
+
+class CascadeStats:
+    """Attempts, acceptances, escalations (by reason) and latency per (kind, model)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def record(self, kind: str, model_name: str, latency_s: float, failure: Optional[str], escalated: bool):
+        with self._lock:
+            tier = self._tiers.setdefault(kind, {}).setdefault(model_name, {
+                "attempts": 0, "accepted": 0, "escalated": 0, "failed_final": 0,
+                "latency_s": 0.0, "reasons": {},
+            })
+            tier["attempts"] += 1
+            tier["latency_s"] += latency_s
+            if failure is None:
+                tier["accepted"] += 1
+            else:
+                tier["escalated" if escalated else "failed_final"] += 1
+                tier["reasons"][failure] = tier["reasons"].get(failure, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {}
+            for kind, tiers in self._tiers.items():
+                report[kind] = {}
+                for model_name, tier in tiers.items():
+                    entry = {**tier, "reasons": dict(tier["reasons"])}
+                    attempts = tier["attempts"] or 1
+                    entry["escalation_rate"] = round(tier["escalated"] / attempts, 4)
+                    entry["mean_latency_s"] = round(tier["latency_s"] / attempts, 3)
+                    entry["latency_s"] = round(tier["latency_s"], 3)
+                    report[kind][model_name] = entry
+            return report
+
+
+cascade_stats = CascadeStats()
+
+
+def run_cascade(kind: str, tiers: List[str], attempt: Callable[[str], Any],
+                check: Callable[[Any], Optional[str]]) -> Any:
+    """
+    Call attempt(model_name) for each tier in order until check(result) returns
+    None (accepted). check returns a short failure reason otherwise.
+    """
+    result = None
+    for i, model_name in enumerate(tiers):
+        start = time.perf_counter()
+        result = attempt(model_name)
+        failure = check(result)
+        last = i == len(tiers) - 1
+        cascade_stats.record(kind, model_name, time.perf_counter() - start, failure, escalated=not last)
+        if failure is None:
+            return result
+        if not last:
+            print(f"⤴️ {kind} on {model_name} failed check ({failure}); escalating to {tiers[i + 1]}")
+    return result
@@ -0,0 +1,190 @@
+"""
+Duplicate-submission detection within an assignment.
+
+Students often upload the same PDF several times, and every copy is its own
+submission row. Each downloaded submission therefore gets a duplicate key: its
+pdf_fingerprint(), a hash over the PDF's page content and image streams that
+ignores metadata, document IDs and object layout (so a re-saved or re-exported
+copy of the same pages matches), or its SHA-256 when the PDF has no streams.
+
+The first submission with a key is the representative:
+- Transcription: a later submission with the same key (or the same bytes) in
+  the assignment reuses the representative's stored transcription
+  (transcribe_submission).
+- Grading: DuplicateGradings remembers gradings per (assignment, rubric,
+  duplicate key) in this process and coalesces duplicates graded at the same
+  time onto one call. Only duplicates reuse a remembered grading; the
+  representative itself is always graded again, so re-running grading
+  re-grades. Otherwise the representative's latest Supabase result is copied,
+  if it was graded against the same rubric.
+
+Copied results are uploaded with results.duplicate_of set to the
+representative's submission ID.
+"""
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .memory_budget import memory_budget
+from .registry import http_session
+from .singleflight import SingleFlight
+
+
+DUPLICATE_CACHE_ENTRIES = int(os.environ.get("DUPLICATE_CACHE_ENTRIES", "4096"))
+# Flate streams are inflated FINGERPRINT_CHUNK_BYTES at a time into the hash;
+# a stream inflating past FINGERPRINT_MAX_INFLATED_BYTES is hashed compressed.
+FINGERPRINT_CHUNK_BYTES = 1024 * 1024
+FINGERPRINT_MAX_INFLATED_BYTES = int(os.environ.get("FINGERPRINT_MAX_INFLATED_BYTES", str(256 * 1024 * 1024)))
+
+_STREAM = re.compile(rb"(?<![A-Za-z])stream\r?\n")
+# Streams that change when the same pages are saved again.
+_VOLATILE_STREAM_TYPES = (b"/ObjStm", b"/XRef", b"/Metadata")
+
+
+def _stream_digest(body: bytes, flate: bool) -> bytes:
+    """sha256 of a stream's decompressed content, inflated in bounded chunks; of its raw bytes otherwise."""
+    if flate:
+        h = hashlib.sha256()
+        inflater = zlib.decompressobj()
+        pending, inflated = body, 0
+        try:
+            while pending:
+                chunk = inflater.decompress(pending, FINGERPRINT_CHUNK_BYTES)
+                inflated += len(chunk)
+                if inflated > FINGERPRINT_MAX_INFLATED_BYTES:
+                    break
+                h.update(chunk)
+                pending = inflater.unconsumed_tail
+            else:
+                h.update(inflater.flush())
+                return h.digest()
+        except zlib.error:
+            pass
+    return hashlib.sha256(body).digest()
+
+
+def pdf_fingerprint(pdf_path: str) -> Optional[str]:
+    """
+    sha256 over the digests of the PDF's content and image streams in
+    document order (Flate streams compared decompressed), or None if no
+    stream was found.
+    """
+    with memory_budget.reserve(os.path.getsize(pdf_path)):
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+    digests = []
+    pos = 0
+    while True:
+        match = _STREAM.search(data, pos)
+        if match is None:
+            break
+        end = data.find(b"endstream", match.end())
+        if end < 0:
+            break
+        pos = end + len(b"endstream")
+        header = data[data.rfind(b"obj", 0, match.start()):match.start()]
+        if any(kind in header for kind in _VOLATILE_STREAM_TYPES):
+            continue
+        body = data[match.end():end].rstrip(b"\r\n")
+        digests.append(_stream_digest(body, b"/FlateDecode" in header))
+    if not digests:
+        return None
+    h = hashlib.sha256()
+    for digest in digests:
+        h.update(digest)
+    return h.hexdigest()
+
+
+def grading_key(assignment_id: str, rubric_hashes: Dict[str, str], duplicate_key: str) -> Tuple[str, str, str]:
+    rubric_digest = hashlib.sha256(json.dumps(rubric_hashes, sort_keys=True).encode("utf-8")).hexdigest()
+    return str(assignment_id), rubric_digest, duplicate_key
+
+
+class DuplicateGradings:
+    """
+    Gradings by (assignment, rubric, duplicate key), kept for the last
+    `max_entries` keys. Concurrent duplicates wait for one grading.
+    """
+
+    def __init__(self, max_entries: int = DUPLICATE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._gradings: "OrderedDict[Tuple[str, str, str], Tuple[str, str]]" = OrderedDict()
+        self._flights = SingleFlight()
+        self._stats = {"graded": 0, "copied": 0}
+
+    def grade(self, key: Tuple[str, str, str], submission_id: Any, fn: Callable[[], Tuple[Any, Any]],
+              reuse: bool = True, cacheable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, Any]:
+        """
+        (grading, representative submission id). fn() grades (or copies) and
+        returns the same pair. With reuse=False a remembered grading is
+        ignored (a grading already in flight is still shared). Only gradings
+        for which cacheable(grading) is true are remembered (default: strings).
+        """
+        hit = None
+        if reuse:
+            with self._lock:
+                hit = self._gradings.get(key)
+                if hit is not None:
+                    self._gradings.move_to_end(key)
+        if hit is None:
+            cacheable = cacheable or (lambda grading: isinstance(grading, str))
+            hit = self._flights.do(key, self._grade, key, fn, cacheable)
+        with self._lock:
+            self._stats["copied" if str(hit[1]) != str(submission_id) else "graded"] += 1
+        return hit
+
+    def _grade(self, key, fn, cacheable):
+        grading, representative = fn()
+        if cacheable(grading):
+            with self._lock:
+                self._gradings[key] = (grading, representative)
+                while len(self._gradings) > self.max_entries:
+                    self._gradings.popitem(last=False)
+        return grading, representative
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["remembered"] = len(self._gradings)
+        stats["flights"] = self._flights.stats()
+        return stats
+
+
+def fetch_representative_grading(representative_id: Any, rubric_hashes: Dict[str, str],
+                                 SUPABASE_URL: str, SUPABASE_KEY: str) -> Optional[str]:
+    """
+    The representative's latest graded result as grading JSON, if graded
+    against the same rubric. None (grade instead) if it can't be fetched.
+    """
+    try:
+        resp = http_session().get(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1/results",
+            params={
+                "select": "result_json,overall_feedback,rubric_hashes",
+                "submission_id": f"eq.{representative_id}",
+                "processing_status": "eq.graded",
+                "order": "created_at.desc",
+                "limit": "1",
+            },
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}",
+                     "Accept": "application/json"},
+            timeout=30
+        )
+    except Exception as e:
+        print(f"⚠️ Could not fetch the result of representative submission {representative_id}: {e}")
+        return None
+    if resp.status_code != 200:
+        return None
+    rows = resp.json()
+    if not rows or rows[0].get("rubric_hashes") != rubric_hashes or rows[0].get("result_json") is None:
+        return None
+    return json.dumps({"results": rows[0]["result_json"], "overall_feedback": rows[0].get("overall_feedback") or ""})
+
+
+duplicate_gradings = DuplicateGradings()
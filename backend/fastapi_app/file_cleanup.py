@@ -0,0 +1,179 @@
+"""
+Deferred deletion of uploaded Gemini files.
+
+Transcription used to delete its uploaded PDF inside the request, adding a
+round trip to every call. Now delete_later() queues the file name and a
+background thread deletes queued files in batches (up to CLEANUP_BATCH_SIZE
+in parallel, at least every CLEANUP_INTERVAL_S). Files still queued at exit
+are flushed.
+
+Every upload gets a display name starting with FILE_DISPLAY_PREFIX. Files a
+crashed process never deleted would otherwise use quota until Gemini's 48h
+expiry, so when sweeping is enabled (the API and workers enable it) the
+thread also lists files every FILE_SWEEP_INTERVAL_S and deletes those with
+the prefix that are older than FILE_ORPHAN_AGE_S. That age must stay above the
+longest transcription, so files other processes are still using are not swept.
+"""
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .registry import configure_auth
+
+
+FILE_DISPLAY_PREFIX = os.environ.get("FILE_DISPLAY_PREFIX", "gradient-")
+CLEANUP_BATCH_SIZE = int(os.environ.get("CLEANUP_BATCH_SIZE", "16"))
+CLEANUP_INTERVAL_S = float(os.environ.get("CLEANUP_INTERVAL_S", "2"))
+CLEANUP_MAX_ATTEMPTS = 3
+FILE_SWEEP_INTERVAL_S = float(os.environ.get("FILE_SWEEP_INTERVAL_S", "1800"))
+FILE_ORPHAN_AGE_S = float(os.environ.get("FILE_ORPHAN_AGE_S", "3600"))
+
+
+def upload_display_name(pdf_path: str) -> str:
+    return f"{FILE_DISPLAY_PREFIX}{os.path.basename(pdf_path)}"
+
+
+class FileCleaner:
+
+    def __init__(self, batch_size: int = CLEANUP_BATCH_SIZE, interval_s: float = CLEANUP_INTERVAL_S):
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self._cond = threading.Condition()
+        self._pending: Deque[Tuple[str, int]] = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._sweep = False
+        self._next_sweep = 0.0
+        self._atexit_registered = False
+        self._stats = {"queued": 0, "deleted": 0, "failed": 0, "retried": 0, "batches": 0,
+                       "swept": 0, "sweeps": 0, "last_sweep": None}
+
+    def start(self, sweep: bool = False):
+        """Start the cleanup thread (idempotent); with sweep=True also sweep orphans, starting now."""
+        with self._cond:
+            if sweep and not self._sweep:
+                self._sweep = True
+                self._next_sweep = 0.0
+                self._cond.notify()
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="gemini-file-cleanup", daemon=True)
+                self._thread.start()
+                if not self._atexit_registered:
+                    self._atexit_registered = True
+                    atexit.register(self.stop)
+
+    def delete_later(self, name: str):
+        with self._cond:
+            self._pending.append((name, 0))
+            self._stats["queued"] += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        self.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Delete whatever is still queued, then stop the thread."""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size
+                    or (self._sweep and time.time() >= self._next_sweep),
+                    timeout=self.interval_s,
+                )
+                stopping = self._stopping
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                sweep_due = self._sweep and not stopping and time.time() >= self._next_sweep
+            if batch:
+                self._delete_batch(batch)
+            if sweep_due:
+                self.sweep()
+            if stopping:
+                with self._cond:
+                    if not self._pending:
+                        return
+
+    def _delete_batch(self, batch):
+        import google.generativeai as genai
+
+        def delete(item):
+            name, attempts = item
+            try:
+                genai.delete_file(name=name)
+                return None
+            except Exception as e:
+                # Already gone (e.g. swept or expired) counts as deleted.
+                if "404" in str(e) or "not found" in str(e).lower():
+                    return None
+                return name, attempts + 1, e
+
+        with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+            outcomes = list(pool.map(delete, batch))
+        with self._cond:
+            self._stats["batches"] += 1
+            for outcome in outcomes:
+                if outcome is None:
+                    self._stats["deleted"] += 1
+                elif outcome[1] < CLEANUP_MAX_ATTEMPTS and not self._stopping:
+                    self._stats["retried"] += 1
+                    self._pending.append(outcome[:2])
+                else:
+                    # Left for the orphan sweep (or Gemini's 48h expiry).
+                    self._stats["failed"] += 1
+                    print(f"⚠️ Could not delete uploaded file {outcome[0]}: {outcome[2]}")
+
+    def sweep(self, max_age_s: float = FILE_ORPHAN_AGE_S) -> int:
+        """Delete this service's uploads (by display-name prefix) older than max_age_s. Returns the count."""
+        import google.generativeai as genai
+
+        with self._cond:
+            self._next_sweep = time.time() + FILE_SWEEP_INTERVAL_S
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_s)
+        swept = 0
+        try:
+            # The first sweep can run while the API is still configuring clients in the background.
+            configure_auth()
+            for f in genai.list_files():
+                created = getattr(f, "create_time", None)
+                if not (getattr(f, "display_name", "") or "").startswith(FILE_DISPLAY_PREFIX):
+                    continue
+                if created is None or created > cutoff:
+                    continue
+                try:
+                    genai.delete_file(name=f.name)
+                    swept += 1
+                except Exception as e:
+                    print(f"⚠️ Could not sweep orphaned file {f.name}: {e}")
+        except Exception as e:
+            print(f"⚠️ Orphaned file sweep failed: {e}")
+        with self._cond:
+            self._stats["swept"] += swept
+            self._stats["sweeps"] += 1
+            self._stats["last_sweep"] = time.time()
+        if swept:
+            print(f"🧹 Swept {swept} orphaned uploads")
+        return swept
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["sweeping"] = self._sweep
+        return stats
+
+
+file_cleaner = FileCleaner()
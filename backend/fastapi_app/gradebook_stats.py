@@ -0,0 +1,426 @@
+"""
+Class statistics per assignment, maintained as results are written.
+
+Building a dashboard used to mean pulling every `results` row and walking its
+result_json. Now upload_results and regrade call gradebook.record() for every
+row they write. That keeps each submission's latest per-question scores in a
+local SQLite file (GRADEBOOK_STATS_PATH) and, in the same transaction, updates
+the assignment's aggregates: submissions per status, and how many submissions
+got each distinct score, per question and overall. A rewritten submission
+first takes its old scores back out of the aggregates.
+
+The summary holds:
+- per question: count, mean, median, std, min, max and a score distribution;
+- overall: the same figures for overall_score plus a GRADEBOOK_HISTOGRAM_BINS
+  histogram.
+
+It is computed with numpy from the aggregates, whose size depends on the
+number of distinct scores rather than on class size, and cached until the next
+write, so GET /gradebook/{assignment_id}/stats does not scale with class size.
+numpy is imported on the first summary, keeping it out of API startup.
+
+Results written by processes that share no file with the API (or before this
+existed) are picked up with ?refresh=true, which rebuilds the assignment from
+Supabase.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .grading_memo import normalize_label
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+GRADEBOOK_STATS_PATH = os.environ.get("GRADEBOOK_STATS_PATH", "gradebook.db")
+GRADEBOOK_HISTOGRAM_BINS = int(os.environ.get("GRADEBOOK_HISTOGRAM_BINS", "10"))
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _weighted_order_stats(group: "np.ndarray", values: "np.ndarray", weights: "np.ndarray",
+                          counts: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Per-group (min, median, max) of values that occur `weights` times each.
+    Sorted by (group, value), each group is one contiguous run, so the k-th
+    smallest score of a group is found by a search over the cumulative weights.
+    """
+    import numpy as np
+
+    order = np.lexsort((values, group))
+    sorted_values = values[order]
+    cumulative = np.cumsum(weights[order])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    def kth(k):
+        return sorted_values[np.searchsorted(cumulative, starts + k, side="right")]
+
+    medians = (kth((counts - 1) // 2) + kth(counts // 2)) / 2
+    return kth(np.zeros_like(counts)), medians, kth(counts - 1)
+
+
+def _describe(values: "np.ndarray", weights: "np.ndarray") -> Dict[str, Any]:
+    import numpy as np
+
+    total = int(weights.sum()) if weights.size else 0
+    if not total:
+        return {"count": 0, "mean": None, "median": None, "std": None, "min": None, "max": None}
+    mean = float((values * weights).sum() / total)
+    variance = max(float((values * values * weights).sum() / total) - mean * mean, 0.0)
+    counts = np.array([total])
+    mins, medians, maxes = _weighted_order_stats(np.zeros(values.size, dtype=int), values, weights, counts)
+    return {
+        "count": total,
+        "mean": round(mean, 4),
+        "median": float(medians[0]),
+        "std": round(variance ** 0.5, 4),
+        "min": float(mins[0]),
+        "max": float(maxes[0]),
+    }
+
+
+def _histogram(overall: "np.ndarray", weights: "np.ndarray", bins: int) -> Dict[str, List[Any]]:
+    import numpy as np
+
+    if not overall.size:
+        return {"bins": [], "counts": []}
+    low = min(0.0, float(overall.min()))
+    counts, edges = np.histogram(overall, bins=bins, range=(low, max(float(overall.max()), low + 1.0)),
+                                 weights=weights)
+    return {"bins": [round(float(edge), 4) for edge in edges], "counts": [int(n) for n in counts]}
+
+
+def compute_summary(questions: List[str], question_idx: "np.ndarray", scores: "np.ndarray",
+                    score_counts: "np.ndarray", overall: "np.ndarray", overall_counts: "np.ndarray",
+                    bins: int = GRADEBOOK_HISTOGRAM_BINS) -> Dict[str, Any]:
+    """
+    Vectorized summary from score distributions: `scores[i]` was given
+    `score_counts[i]` times for question `question_idx[i]` (each (question,
+    score) pair once, every question present), and `overall[j]` was the
+    overall score of `overall_counts[j]` submissions.
+    """
+    import numpy as np
+
+    per_question = []
+    if questions:
+        counts = np.bincount(question_idx, weights=score_counts, minlength=len(questions)).astype(int)
+        sums = np.bincount(question_idx, weights=scores * score_counts, minlength=len(questions))
+        squares = np.bincount(question_idx, weights=scores * scores * score_counts, minlength=len(questions))
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - means * means, 0.0))
+        mins, medians, maxes = _weighted_order_stats(question_idx, scores, score_counts, counts)
+
+        distributions: List[Dict[str, int]] = [{} for _ in questions]
+        for q, score, n in zip(question_idx, scores, score_counts):
+            distributions[int(q)][f"{score:g}"] = int(n)
+
+        for i, label in enumerate(questions):
+            per_question.append({
+                "question": label,
+                "count": int(counts[i]),
+                "mean": round(float(means[i]), 4),
+                "median": float(medians[i]),
+                "std": round(float(stds[i]), 4),
+                "min": float(mins[i]),
+                "max": float(maxes[i]),
+                "distribution": distributions[i],
+            })
+
+    return {
+        "questions": per_question,
+        "overall": {**_describe(overall, overall_counts), "histogram": _histogram(overall, overall_counts, bins)},
+    }
+
+
+class GradebookStats:
+
+    def __init__(self, path: str = GRADEBOOK_STATS_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS gradebook_results (
+                assignment_id TEXT NOT NULL,
+                submission_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                overall_score REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (assignment_id, submission_id)
+            );
+            CREATE TABLE IF NOT EXISTS gradebook_scores (
+                assignment_id TEXT NOT NULL,
+                submission_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (assignment_id, submission_id, question)
+            );
+            CREATE TABLE IF NOT EXISTS gradebook_status_counts (
+                assignment_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (assignment_id, status)
+            );
+            CREATE TABLE IF NOT EXISTS gradebook_question_scores (
+                assignment_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                score REAL NOT NULL,
+                n INTEGER NOT NULL,
+                position_total INTEGER NOT NULL,
+                PRIMARY KEY (assignment_id, question, score)
+            );
+            CREATE TABLE IF NOT EXISTS gradebook_overall_scores (
+                assignment_id TEXT NOT NULL,
+                score REAL NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (assignment_id, score)
+            );
+            CREATE TABLE IF NOT EXISTS gradebook_summaries (
+                assignment_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0,
+                summary_version INTEGER,
+                summary TEXT,
+                computed_at REAL
+            );
+            """
+        )
+        self._backfill(conn)
+
+    def _backfill(self, conn: sqlite3.Connection):
+        """Build aggregates for assignments recorded before they were kept (older gradebook files)."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT assignment_id, submission_id FROM gradebook_results WHERE assignment_id NOT IN "
+                "(SELECT assignment_id FROM gradebook_status_counts)"
+            ).fetchall()
+            for row in rows:
+                self._apply(conn, row["assignment_id"], row["submission_id"], 1)
+            for assignment_id in {row["assignment_id"] for row in rows}:
+                self._bump(conn, assignment_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _apply(self, conn: sqlite3.Connection, assignment_id: str, submission_id: str, sign: int):
+        """Add (sign=1) or take back (sign=-1) a submission's stored row and scores in the aggregates."""
+        row = conn.execute(
+            "SELECT status, overall_score FROM gradebook_results WHERE assignment_id = ? AND submission_id = ?",
+            (assignment_id, submission_id),
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute(
+            "INSERT INTO gradebook_status_counts (assignment_id, status, n) VALUES (?, ?, ?) "
+            "ON CONFLICT(assignment_id, status) DO UPDATE SET n = n + excluded.n",
+            (assignment_id, row["status"], sign),
+        )
+        if row["status"] == "graded" and row["overall_score"] is not None:
+            conn.execute(
+                "INSERT INTO gradebook_overall_scores (assignment_id, score, n) VALUES (?, ?, ?) "
+                "ON CONFLICT(assignment_id, score) DO UPDATE SET n = n + excluded.n",
+                (assignment_id, row["overall_score"], sign),
+            )
+        conn.execute(
+            "INSERT INTO gradebook_question_scores (assignment_id, question, score, n, position_total) "
+            "SELECT assignment_id, question, score, ?, ? * position FROM gradebook_scores "
+            "WHERE assignment_id = ? AND submission_id = ? "
+            "ON CONFLICT(assignment_id, question, score) DO UPDATE "
+            "SET n = n + excluded.n, position_total = position_total + excluded.position_total",
+            (sign, sign, assignment_id, submission_id),
+        )
+        if sign < 0:
+            for table in ("gradebook_status_counts", "gradebook_overall_scores", "gradebook_question_scores"):
+                conn.execute(f"DELETE FROM {table} WHERE assignment_id = ? AND n <= 0", (assignment_id,))
+
+    def _write(self, conn: sqlite3.Connection, assignment_id: str, submission_id: str, status: str,
+               result_json: Optional[List[Dict[str, Any]]], overall_score: Any):
+        if status != "graded":
+            # A failed attempt doesn't hide an earlier graded result.
+            row = conn.execute(
+                "SELECT status FROM gradebook_results WHERE assignment_id = ? AND submission_id = ?",
+                (assignment_id, submission_id),
+            ).fetchone()
+            if row is not None and row["status"] == "graded":
+                return
+        self._apply(conn, assignment_id, submission_id, -1)
+        conn.execute(
+            "INSERT OR REPLACE INTO gradebook_results "
+            "(assignment_id, submission_id, status, overall_score, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (assignment_id, submission_id, status, _number(overall_score) if status == "graded" else None,
+             time.time()),
+        )
+        conn.execute("DELETE FROM gradebook_scores WHERE assignment_id = ? AND submission_id = ?",
+                     (assignment_id, submission_id))
+        if status == "graded":
+            scores = {}
+            for position, item in enumerate(result_json or []):
+                if not isinstance(item, dict) or _number(item.get("score")) is None:
+                    continue
+                label = normalize_label(item.get("question")) or str(item.get("question"))
+                scores[label] = (assignment_id, submission_id, position, label, _number(item.get("score")))
+            conn.executemany(
+                "INSERT INTO gradebook_scores (assignment_id, submission_id, position, question, score) "
+                "VALUES (?, ?, ?, ?, ?)",
+                list(scores.values()),
+            )
+        self._apply(conn, assignment_id, submission_id, 1)
+
+    def _bump(self, conn: sqlite3.Connection, assignment_id: str):
+        conn.execute(
+            "INSERT INTO gradebook_summaries (assignment_id, version) VALUES (?, 1) "
+            "ON CONFLICT(assignment_id) DO UPDATE SET version = version + 1",
+            (assignment_id,),
+        )
+
+    def record(self, assignment_id: Any, submission_id: Any, status: str,
+               result_json: Optional[List[Dict[str, Any]]] = None, overall_score: Any = None):
+        """Replace a submission's scores with the result just written and mark the summary stale."""
+        if assignment_id is None or submission_id is None:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write(conn, str(assignment_id), str(submission_id), status, result_json, overall_score)
+            self._bump(conn, str(assignment_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rebuild(self, assignment_id: Any, rows: List[Dict[str, Any]]):
+        """Replace everything known about an assignment with `rows` (latest result row per submission)."""
+        assignment_id = str(assignment_id)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM gradebook_results WHERE assignment_id = ?", (assignment_id,))
+            for table in ("gradebook_scores", "gradebook_status_counts", "gradebook_overall_scores",
+                          "gradebook_question_scores"):
+                conn.execute(f"DELETE FROM {table} WHERE assignment_id = ?", (assignment_id,))
+            for row in rows:
+                if row.get("submission_id") is None:
+                    continue
+                self._write(conn, assignment_id, str(row["submission_id"]), row.get("processing_status", "graded"),
+                            row.get("result_json"), row.get("overall_score"))
+            self._bump(conn, assignment_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _compute(self, conn: sqlite3.Connection, assignment_id: str) -> Dict[str, Any]:
+        import numpy as np
+
+        statuses = {row["status"]: row["n"] for row in conn.execute(
+            "SELECT status, n FROM gradebook_status_counts WHERE assignment_id = ?", (assignment_id,),
+        )}
+        overall_rows = conn.execute(
+            "SELECT score, n FROM gradebook_overall_scores WHERE assignment_id = ? ORDER BY score", (assignment_id,)
+        ).fetchall()
+        overall = np.array([row[0] for row in overall_rows], dtype=float)
+        overall_counts = np.array([row[1] for row in overall_rows], dtype=float)
+        # Questions in rubric order: by their mean position in result_json.
+        question_rows = conn.execute(
+            "SELECT question, SUM(position_total) * 1.0 / SUM(n) AS rank FROM gradebook_question_scores "
+            "WHERE assignment_id = ? GROUP BY question ORDER BY rank, question", (assignment_id,)
+        ).fetchall()
+        questions = [row["question"] for row in question_rows]
+        index = {label: i for i, label in enumerate(questions)}
+        score_rows = conn.execute(
+            "SELECT question, score, n FROM gradebook_question_scores WHERE assignment_id = ?", (assignment_id,)
+        ).fetchall()
+        question_idx = np.array([index[row[0]] for row in score_rows], dtype=int)
+        scores = np.array([row[1] for row in score_rows], dtype=float)
+        score_counts = np.array([row[2] for row in score_rows], dtype=float)
+        return {
+            "assignment_id": assignment_id,
+            "submissions": sum(statuses.values()),
+            "graded": statuses.get("graded", 0),
+            "failed": sum(n for status, n in statuses.items() if status != "graded"),
+            **compute_summary(questions, question_idx, scores, score_counts, overall, overall_counts),
+        }
+
+    def summary(self, assignment_id: Any) -> Dict[str, Any]:
+        """The cached summary, recomputed first if results were written since it was built."""
+        assignment_id = str(assignment_id)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT version, summary_version, summary, computed_at FROM gradebook_summaries WHERE assignment_id = ?",
+            (assignment_id,),
+        ).fetchone()
+        if row is not None and row["summary_version"] == row["version"]:
+            return {**json.loads(row["summary"]), "computed_at": row["computed_at"], "cached": True}
+
+        # Read the version and the scores in one snapshot so the cached summary matches its version.
+        conn.execute("BEGIN")
+        try:
+            version_row = conn.execute(
+                "SELECT version FROM gradebook_summaries WHERE assignment_id = ?", (assignment_id,)
+            ).fetchone()
+            summary = self._compute(conn, assignment_id)
+        finally:
+            conn.execute("COMMIT")
+        computed_at = time.time()
+        if version_row is not None:
+            conn.execute(
+                "UPDATE gradebook_summaries SET summary = ?, summary_version = ?, computed_at = ? "
+                "WHERE assignment_id = ? AND version = ?",
+                (json.dumps(summary), version_row["version"], computed_at, assignment_id, version_row["version"]),
+            )
+        return {**summary, "computed_at": computed_at, "cached": False}
+
+
+_gradebook: Optional[GradebookStats] = None
+_gradebook_lock = threading.Lock()
+
+
+def get_gradebook() -> GradebookStats:
+    """Process-wide gradebook statistics at GRADEBOOK_STATS_PATH."""
+    global _gradebook
+    if _gradebook is None:
+        with _gradebook_lock:
+            if _gradebook is None:
+                _gradebook = GradebookStats()
+    return _gradebook
+
+
+def record_result(assignment_id: Any, submission_id: Any, status: str,
+                  result_json: Optional[List[Dict[str, Any]]] = None, overall_score: Any = None):
+    """get_gradebook().record(), but never lets a statistics failure fail the write it follows."""
+    try:
+        get_gradebook().record(assignment_id, submission_id, status, result_json, overall_score)
+    except Exception as e:
+        print(f"⚠️ Could not update gradebook statistics for {assignment_id}: {e}")
+
+
+def refresh_from_results(assignment_id: str) -> Dict[str, Any]:
+    """Rebuild an assignment's statistics from its latest Supabase results, then summarize."""
+    from .ai_utils import get_supabase_credentials
+    from .regrade import fetch_latest_results
+
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    gradebook = get_gradebook()
+    gradebook.rebuild(assignment_id, fetch_latest_results(assignment_id, SUPABASE_URL, SUPABASE_KEY,
+                                                          graded_only=False))
+    return gradebook.summary(assignment_id)
@@ -0,0 +1,188 @@
+"""
+Answer-level grading memo.
+
+Many students give effectively the same short answer (a number, a letter, a
+one-line formula). Once one of them is graded, the score and reason are reused
+for every later submission of the same assignment whose normalized answer to
+that question matches, without another model call.
+
+Entries are keyed on (assignment, question, hash of that question's rubric
+entry, normalized answer), so editing a rubric line automatically stops its old
+grades from being reused.
+"""
+import os
+import re
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# Only answers at most this long (after normalization) are memoized; longer
+# free-text answers are rarely identical and always go to the model.
+MEMO_MAX_ANSWER_CHARS = int(os.environ.get("MEMO_MAX_ANSWER_CHARS", "200"))
+
+# Question labels at the start of a line, after an optional "Question:"/"Answer:"
+# prefix: "1.a)", "1a.", "2] a)", "Q1 (a):", "3)". A bare "b)" continues the
+# previous question number.
+_LINE_PREFIX_RE = re.compile(r"^\s*(?:[*#]+\s*)?(?:(?:question|answer)\s*:?\s*)?", re.IGNORECASE)
+_NUMBERED_LABEL_RE = re.compile(
+    r"(?:q\s*)?(\d{1,2})\s*(?:[.\-\]]?\s*\(?([a-z])[).:\]]|[.):\]])", re.IGNORECASE
+)
+_PART_LABEL_RE = re.compile(r"\(?([a-z])\)", re.IGNORECASE)
+_ANSWER_PREFIX_RE = re.compile(r"^\s*answer\s*:\s*", re.IGNORECASE | re.MULTILINE)
+_LATEX_SPACING_RE = re.compile(r"\\[,;:! ]|\\(?:left|right)\b|\\(?:quad|qquad)\b")
+_SPACE_AROUND_SYMBOL_RE = re.compile(r"\s*([^\w\s])\s*")
+
+
+def canonical_label(number: str, part: Optional[str]) -> str:
+    return f"{int(number)}.{part.lower()}" if part else str(int(number))
+
+
+def normalize_label(question: str) -> Optional[str]:
+    """Canonical label for a model-reported question id such as "1.a", "1a" or "Q1(a)"."""
+    match = re.match(r"\s*(?:q(?:uestion)?\s*)?(\d{1,2})\s*[.\-\]]?\s*\(?([a-z])?", str(question or ""), re.IGNORECASE)
+    return canonical_label(match.group(1), match.group(2)) if match else None
+
+
+def split_by_question(text: str, labels: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Split a transcript or rubric into {question label: text}. Text before the
+    first label is dropped; a label that appears twice keeps both chunks.
+
+    With `labels` (the rubric's labels, in order), only those labels start a
+    section, and only when they come after the current one. A numbered list
+    inside an answer ("1. subtract mean", "2. divide by std") stays part of
+    that answer: once a number is rejected, the following numbers with the
+    same punctuation are list steps too, unless written as "Answer 2:".
+    """
+    rank = {label: i for i, label in enumerate(labels)} if labels is not None else None
+    sections: Dict[str, List[str]] = {}
+    current, number = None, None
+    steps: Optional[Tuple[int, str]] = None
+    for line in (text or "").splitlines():
+        prefix = _LINE_PREFIX_RE.match(line)
+        rest = line[prefix.end():]
+        label, part_number = None, number
+        match = numbered = _NUMBERED_LABEL_RE.match(rest)
+        if match:
+            part_number = match.group(1)
+            label = canonical_label(part_number, match.group(2))
+        elif number is not None:
+            match = _PART_LABEL_RE.match(rest)
+            if match:
+                label = canonical_label(number, match.group(1))
+        if label is not None and rank is not None:
+            delimiter = rest[match.end() - 1]
+            explicit = any(ch.isalpha() for ch in prefix.group(0))
+            in_steps = bool(numbered) and not explicit and (int(part_number), delimiter) == steps
+            if in_steps or rank.get(label, -1) <= rank.get(current, -1):
+                if numbered:
+                    steps = (int(part_number) + 1, delimiter)
+                label, match = None, None
+        if label is not None:
+            current, number, steps = label, part_number, None
+            rest = rest[match.end():]
+        if current is not None:
+            sections.setdefault(current, []).append(rest.strip() if match else line.strip())
+    return {label: "\n".join(lines).strip() for label, lines in sections.items()}
+
+
+def _normalize_text(text: str) -> str:
+    text = _LATEX_SPACING_RE.sub(" ", text)
+    text = text.replace("$", " ").casefold()
+    text = " ".join(text.split())
+    text = _SPACE_AROUND_SYMBOL_RE.sub(r"\1", text)
+    return text.strip(" .;")
+
+
+def normalize_answer(answer: str) -> str:
+    """Case, whitespace and LaTeX-spacing insensitive form of an answer."""
+    return _normalize_text(_ANSWER_PREFIX_RE.sub("", answer or ""))
+
+
+def normalize_rubric_entry(entry: str) -> str:
+    """
+    Case, whitespace and LaTeX-spacing insensitive form of a rubric entry, so a
+    re-transcribed rubric that only differs in formatting keeps its hashes.
+    """
+    return _normalize_text(entry or "")
+
+
+def rubric_entry_hash(rubric_sections: Dict[str, str], label: str, rubric_text: str) -> str:
+    """Hash of one question's normalized rubric entry, or of the whole rubric if it can't be split."""
+    entry = normalize_rubric_entry(rubric_sections.get(label, rubric_text or ""))
+    return hashlib.sha256(entry.encode("utf-8")).hexdigest()[:16]
+
+
+def rubric_fingerprint(rubric_text: str) -> Dict[str, str]:
+    """Per-question rubric entry hashes ({"*": hash} if the rubric can't be split), stored with each result."""
+    sections = split_by_question(rubric_text)
+    if not sections:
+        return {"*": rubric_entry_hash({}, "", rubric_text)}
+    return {label: rubric_entry_hash(sections, label, rubric_text) for label in sections}
+
+
+class AnswerMemo:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[Tuple[str, str, str], Dict[str, Any]]] = {}
+        self._rubric_hash: Dict[str, str] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def sync_rubric(self, assignment_id: str, rubric_text: str):
+        """Drop every entry for an assignment whose rubric entry no longer exists."""
+        digest = hashlib.sha256((rubric_text or "").encode("utf-8")).hexdigest()
+        with self._lock:
+            if self._rubric_hash.get(assignment_id) == digest:
+                return
+            self._rubric_hash[assignment_id] = digest
+            sections = split_by_question(rubric_text)
+            live = {rubric_entry_hash(sections, label, rubric_text) for label in sections} or {
+                rubric_entry_hash({}, "", rubric_text)
+            }
+            entries = self._entries.get(assignment_id, {})
+            for key in [k for k in entries if k[1] not in live]:
+                del entries[key]
+
+    def lookup(self, assignment_id: str, label: str, rubric_hash: str, normalized: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._stats.setdefault(assignment_id, {"hits": 0, "misses": 0, "stored": 0})
+            hit = self._entries.get(assignment_id, {}).get((label, rubric_hash, normalized))
+            stats["hits" if hit else "misses"] += 1
+            return dict(hit) if hit else None
+
+    def store(self, assignment_id: str, label: str, rubric_hash: str, normalized: str, result: Dict[str, Any]):
+        if not normalized or len(normalized) > MEMO_MAX_ANSWER_CHARS:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(assignment_id, {})
+            if (label, rubric_hash, normalized) not in entries:
+                entries[(label, rubric_hash, normalized)] = {
+                    k: result.get(k) for k in ("question", "score", "reason", "improvement")
+                }
+                self._stats.setdefault(assignment_id, {"hits": 0, "misses": 0, "stored": 0})["stored"] += 1
+
+    def stats(self, assignment_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            ids = [assignment_id] if assignment_id else list(self._stats)
+            report = {}
+            for aid in ids:
+                s = dict(self._stats.get(aid, {"hits": 0, "misses": 0, "stored": 0}))
+                looked_up = s["hits"] + s["misses"]
+                s["hit_rate"] = round(s["hits"] / looked_up, 4) if looked_up else 0.0
+                s["entries"] = len(self._entries.get(aid, {}))
+                report[aid] = s
+            return report
+
+    def clear(self, assignment_id: Optional[str] = None):
+        with self._lock:
+            if assignment_id is None:
+                self._entries.clear()
+                self._rubric_hash.clear()
+            else:
+                self._entries.pop(assignment_id, None)
+                self._rubric_hash.pop(assignment_id, None)
+
+
+answer_memo = AnswerMemo()
@@ -0,0 +1,134 @@
+"""
+Hedged model requests.
+
+With HEDGE_REQUESTS=1, a generate_content call that is still running after the
+HEDGE_PERCENTILE latency of recent calls of the same kind and model gets a
+duplicate request. Whichever finishes successfully first is returned.
+
+Hedges are capped at HEDGE_MAX_RATE of all calls so a slow period can't double
+quota use. The sync SDK can't abort an in-flight request, so the losing call
+is abandoned: its result is discarded when it finishes, but its tokens are
+still recorded in usage accounting.
+"""
+import os
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .usage import timed_generate
+
+
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_RATE = float(os.environ.get("HEDGE_MAX_RATE", "0.05"))
+# Don't hedge until this many latencies are known, and never sooner than this.
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_S = float(os.environ.get("HEDGE_MIN_DELAY_S", "5"))
+HEDGE_POOL_SIZE = int(os.environ.get("HEDGE_POOL_SIZE", "64"))
+
+
+class HedgeController:
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, max_rate: float = HEDGE_MAX_RATE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, min_delay_s: float = HEDGE_MIN_DELAY_S):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self._lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "suppressed_by_cap": 0}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="hedge")
+            return self._pool
+
+    def observe(self, key: Tuple[str, str], latency_s: float):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=200)).append(latency_s)
+
+    def deadline(self, key: Tuple[str, str]) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history."""
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay_s, samples[index])
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self._stats["hedged"] + 1 > self._stats["calls"] * self.max_rate:
+                self._stats["suppressed_by_cap"] += 1
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def _observed(self, key: Tuple[str, str], fn: Callable[[Callable[[float], None]], Any]) -> Any:
+        return fn(lambda latency_s: self.observe(key, latency_s))
+
+    def call(self, kind: str, model_name: str, fn: Callable[[Callable[[float], None]], Any]) -> Any:
+        """
+        Run fn(on_latency), hedged past the deadline. fn reports the model's
+        own latency through on_latency, so waits before the request (budget
+        throttling) don't inflate the deadline.
+        """
+        key = (kind, model_name)
+        with self._lock:
+            self._stats["calls"] += 1
+        deadline = self.deadline(key)
+        if deadline is None:
+            return self._observed(key, fn)
+
+        pool = self._executor()
+        primary = pool.submit(contextvars.copy_context().run, self._observed, key, fn)
+        done, _ = wait([primary], timeout=deadline)
+        if done or not self._may_hedge():
+            return primary.result()
+
+        print(f"🪁 Hedging {kind} on {model_name} after {deadline:.1f}s")
+        hedge = pool.submit(contextvars.copy_context().run, self._observed, key, fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._stats["hedge_won"] += 1
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            deadlines = {f"{kind}:{model}": None for kind, model in self._latencies}
+        for name in deadlines:
+            kind, model = name.split(":", 1)
+            deadlines[name] = self.deadline((kind, model))
+        stats["hedge_rate"] = round(stats["hedged"] / stats["calls"], 4) if stats["calls"] else 0.0
+        stats["enabled"] = HEDGE_REQUESTS
+        stats["deadlines_s"] = deadlines
+        return stats
+
+
+hedge_controller = HedgeController()
+
+
+def hedged_generate(model, kind: str, model_name: str, *args, **kwargs):
+    """timed_generate, hedged after a percentile deadline when HEDGE_REQUESTS=1."""
+    if not HEDGE_REQUESTS:
+        return timed_generate(model, kind, model_name, *args, **kwargs)
+    return hedge_controller.call(
+        kind, model_name,
+        lambda on_latency: timed_generate(model, kind, model_name, *args, on_latency=on_latency, **kwargs),
+    )
@@ -0,0 +1,362 @@
+"""
+HTTP load test for the API.
+
+Drives /transcribe/answer and/or /generate_score at a fixed concurrency with
+synthetic PDFs (HW-05.pdf with a unique trailer per request, so the result
+store and single-flight don't short-circuit the pipeline) and reports
+throughput, latency percentiles, error rate and server memory.
+
+The app is wired to fake backends: a fake Gemini model that sleeps for
+--model-latency seconds and returns a plausible transcript or grading JSON,
+fake file upload/delete, and a throwaway result store. No API key or network
+is needed, so numbers reflect the server's own overhead and concurrency limits.
+
+    python -m backend.fastapi_app.loadtest --endpoint answer --concurrency 32 --requests 500 --output load.json
+    python -m backend.fastapi_app.loadtest --endpoint score --baseline load.json
+
+By default the app runs in this process over an ASGI transport, so memory
+includes the load generator. For clean numbers, serve the fake-backed app
+separately (needs uvicorn) and point the generator at it:
+
+    python -m backend.fastapi_app.loadtest --serve --port 8765
+    python -m backend.fastapi_app.loadtest --url http://127.0.0.1:8765 --server-pid <pid>
+"""
+import os
+import sys
+import enum
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional
+
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "HW-05.pdf")
+ENDPOINTS = {"answer": "/transcribe/answer", "score": "/generate_score"}
+
+_FAKE_RUBRIC = (
+    "1.a) 0: Blank, 1: Correct answer but no explanation, 2: Correct answer with explanation\n"
+    "1.b) 0: Blank, 1: Partially correct, 3: Fully correct\n"
+    "2.a) 0: Blank, 2: Some progress, 4: Correct derivation\n"
+)
+_FAKE_ANSWERS = (
+    "Question: 1.a)\nAnswer: The derivative of $x^2$ is $2x$ by the power rule.\n"
+    "Question: 1.b)\nAnswer: The limit is $1$ since $\\frac{\\sin x}{x} \\to 1$.\n"
+    "Question: 2.a)\nAnswer: Integrating by parts gives $x e^x - e^x + C$.\n"
+)
+
+
+# ------------------------------
+# Fake backends
+# ------------------------------
+class _FinishReason(enum.IntEnum):
+    STOP = 1
+
+
+def _fake_response(text: str, prompt_tokens: int, output_tokens: int):
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(finish_reason=_FinishReason.STOP, safety_ratings=[])],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            cached_content_token_count=0,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+    )
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel: sleeps like a model call, returns canned output."""
+
+    def __init__(self, model_name: str, system_prompt: Optional[str], latency_s: float):
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.latency_s = latency_s
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency_s)
+        if self.system_prompt is not None:
+            text = _FAKE_RUBRIC if "rubric" in self.system_prompt.lower() else _FAKE_ANSWERS
+            return _fake_response(text, 1500, len(text) // 4)
+        return _fake_response(self._grade(str(contents)), len(str(contents)) // 4, 200)
+
+    @staticmethod
+    def _grade(prompt: str) -> str:
+        from .grading_memo import split_by_question
+
+        answers = prompt.split("Student's Answers:", 1)[-1].split("---", 1)[0]
+        labels = list(split_by_question(answers)) or ["1.a"]
+        return json.dumps({
+            "results": [
+                {"question": label, "score": 1, "reason": "Load test.", "improvement": "None."}
+                for label in labels
+            ],
+            "overall_feedback": "Load test.",
+        })
+
+
+def install_fake_backends(model_latency_s: float = 1.0, upload_latency_s: float = 0.05,
+                          workdir: Optional[str] = None) -> str:
+    """
+    Point the app at fake model, file and storage backends. Must run before
+    the first request. Returns the working directory holding temp PDFs and the
+    result store.
+    """
+    import google.generativeai as genai
+    from . import ai_utils, registry, result_store
+
+    workdir = workdir or tempfile.mkdtemp(prefix="loadtest_")
+    os.chdir(workdir)
+
+    registry._auth_configured = True
+    ai_utils.get_model = lambda model_name="gemini-2.5-flash", system_prompt=None: \
+        FakeModel(model_name, system_prompt, model_latency_s)
+
+    def upload_file(path, display_name=None, **kwargs):
+        time.sleep(upload_latency_s)
+        return SimpleNamespace(name=f"files/{uuid.uuid4().hex}", display_name=display_name,
+                               state=SimpleNamespace(name="ACTIVE"))
+
+    genai.upload_file = upload_file
+    genai.get_file = lambda name: SimpleNamespace(name=name, state=SimpleNamespace(name="ACTIVE"))
+    genai.delete_file = lambda name: None
+    genai.list_files = lambda: iter(())
+
+    result_store._store = result_store.ResultStore(path=os.path.join(workdir, "results.db"))
+    return workdir
+
+
+# ------------------------------
+# Measurement
+# ------------------------------
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident memory of `pid` (default: this process) in MB, or None if unavailable."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 4)
+
+
+def synthetic_pdf(base: bytes, unique: bool) -> bytes:
+    """The base PDF, plus a trailing comment that makes its bytes (and content hash) unique."""
+    return base + f"\n% loadtest {uuid.uuid4().hex}\n".encode() if unique else base
+
+
+async def _sample_memory(pid: Optional[int], samples: List[float], stop: asyncio.Event, interval: float = 0.5):
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(client, endpoint: str, concurrency: int, total_requests: int, pdf_bytes: bytes,
+                   unique: bool = True, duration_s: Optional[float] = None,
+                   memory_pid: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Issue `total_requests` requests (or as many as fit in `duration_s`) from
+    `concurrency` concurrent clients and summarise the results.
+    """
+    names = list(ENDPOINTS) if endpoint == "mixed" else [endpoint]
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    statuses: Dict[str, int] = {}
+    errors: List[str] = []
+    issued = 0
+    memory: List[float] = []
+    stop_memory = asyncio.Event()
+    memory_task = asyncio.create_task(_sample_memory(memory_pid, memory, stop_memory))
+    start = time.perf_counter()
+
+    def next_request() -> Optional[str]:
+        nonlocal issued
+        if duration_s is not None:
+            if time.perf_counter() - start >= duration_s:
+                return None
+        elif issued >= total_requests:
+            return None
+        name = names[issued % len(names)]
+        issued += 1
+        return name
+
+    async def one(name: str):
+        if name == "answer":
+            files = {"file": ("HW-05.pdf", synthetic_pdf(pdf_bytes, unique), "application/pdf")}
+        else:
+            files = {
+                "rubric_file": ("rubric.pdf", synthetic_pdf(pdf_bytes, unique), "application/pdf"),
+                "answer_file": ("answer.pdf", synthetic_pdf(pdf_bytes, unique), "application/pdf"),
+            }
+        t0 = time.perf_counter()
+        try:
+            resp = await client.post(ENDPOINTS[name], files=files)
+            status = str(resp.status_code)
+            if resp.status_code >= 400:
+                errors.append(f"{name}: HTTP {resp.status_code} {resp.text[:200]}")
+        except Exception as e:
+            status = type(e).__name__
+            errors.append(f"{name}: {e}")
+        latencies[name].append(time.perf_counter() - t0)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def client_loop():
+        while True:
+            name = next_request()
+            if name is None:
+                return
+            await one(name)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop_memory.set()
+    await memory_task
+
+    every = sorted(v for values in latencies.values() for v in values)
+    completed = len(every)
+    failed = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": completed,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "error_rate": round(failed / completed, 4) if completed else 0.0,
+        "status_counts": statuses,
+        "latency_s": {
+            "p50": percentile(every, 50), "p90": percentile(every, 90),
+            "p95": percentile(every, 95), "p99": percentile(every, 99),
+            "max": round(every[-1], 4) if every else None,
+            "mean": round(sum(every) / completed, 4) if completed else None,
+        },
+        "latency_by_endpoint": {
+            name: {"p50": percentile(sorted(values), 50), "p95": percentile(sorted(values), 95)}
+            for name, values in latencies.items()
+        },
+        "server_rss_mb": {
+            "start": memory[0] if memory else None,
+            "peak": max(memory) if memory else None,
+            "end": memory[-1] if memory else None,
+        },
+        "sample_errors": errors[:5],
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Deltas against a saved report: positive rps is faster, positive latency/memory/error is worse."""
+    deltas = {}
+    for key in ("rps", "error_rate"):
+        if isinstance(current.get(key), (int, float)) and isinstance(baseline.get(key), (int, float)):
+            deltas[key] = round(current[key] - baseline[key], 4)
+    for group in ("latency_s", "server_rss_mb"):
+        for key, value in current.get(group, {}).items():
+            old = baseline.get(group, {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                deltas[f"{group}.{key}"] = round(value - old, 4)
+    return deltas
+
+
+# ------------------------------
+# Entry points
+# ------------------------------
+async def _run_in_process(args, pdf_bytes: bytes) -> Dict[str, Any]:
+    import httpx
+
+    install_fake_backends(args.model_latency)
+    from .main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            return await run_load(client, args.endpoint, args.concurrency, args.requests, pdf_bytes,
+                                  unique=not args.same_pdf, duration_s=args.duration)
+
+
+async def _run_against_url(args, pdf_bytes: bytes) -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        return await run_load(client, args.endpoint, args.concurrency, args.requests, pdf_bytes,
+                              unique=not args.same_pdf, duration_s=args.duration, memory_pid=args.server_pid)
+
+
+def serve(host: str, port: int, model_latency_s: float):
+    """Run the fake-backed app under uvicorn for an out-of-process load test."""
+    import uvicorn
+
+    install_fake_backends(model_latency_s)
+    from .main import app
+
+    print(f"🧪 Fake-backed API on http://{host}:{port} (pid {os.getpid()})")
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test the API against fake model and storage backends.")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS) + ["mixed"], default="answer")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Total requests (ignored with --duration).")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead.")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="Seconds per fake model call.")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF to upload (default: HW-05.pdf).")
+    parser.add_argument("--same-pdf", action="store_true",
+                        help="Send identical bytes every time (measures the cached path).")
+    parser.add_argument("--url", help="Target a running server instead of an in-process app.")
+    parser.add_argument("--server-pid", type=int, default=None, help="Sample this process's memory (with --url).")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--serve", action="store_true", help="Serve the fake-backed app instead of generating load.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the JSON report to this path.")
+    parser.add_argument("--baseline", help="Compare against a previously saved report.")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.host, args.port, args.model_latency)
+        return
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+    # Resolve output paths before the in-process run changes directory.
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    runner = _run_against_url if args.url else _run_in_process
+    report = asyncio.run(runner(args, pdf_bytes))
+    report["target"] = args.url or "in-process"
+    report["model_latency_s"] = args.model_latency
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            report["delta_vs_baseline"] = compare_reports(report, json.load(f))
+
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved load test report to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Event-loop lag monitor.
+
+A blocking call inside an `async def` handler (file I/O, a sync HTTP or model
+call, sqlite) stalls every other request on the loop. A ticker coroutine
+sleeps for LOOP_LAG_INTERVAL_S and records how late it wakes up, which is the
+loop lag; GET /debug/event_loop serves current, max and percentile lag.
+
+A watchdog thread notices when the ticker has been silent for longer than
+LOOP_LAG_THRESHOLD_S, while the loop is still blocked. It then looks at the
+loop thread's stack to name the route whose handler is running, and logs it
+together with the requests in flight. Set LOOP_LAG_STACKS=1 to also log and
+keep the stack sample. LOOP_LAG_MONITOR=0 turns the monitor off.
+"""
+import os
+import sys
+import time
+import asyncio
+import itertools
+import threading
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+LOOP_LAG_MONITOR = os.environ.get("LOOP_LAG_MONITOR", "1") == "1"
+LOOP_LAG_INTERVAL_S = float(os.environ.get("LOOP_LAG_INTERVAL_S", "0.1"))
+LOOP_LAG_THRESHOLD_S = float(os.environ.get("LOOP_LAG_THRESHOLD_S", "0.2"))
+LOOP_LAG_STACKS = os.environ.get("LOOP_LAG_STACKS", "0") == "1"
+
+
+class LoopLagMonitor:
+
+    def __init__(self, interval_s: float = LOOP_LAG_INTERVAL_S, threshold_s: float = LOOP_LAG_THRESHOLD_S,
+                 sample_stacks: bool = LOOP_LAG_STACKS):
+        self.interval_s = interval_s
+        self.threshold_s = threshold_s
+        self.sample_stacks = sample_stacks
+        self._lock = threading.Lock()
+        self._lags: Deque[float] = deque(maxlen=600)
+        self._stalls: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._stats = {"samples": 0, "stalls": 0, "max_lag_s": 0.0, "last_lag_s": 0.0}
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._app = None
+        self._endpoint_codes: Optional[Dict[Any, str]] = None
+        self._heartbeat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        self._ticker: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._pending_stall: Optional[Dict[str, Any]] = None
+
+    # --- request tracking (called from the HTTP middleware) ---
+    def request_started(self, method: str, path: str) -> int:
+        request_id = next(self._ids)
+        with self._lock:
+            self._in_flight[request_id] = {"method": method, "path": path, "started": time.perf_counter()}
+        return request_id
+
+    def request_finished(self, request_id: int):
+        with self._lock:
+            self._in_flight.pop(request_id, None)
+
+    # --- lifecycle ---
+    def start(self, app=None):
+        if self._ticker is not None:
+            return
+        self._app = app
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stopped.clear()
+        self._ticker = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+
+    async def _tick(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            now = time.perf_counter()
+            self._heartbeat = now
+            self._record(max(0.0, now - before - self.interval_s))
+
+    def _record(self, lag: float):
+        with self._lock:
+            self._lags.append(lag)
+            self._stats["samples"] += 1
+            self._stats["last_lag_s"] = lag
+            self._stats["max_lag_s"] = max(self._stats["max_lag_s"], lag)
+            stall, self._pending_stall = self._pending_stall, None
+        if stall is None and lag >= self.threshold_s:
+            stall = {"route": None, "in_flight": self._in_flight_snapshot()}
+        if stall is not None:
+            stall["lag_s"] = round(lag, 3)
+            with self._lock:
+                self._stats["stalls"] += 1
+                self._stalls.append(stall)
+            print(f"🐢 Event loop blocked for {lag:.3f}s in {stall['route'] or 'unknown route'}")
+
+    # --- watchdog thread ---
+    def _watch(self):
+        reported_for = None
+        while not self._stopped.wait(self.interval_s / 2):
+            heartbeat = self._heartbeat
+            if time.perf_counter() - heartbeat < self.interval_s + self.threshold_s or reported_for == heartbeat:
+                continue
+            reported_for = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stall = {"route": self._route_for(frame), "in_flight": self._in_flight_snapshot()}
+            if self.sample_stacks:
+                stall["stack"] = traceback.format_stack(frame)
+            with self._lock:
+                self._pending_stall = stall
+            running = ", ".join(f"{r['method']} {r['path']}" for r in stall["in_flight"]) or "none"
+            print(f"🐢 Event loop blocked >{self.threshold_s}s; running: {stall['route'] or 'unknown'}, "
+                  f"in flight: {running}")
+            if self.sample_stacks:
+                print("".join(stall["stack"]))
+
+    def _route_for(self, frame) -> Optional[str]:
+        """'METHOD /path' of the endpoint whose frame is on the loop thread's stack, if any."""
+        if self._endpoint_codes is None:
+            codes = {}
+            for route in getattr(self._app, "routes", []):
+                endpoint = getattr(route, "endpoint", None)
+                code = getattr(endpoint, "__code__", None)
+                if code is not None:
+                    methods = ",".join(sorted(getattr(route, "methods", None) or []))
+                    codes[code] = f"{methods} {route.path}".strip()
+            self._endpoint_codes = codes
+        while frame is not None:
+            route = self._endpoint_codes.get(frame.f_code)
+            if route:
+                return route
+            frame = frame.f_back
+        return None
+
+    def _in_flight_snapshot(self) -> List[Dict[str, Any]]:
+        now = time.perf_counter()
+        with self._lock:
+            return [{"method": r["method"], "path": r["path"], "running_s": round(now - r["started"], 3)}
+                    for r in self._in_flight.values()]
+
+    # --- metrics ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lags = sorted(self._lags)
+            stats = dict(self._stats)
+            stalls = list(self._stalls)
+            in_flight = len(self._in_flight)
+
+        def pct(p):
+            return round(lags[min(len(lags) - 1, int(len(lags) * p / 100))], 4) if lags else None
+
+        stats.update({
+            "enabled": self._ticker is not None,
+            "interval_s": self.interval_s,
+            "threshold_s": self.threshold_s,
+            "last_lag_s": round(stats["last_lag_s"], 4),
+            "max_lag_s": round(stats["max_lag_s"], 4),
+            "p50_lag_s": pct(50),
+            "p99_lag_s": pct(99),
+            "in_flight": in_flight,
+            "recent_stalls": stalls,
+        })
+        return stats
+
+
+loop_monitor = LoopLagMonitor()
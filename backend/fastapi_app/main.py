@@ -1,21 +1,72 @@
 import os
+import hmac
+import asyncio
 import uuid
 import tempfile
 import shutil
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any
+
+# Imported before FastAPI and the app modules so the startup clock covers them.
+from .startup_profile import mark, startup_report
 from fastapi.middleware.cors import CORSMiddleware
 
-import requests
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, BackgroundTasks, Header
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from .ai_utils import (
-    setup_auth,
     transcribe_pdf_from_path,
-    grade_student_answer,
-    grade_submissions_for_assignment
+    grade_answers,
+    grade_submissions_for_assignment,
+    transcription_flight_stats
 )
-
-app = FastAPI(title="AI Graded Assignments API")
+from .registry import init_clients, close_clients, clients_ready, AuthConfigurationError
+from .batch_grading import (
+    grade_assignments, start_batch, get_batch_progress,
+    DEFAULT_WORKERS as DEFAULT_BATCH_WORKERS, MAX_WORKERS as MAX_BATCH_WORKERS,
+)
+from .grading_memo import answer_memo
+from .usage import usage_ledger
+from .cascade import cascade_stats, TRANSCRIBE_MODEL_TIERS
+from .hedging import hedge_controller
+from .result_store import get_result_store, content_hash
+from .work_queue import get_submission_queue
+from .worker import grade_queued_submission
+from .loop_monitor import loop_monitor, LOOP_LAG_MONITOR
+from .memory_budget import memory_budget, MemoryBudgetFull
+from .file_cleanup import file_cleaner
+from .regrade import regrade_assignment
+from .gradebook_stats import get_gradebook, refresh_from_results
+from .duplicates import duplicate_gradings
+
+
+def _init_clients_in_background():
+    try:
+        init_clients()
+        mark("clients_ready")
+    except AuthConfigurationError:
+        print("❌ Client initialization failed; model calls will retry on first use.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Auth, model objects and the HTTP pool are created once per process and
+    # reused by every request. They load in the background so GET / and /health
+    # answer immediately on a cold container. WARMUP_ON_STARTUP=1 also pre-warms the model.
+    asyncio.get_running_loop().run_in_executor(None, _init_clients_in_background)
+    if LOOP_LAG_MONITOR:
+        loop_monitor.start(app)
+    # Uploaded Gemini files are deleted in the background; this also sweeps
+    # orphans left behind by crashed processes.
+    file_cleaner.start(sweep=True)
+    mark("startup_complete")
+    yield
+    await loop_monitor.stop()
+    await asyncio.get_running_loop().run_in_executor(None, file_cleaner.stop)
+    close_clients()
+
+
+app = FastAPI(title="AI Graded Assignments API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,21 +77,56 @@ app.add_middleware(
 )
 
 
-# Ensure output folder exists
-OUTPUT_DIR = "output_files"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+@app.middleware("http")
+async def record_first_request(request, call_next):
+    response = await call_next(request)
+    mark("first_request")
+    return response
+
+
+@app.middleware("http")
+async def track_request_for_loop_monitor(request, call_next):
+    # Lets the loop-lag monitor say which requests were in flight during a stall.
+    request_id = loop_monitor.request_started(request.method, request.url.path)
+    try:
+        return await call_next(request)
+    finally:
+        loop_monitor.request_finished(request_id)
+
+
+# Results are kept in a bounded SQLite store (see result_store.py) and can be
+# re-fetched with GET /results/{result_id}.
+
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def _budget_full(e: MemoryBudgetFull, detail: str = "Too many files in memory; retry shortly.") -> HTTPException:
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(e.retry_after)})
+
+
+async def _admit_uploads(*files: UploadFile):
+    """Reserve the uploads' size from the shared memory budget, or answer 503 with Retry-After."""
+    try:
+        return await memory_budget.reserve_async(sum(_upload_size(f) for f in files))
+    except MemoryBudgetFull as e:
+        raise _budget_full(e, "Too many uploads in progress; retry shortly.")
 
 # ------------------------------
 # Transcribe Answer Script Endpoint
 # ------------------------------
 @app.post("/transcribe/answer")
 async def transcribe_answer(file: UploadFile = File(...)):
+    reservation = await _admit_uploads(file)
     try:
-        temp_pdf_path = f"temp_{file.filename}"
-        with open(temp_pdf_path, "wb") as f:
-            f.write(await file.read())
-
-        setup_auth()
+        pdf_bytes = await file.read()
+        pdf_hash = content_hash(pdf_bytes)
 
         PROMPT_ANSWERSCRIPT = (
             "You are an expert transcriptionist specializing in handwritten documents."
@@ -52,35 +138,53 @@ async def transcribe_answer(file: UploadFile = File(...)):
             "3. Start each answer with the prefix 'Answer:' on a new line."
             "4. For any handwritten math, transcribe it into clear, readable LaTeX format (e.g., $E = mc^2$, $\\frac{a}{b}$)."
         )
+        transcribe_models = ",".join(TRANSCRIBE_MODEL_TIERS)
+        store = get_result_store()
+        cached = store.find_by_hash(pdf_hash, "answer", prompt=PROMPT_ANSWERSCRIPT, model=transcribe_models)
+        if cached:
+            return JSONResponse(content={
+                "result_id": cached["result_id"],
+                "filename": cached["filename"],
+                "content": cached["content"],
+                "cached": True
+            })
+
+        temp_pdf_path = f"temp_{uuid.uuid4()}_{file.filename}"
+        with open(temp_pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        del pdf_bytes
+        reservation.release()
 
-        result_text = transcribe_pdf_from_path(temp_pdf_path, PROMPT_ANSWERSCRIPT)
-
-        output_filename = f"{uuid.uuid4()}_{os.path.splitext(file.filename)[0]}_answer_output.txt"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(result_text)
+        result_text = await run_in_threadpool(transcribe_pdf_from_path, temp_pdf_path, PROMPT_ANSWERSCRIPT)
 
         os.remove(temp_pdf_path)
 
+        output_filename = f"{os.path.splitext(file.filename)[0]}_answer_output.txt"
+        result_id = None
+        if not result_text.startswith("Error:"):
+            result_id = store.put("answer", result_text, content_hash=pdf_hash, prompt=PROMPT_ANSWERSCRIPT,
+                                  model=transcribe_models, filename=output_filename)
+
         return JSONResponse(content={
+            "result_id": result_id,
             "filename": output_filename,
             "content": result_text
         })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        reservation.release()
 
 # ------------------------------
 # Transcribe Rubric Endpoint
 # ------------------------------
 @app.post("/transcribe/rubric")
 async def transcribe_rubric(file: UploadFile = File(...)):
+    reservation = await _admit_uploads(file)
     try:
-        temp_pdf_path = f"temp_{file.filename}"
-        with open(temp_pdf_path, "wb") as f:
-            f.write(await file.read())
-
-        setup_auth()
+        pdf_bytes = await file.read()
+        pdf_hash = content_hash(pdf_bytes)
 
         PROMPT_RUBRIC = (
             "You are an AI assistant specializing in educational assessment."
@@ -89,39 +193,63 @@ async def transcribe_rubric(file: UploadFile = File(...)):
             "Preserve all scoring criteria, sub-criteria, and their associated point values."
             "Structure the output logically, clearly linking criteria to their points."
         )
+        transcribe_models = ",".join(TRANSCRIBE_MODEL_TIERS)
+        store = get_result_store()
+        cached = store.find_by_hash(pdf_hash, "rubric", prompt=PROMPT_RUBRIC, model=transcribe_models)
+        if cached:
+            return JSONResponse(content={
+                "result_id": cached["result_id"],
+                "filename": cached["filename"],
+                "content": cached["content"],
+                "cached": True
+            })
+
+        temp_pdf_path = f"temp_{uuid.uuid4()}_{file.filename}"
+        with open(temp_pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        del pdf_bytes
+        reservation.release()
 
-        result_text = transcribe_pdf_from_path(temp_pdf_path, PROMPT_RUBRIC)
-
-        output_filename = f"{uuid.uuid4()}_{os.path.splitext(file.filename)[0]}_rubric_output.txt"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(result_text)
+        result_text = await run_in_threadpool(transcribe_pdf_from_path, temp_pdf_path, PROMPT_RUBRIC)
 
         os.remove(temp_pdf_path)
 
+        output_filename = f"{os.path.splitext(file.filename)[0]}_rubric_output.txt"
+        result_id = None
+        if not result_text.startswith("Error:"):
+            result_id = store.put("rubric", result_text, content_hash=pdf_hash, prompt=PROMPT_RUBRIC,
+                                  model=transcribe_models, filename=output_filename)
+
         return JSONResponse(content={
+            "result_id": result_id,
             "filename": output_filename,
             "content": result_text
         })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        reservation.release()
 
 # ------------------------------
 # Generate Score Endpoint
 # ------------------------------
 @app.post("/generate_score")
 async def generate_score(rubric_file: UploadFile = File(...), answer_file: UploadFile = File(...)):
+    reservation = await _admit_uploads(rubric_file, answer_file)
     try:
-        rubric_path = f"temp_{rubric_file.filename}"
-        answer_path = f"temp_{answer_file.filename}"
+        rubric_path = f"temp_{uuid.uuid4()}_{rubric_file.filename}"
+        answer_path = f"temp_{uuid.uuid4()}_{answer_file.filename}"
 
+        rubric_bytes = await rubric_file.read()
+        answer_bytes = await answer_file.read()
+        score_hash = content_hash(rubric_bytes, answer_bytes)
         with open(rubric_path, "wb") as f:
-            f.write(await rubric_file.read())
+            f.write(rubric_bytes)
         with open(answer_path, "wb") as f:
-            f.write(await answer_file.read())
-
-        setup_auth()
+            f.write(answer_bytes)
+        del rubric_bytes, answer_bytes
+        reservation.release()
 
         PROMPT_ANSWERSCRIPT = (
             "You are an expert transcriptionist specializing in handwritten documents."
@@ -142,26 +270,33 @@ async def generate_score(rubric_file: UploadFile = File(...), answer_file: Uploa
             "Structure the output logically, clearly linking criteria to their points."
         )
 
-        rubric_text = transcribe_pdf_from_path(rubric_path, PROMPT_RUBRIC)
-        student_answer = transcribe_pdf_from_path(answer_path, PROMPT_ANSWERSCRIPT)
+        rubric_text = await run_in_threadpool(transcribe_pdf_from_path, rubric_path, PROMPT_RUBRIC)
+        student_answer = await run_in_threadpool(transcribe_pdf_from_path, answer_path, PROMPT_ANSWERSCRIPT)
 
-        result_text = grade_student_answer(rubric_text, student_answer)
-
-        output_filename = f"{uuid.uuid4()}_score_output.txt"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(result_text)
+        result_text = await run_in_threadpool(
+            grade_answers, None, rubric_text=rubric_text, question_text="", student_answer=student_answer
+        )
 
         os.remove(rubric_path)
         os.remove(answer_path)
 
+        output_filename = "score_output.txt"
+        result_id = None
+        if isinstance(result_text, str):
+            result_id = get_result_store().put(
+                "score", result_text, content_hash=score_hash, filename=output_filename
+            )
+
         return JSONResponse(content={
+            "result_id": result_id,
             "filename": output_filename,
             "content": result_text
         })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        reservation.release()
 
 # ------------------------------
 # Optional Root Endpoint
@@ -170,6 +305,87 @@ async def generate_score(rubric_file: UploadFile = File(...), answer_file: Uploa
 def read_root():
     return {"message": "FastAPI AI Graded Assignments Server is running!"}
 
+@app.get("/health")
+def health():
+    return {"status": "ok", "clients_ready": clients_ready()}
+
+@app.get("/results/{result_id}")
+def get_result(result_id: str):
+    result = get_result_store().get(result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return JSONResponse(content=result)
+
+@app.get("/debug/transcriptions")
+def debug_transcriptions():
+    return transcription_flight_stats()
+
+@app.get("/grading/memo")
+def grading_memo_stats(assignment_id: str = None):
+    return answer_memo.stats(assignment_id)
+
+@app.get("/usage")
+def get_usage(job_id: str = None, assignment_id: str = None, submission_id: str = None):
+    """
+    Token and cost totals. With no query parameters, returns the overall,
+    per-model and per-assignment summaries.
+    """
+    if job_id:
+        return {"job_id": job_id, **usage_ledger.totals("job", job_id),
+                "budget": usage_ledger.budget_status(job_id)}
+    if assignment_id:
+        return {"assignment_id": assignment_id, **usage_ledger.totals("assignment", assignment_id)}
+    if submission_id:
+        return {"submission_id": submission_id, **usage_ledger.totals("submission", submission_id)}
+    return {
+        "all": usage_ledger.totals("all", "all"),
+        "by_model": usage_ledger.summary("model"),
+        "by_kind": usage_ledger.summary("kind"),
+        "by_assignment": usage_ledger.summary("assignment"),
+    }
+
+@app.get("/cascade")
+def get_cascade_stats():
+    return cascade_stats.snapshot()
+
+@app.get("/hedging")
+def get_hedging_stats():
+    return hedge_controller.stats()
+
+@app.get("/debug/startup")
+def debug_startup():
+    return startup_report()
+
+@app.get("/debug/event_loop")
+def debug_event_loop():
+    return loop_monitor.stats()
+
+@app.get("/admission")
+def admission_stats():
+    return memory_budget.stats()
+
+@app.get("/debug/file_cleanup")
+def debug_file_cleanup():
+    return file_cleaner.stats()
+
+@app.get("/debug/duplicates")
+def debug_duplicates():
+    return duplicate_gradings.stats()
+
+@app.get("/gradebook/{assignment_id}/stats")
+def gradebook_stats(assignment_id: str, refresh: bool = False):
+    """
+    Class statistics for an assignment: per-question mean, median and score
+    distribution plus an overall score histogram, kept up to date as results
+    are written. refresh=true rebuilds them from the Supabase results first.
+    """
+    try:
+        if refresh:
+            return refresh_from_results(assignment_id)
+        return get_gradebook().summary(assignment_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ------------------------------
 # Grade all submissions for an assignment
 # ------------------------------
@@ -182,11 +398,13 @@ async def grade_submissions(payload: Dict[str, Any] = Body(...)):
         if not assignment_id or not assignment_idea:
             raise HTTPException(status_code=400, detail="assignment_id and assignment_idea are required in the request body")
 
-        graded = grade_submissions_for_assignment(assignment_id, assignment_idea)
+        graded = await run_in_threadpool(grade_submissions_for_assignment, assignment_id, assignment_idea)
         return JSONResponse(content=graded)
 
     except HTTPException:
         raise
+    except MemoryBudgetFull as e:
+        raise _budget_full(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -209,9 +427,9 @@ async def final_grading(payload: Dict[str, Any] = Body(...)):
                 detail="assignment_id is required in the request body"
             )
 
-        # Call existing helper function
-        graded_results = grade_submissions_for_assignment(
-            assignment_id=assignment_id
+        # Call existing helper function off the event loop; it can wait on the memory budget.
+        graded_results = await run_in_threadpool(
+            grade_submissions_for_assignment, assignment_id=assignment_id
         )
 
         return JSONResponse(content={
@@ -222,6 +440,115 @@ async def final_grading(payload: Dict[str, Any] = Body(...)):
 
     except HTTPException:
         raise
+    except MemoryBudgetFull as e:
+        raise _budget_full(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/final_grading/regrade")
+async def final_grading_regrade(payload: Dict[str, Any] = Body(...)):
+    """
+    Regrade an assignment after a rubric edit: only questions whose rubric
+    entry changed are regraded (from stored transcriptions) and each result
+    row is patched in place. Expects JSON body with:
+      - assignment_id: the assignment identifier
+    """
+    assignment_id = payload.get("assignment_id")
+    if not assignment_id:
+        raise HTTPException(status_code=400, detail="assignment_id is required in the request body")
+    try:
+        report = await run_in_threadpool(regrade_assignment, assignment_id)
+        return JSONResponse(content=report)
+    except MemoryBudgetFull as e:
+        raise _budget_full(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+# ------------------------------
+# Submission Insert Webhook Endpoint
+# ------------------------------
+@app.post("/webhooks/submissions")
+async def submission_inserted(
+    background_tasks: BackgroundTasks,
+    payload: Dict[str, Any] = Body(...),
+    x_webhook_secret: str = Header(default=None),
+):
+    """
+    Receiver for Supabase database webhooks on INSERT into 'submissions'.
+    Queues the new submission and grades it in the background against the
+    cached assignment rubric, instead of waiting for a batch /final_grading run.
+    The X-Webhook-Secret header must match SUPABASE_WEBHOOK_SECRET; without
+    a configured secret every call is refused, since each one starts paid
+    model calls.
+    """
+    expected_secret = os.environ.get("SUPABASE_WEBHOOK_SECRET")
+    if not expected_secret:
+        raise HTTPException(status_code=503, detail="SUPABASE_WEBHOOK_SECRET is not configured")
+    if not x_webhook_secret or not hmac.compare_digest(x_webhook_secret.encode(), expected_secret.encode()):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+
+    if payload.get("type") != "INSERT" or payload.get("table") != "submissions":
+        return JSONResponse(content={"status": "ignored"})
+
+    record = payload.get("record") or {}
+    submission_id = record.get("id")
+    assignment_id = record.get("assignment_id")
+    if not submission_id or not assignment_id:
+        raise HTTPException(status_code=400, detail="record.id and record.assignment_id are required")
+
+    try:
+        queued = await run_in_threadpool(get_submission_queue().enqueue, submission_id, assignment_id, record)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if queued:
+        background_tasks.add_task(grade_queued_submission, submission_id)
+
+    return JSONResponse(status_code=202, content={
+        "status": "queued" if queued else "duplicate",
+        "submission_id": submission_id,
+    })
+
+# ------------------------------
+# Multi-Assignment Batch Grading Endpoints
+# ------------------------------
+@app.post("/final_grading/batch")
+async def final_grading_batch(background_tasks: BackgroundTasks, payload: Dict[str, Any] = Body(...)):
+    """
+    Grade several assignments through one shared, fairly scheduled worker pool.
+    Expects JSON body with:
+      - assignment_ids: list of assignment identifiers
+      - max_workers (optional): size of the shared grading pool
+      - token_budget (optional): stop scheduling submissions after this many tokens
+    Returns a job_id; poll GET /final_grading/batch/{job_id} for progress.
+    """
+    assignment_ids = payload.get("assignment_ids")
+    if not assignment_ids or not isinstance(assignment_ids, list):
+        raise HTTPException(status_code=400, detail="assignment_ids (a non-empty list) is required in the request body")
+    try:
+        max_workers = payload.get("max_workers")
+        max_workers = DEFAULT_BATCH_WORKERS if max_workers is None else int(max_workers)
+        token_budget = payload.get("token_budget")
+        token_budget = None if token_budget is None else int(token_budget)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="max_workers and token_budget must be integers")
+    if not 1 <= max_workers <= MAX_BATCH_WORKERS:
+        raise HTTPException(status_code=400, detail=f"max_workers must be between 1 and {MAX_BATCH_WORKERS}")
+    if token_budget is not None and token_budget < 1:
+        raise HTTPException(status_code=400, detail="token_budget must be positive")
+
+    job_id = start_batch(assignment_ids)
+    background_tasks.add_task(grade_assignments, assignment_ids, max_workers, job_id, token_budget)
+    return JSONResponse(status_code=202, content={"job_id": job_id})
+
+@app.get("/final_grading/batch/{job_id}")
+def final_grading_batch_progress(job_id: str):
+    progress = get_batch_progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job")
+    return JSONResponse(content=progress)
+
+
+mark("app_imported")
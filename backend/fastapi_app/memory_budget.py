@@ -0,0 +1,158 @@
+"""
+Process-wide budget for PDF bytes held in memory.
+
+Uploads read by the API handlers hold a whole file in memory until it is
+written to disk, and submission/rubric PDFs downloaded by graders hold the
+chunk being streamed to disk. With many concurrent requests or workers a
+burst of large scans can exhaust the container, so those bytes are first
+reserved from one shared budget (MEMORY_BUDGET_BYTES) and given back once
+the file has been written out.
+
+Worker threads wait for room, up to MEMORY_RESERVE_TIMEOUT_S. API handlers
+wait up to UPLOAD_ADMISSION_WAIT_S; either way a timeout raises
+MemoryBudgetFull, which the API answers with 503 and Retry-After. A single file larger than the whole
+budget is admitted only while nothing else is held, so it can't wait forever.
+GET /admission serves current usage.
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+
+MEMORY_BUDGET_BYTES = int(os.environ.get("MEMORY_BUDGET_BYTES", str(512 * 1024 * 1024)))
+MEMORY_RESERVE_TIMEOUT_S = float(os.environ.get("MEMORY_RESERVE_TIMEOUT_S", "120"))
+UPLOAD_ADMISSION_WAIT_S = float(os.environ.get("UPLOAD_ADMISSION_WAIT_S", "5"))
+ADMISSION_RETRY_AFTER_S = int(os.environ.get("ADMISSION_RETRY_AFTER_S", "5"))
+
+
+class MemoryBudgetFull(Exception):
+
+    def __init__(self, nbytes: int, retry_after: int = ADMISSION_RETRY_AFTER_S):
+        super().__init__(f"Memory budget full; could not admit {nbytes} bytes")
+        self.nbytes = nbytes
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """Bytes held against the budget; release() is idempotent. Also a context manager."""
+
+    def __init__(self, budget: "MemoryBudget", nbytes: int):
+        self._budget = budget
+        self.nbytes = nbytes
+        self._released = False
+
+    def grow(self, nbytes: int, timeout: Optional[float] = MEMORY_RESERVE_TIMEOUT_S):
+        """Hold `nbytes` more, e.g. when a download turns out larger than reserved."""
+        self._budget.grow(nbytes, timeout)
+        self.nbytes += max(0, int(nbytes))
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._budget.release(self.nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MemoryBudget:
+
+    def __init__(self, max_bytes: int = MEMORY_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._holders = 0
+        self._stats = {"admitted": 0, "waited": 0, "rejected": 0, "wait_s": 0.0, "peak_bytes": 0}
+
+    def _try_acquire(self, nbytes: int) -> bool:
+        # Caller holds self._cond.
+        if self._holders and self._in_use + nbytes > self.max_bytes:
+            return False
+        self._in_use += nbytes
+        self._holders += 1
+        self._stats["admitted"] += 1
+        self._stats["peak_bytes"] = max(self._stats["peak_bytes"], self._in_use)
+        return True
+
+    def _finish_wait(self, waited_s: float, admitted: bool):
+        with self._cond:
+            if waited_s > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_s"] += waited_s
+            if not admitted:
+                self._stats["rejected"] += 1
+
+    def reserve(self, nbytes: int, timeout: Optional[float] = MEMORY_RESERVE_TIMEOUT_S) -> Reservation:
+        """Block until `nbytes` fit (or `timeout` seconds pass, raising MemoryBudgetFull; None waits forever)."""
+        nbytes = max(0, int(nbytes))
+        start = time.perf_counter()
+        with self._cond:
+            admitted = self._cond.wait_for(lambda: self._try_acquire(nbytes), timeout=timeout)
+        waited = time.perf_counter() - start
+        self._finish_wait(waited if waited > 0.001 else 0.0, admitted)
+        if not admitted:
+            raise MemoryBudgetFull(nbytes)
+        return Reservation(self, nbytes)
+
+    def grow(self, nbytes: int, timeout: Optional[float] = MEMORY_RESERVE_TIMEOUT_S):
+        """Add `nbytes` to a reservation already held; it may overrun the budget only as the sole holder."""
+        nbytes = max(0, int(nbytes))
+
+        def try_grow():
+            if self._holders > 1 and self._in_use + nbytes > self.max_bytes:
+                return False
+            self._in_use += nbytes
+            self._stats["peak_bytes"] = max(self._stats["peak_bytes"], self._in_use)
+            return True
+
+        start = time.perf_counter()
+        with self._cond:
+            admitted = self._cond.wait_for(try_grow, timeout=timeout)
+        waited = time.perf_counter() - start
+        self._finish_wait(waited if waited > 0.001 else 0.0, admitted)
+        if not admitted:
+            raise MemoryBudgetFull(nbytes)
+
+    async def reserve_async(self, nbytes: int, timeout: float = UPLOAD_ADMISSION_WAIT_S) -> Reservation:
+        """reserve() for the event loop: polls instead of blocking a thread."""
+        nbytes = max(0, int(nbytes))
+        start = time.perf_counter()
+        delay = 0.01
+        while True:
+            with self._cond:
+                admitted = self._try_acquire(nbytes)
+            waited = time.perf_counter() - start
+            if admitted or waited >= timeout:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+        self._finish_wait(waited if waited > 0.001 else 0.0, admitted)
+        if not admitted:
+            raise MemoryBudgetFull(nbytes)
+        return Reservation(self, nbytes)
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self._in_use -= nbytes
+            self._holders -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "max_bytes": self.max_bytes,
+                "in_use_bytes": self._in_use,
+                "in_flight_files": self._holders,
+                "utilization": round(self._in_use / self.max_bytes, 4) if self.max_bytes else 0.0,
+            })
+        stats["wait_s"] = round(stats["wait_s"], 3)
+        return stats
+
+
+memory_budget = MemoryBudget()
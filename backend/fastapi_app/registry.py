@@ -0,0 +1,133 @@
+"""
+Process-wide clients shared by every request.
+
+Gemini auth, GenerativeModel objects (one per model name + system prompt) and
+the pooled HTTP session used for Supabase are created once and reused, instead
+of being rebuilt on every endpoint call. The FastAPI lifespan hook in main.py
+starts init_clients() in the background at startup and calls close_clients()
+at shutdown; CLI entry points get the same objects lazily on first use.
+
+The Gemini SDK and requests are imported inside these functions rather than at
+module level, so importing the app (and serving GET /) doesn't pay for them.
+"""
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+
+_lock = threading.Lock()
+_auth_configured = False
+_models: Dict[Tuple[str, Optional[str]], "genai.GenerativeModel"] = {}
+_http_session: Optional["requests.Session"] = None
+
+
+class AuthConfigurationError(Exception):
+    """Gemini auth could not be configured (e.g. GEMINI_API_KEY is missing)."""
+
+
+def configure_auth():
+    """
+    Configures Gemini auth from GEMINI_API_KEY once per process. Raises
+    AuthConfigurationError (not SystemExit: request threads reach this via get_model).
+    """
+    global _auth_configured
+    if _auth_configured:
+        return
+    with _lock:
+        if _auth_configured:
+            return
+        try:
+            import google.generativeai as genai
+            api_key = os.environ["GEMINI_API_KEY"]
+            genai.configure(api_key=api_key)
+            print("Authentication configured using GOOGLE_API_KEY.")
+        except KeyError:
+            print("Error: GOOGLE_API_KEY environment variable not set.")
+            raise AuthConfigurationError("GEMINI_API_KEY environment variable not set")
+        except Exception as e:
+            print(f"An error occurred during authentication setup: {e}")
+            raise AuthConfigurationError(str(e)) from e
+        _auth_configured = True
+
+
+def get_model(model_name: str = DEFAULT_MODEL_NAME, system_prompt: Optional[str] = None):
+    """Returns the shared GenerativeModel for (model_name, system_prompt), creating it on first use."""
+    key = (model_name, system_prompt)
+    model = _models.get(key)
+    if model is None:
+        configure_auth()
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                import google.generativeai as genai
+                if system_prompt is None:
+                    model = genai.GenerativeModel(model_name=model_name)
+                else:
+                    model = genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt)
+                _models[key] = model
+    return model
+
+
+def http_session() -> "requests.Session":
+    """Returns the shared, connection-pooled HTTP session for Supabase calls."""
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def warm_up(model_name: str = DEFAULT_MODEL_NAME) -> float:
+    """
+    Sends one tiny generation so TLS, DNS and the model client are warm before
+    the first real request. Returns the elapsed seconds, or -1 on failure.
+    """
+    from google.generativeai import types
+    start = time.perf_counter()
+    try:
+        get_model(model_name).generate_content(
+            "ping",
+            generation_config=types.GenerationConfig(temperature=0.0, max_output_tokens=1),
+        )
+    except Exception as e:
+        print(f"⚠️ Model warm-up failed: {e}")
+        return -1
+    elapsed = time.perf_counter() - start
+    print(f"🔥 Warmed up {model_name} in {elapsed:.2f}s")
+    return elapsed
+
+
+def clients_ready() -> bool:
+    """True once auth is configured and the HTTP pool exists."""
+    return _auth_configured and _http_session is not None
+
+
+def init_clients(warmup: Optional[bool] = None):
+    """Startup hook: auth, HTTP pool and (if WARMUP_ON_STARTUP=1) one warm-up call."""
+    configure_auth()
+    http_session()
+    if warmup is None:
+        warmup = os.environ.get("WARMUP_ON_STARTUP", "0") == "1"
+    if warmup:
+        warm_up()
+
+
+def close_clients():
+    """Shutdown hook: releases pooled HTTP connections and cached models."""
+    global _http_session
+    with _lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+        _models.clear()
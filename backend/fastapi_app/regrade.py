@@ -0,0 +1,255 @@
+"""
+Incremental regrading after a rubric edit.
+
+Every graded result stores the per-question rubric entry hashes it was graded
+with (results.rubric_hashes, see grading_memo.rubric_fingerprint). After an
+instructor changes the rubric, regrade_assignment() re-reads the rubric,
+diffs it against each result's hashes and sends only the changed or new
+questions, with the submission's stored transcription (transcription_store.py),
+back through grade_answers. The result row's result_json, overall_score and
+rubric_hashes are then patched in place, and questions removed from the rubric
+are dropped. Results graded before rubric hashes were recorded are regraded
+in full from the stored transcription.
+
+    python -m backend.fastapi_app.regrade <assignment_id> [--workers N]
+"""
+import sys
+import json
+import uuid
+import shutil
+import argparse
+import tempfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ai_utils import (
+    setup_auth,
+    get_supabase_credentials,
+    get_assignment_texts,
+    rubric_usable,
+    grade_answers,
+    parse_grading_json,
+)
+from .gradebook_stats import record_result
+from .grading_memo import answer_memo, split_by_question, normalize_label, rubric_fingerprint
+from .registry import http_session
+from .transcription_store import get_transcription_store
+from .usage import usage_ledger, usage_scope
+
+
+DEFAULT_WORKERS = 4
+RESULT_PAGE_SIZE = 500
+_RESULT_COLUMNS = "result_id,submission_id,user_id,created_at,processing_status,result_json,overall_score,rubric_hashes"
+
+
+def diff_rubric(old_hashes: Optional[Dict[str, str]], new_hashes: Dict[str, str]) -> Tuple[List[str], List[str], bool]:
+    """
+    (affected, removed, full) between the rubric a result was graded with and
+    the current one. `full` means the question-level diff isn't possible
+    (no stored hashes, or a rubric that can't be split) and everything changed.
+    """
+    if old_hashes == new_hashes:
+        return [], [], False
+    if not old_hashes or "*" in old_hashes or "*" in new_hashes:
+        return [label for label in new_hashes if label != "*"], [], True
+    affected = [label for label, digest in new_hashes.items() if old_hashes.get(label) != digest]
+    removed = [label for label in old_hashes if label not in new_hashes]
+    return affected, removed, False
+
+
+def fetch_latest_results(assignment_id: str, SUPABASE_URL: str, SUPABASE_KEY: str,
+                         graded_only: bool = True) -> List[Dict[str, Any]]:
+    """
+    The newest graded result row per submission of an assignment. With
+    graded_only=False, submissions that never got a graded result are
+    included with their newest row of any status (e.g. "failed").
+    """
+    latest: Dict[Any, Dict[str, Any]] = {}
+    after_id = None
+
+    def rank(row):
+        return row.get("processing_status") == "graded", row.get("created_at") or ""
+
+    while True:
+        params = {
+            "select": _RESULT_COLUMNS,
+            "assignment_id": f"eq.{assignment_id}",
+            "order": "result_id.asc",
+            "limit": str(RESULT_PAGE_SIZE),
+        }
+        if graded_only:
+            params["processing_status"] = "eq.graded"
+        if after_id is not None:
+            params["result_id"] = f"gt.{after_id}"
+        resp = http_session().get(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1/results",
+            params=params,
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}", "Accept": "application/json"},
+            timeout=30
+        )
+        if resp.status_code != 200:
+            raise Exception(f"Failed to fetch results: {resp.status_code} {resp.text}")
+        rows = resp.json()
+        for row in rows:
+            current = latest.get(row.get("submission_id"))
+            if current is None or rank(row) >= rank(current):
+                latest[row.get("submission_id")] = row
+        if not rows:
+            return list(latest.values())
+        after_id = rows[-1]["result_id"]
+
+
+def patch_result(SUPABASE_URL: str, SUPABASE_KEY: str, result_id: Any, fields: Dict[str, Any]):
+    resp = http_session().patch(
+        f"{SUPABASE_URL.rstrip('/')}/rest/v1/results?result_id=eq.{result_id}",
+        headers={
+            "apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal",
+        },
+        data=json.dumps(fields),
+        timeout=30
+    )
+    resp.raise_for_status()
+
+
+def _sub_rubric(sections: Dict[str, str], labels: List[str]) -> str:
+    return "\n".join(f"{label}) {sections[label]}" for label in labels)
+
+
+def regrade_result(row: Dict[str, Any], assignment_id: str, question_txt: str, rubric_txt: str,
+                   new_hashes: Dict[str, str], SUPABASE_URL: str, SUPABASE_KEY: str) -> Dict[str, Any]:
+    """Regrade the questions of one result row that the rubric change affects, and patch the row."""
+    summary = {"result_id": row.get("result_id"), "submission_id": row.get("submission_id")}
+    affected, removed, full = diff_rubric(row.get("rubric_hashes"), new_hashes)
+    if not affected and not removed and not full:
+        return {**summary, "status": "unchanged"}
+    stored = get_transcription_store().get(row.get("submission_id")) if (affected or full) else None
+    transcript = stored["transcript"] if stored else None
+    if (affected or full) and not transcript:
+        return {**summary, "status": "skipped", "reason": "no stored transcription; run a full grading"}
+
+    new_items: Dict[str, Dict[str, Any]] = {}
+    if affected or full:
+        if full:
+            grading = grade_answers(assignment_id, rubric_txt, question_txt, transcript)
+        else:
+            sections = split_by_question(rubric_txt)
+            answers = split_by_question(transcript, list(sections))
+            student_answer = (
+                "\n".join(f"{label}) {answers[label]}" for label in affected if label in answers)
+                if answers else transcript
+            )
+            # The memo is synced against the full rubric in regrade_assignment.
+            grading = grade_answers(assignment_id, _sub_rubric(sections, affected), question_txt, student_answer,
+                                    sync_memo=False)
+        if not isinstance(grading, str):
+            return {**summary, "status": "error", "detail": grading}
+        try:
+            data = parse_grading_json(grading)
+        except (json.JSONDecodeError, AttributeError):
+            return {**summary, "status": "error", "detail": "unparseable grading"}
+        for item in data.get("results", []):
+            label = normalize_label(item.get("question")) or str(item.get("question"))
+            if full or label in affected:
+                new_items[label] = item
+
+    if full:
+        results = list(new_items.values())
+    else:
+        kept = [
+            item for item in (row.get("result_json") or [])
+            if (normalize_label(item.get("question")) or str(item.get("question"))) not in set(removed) | set(new_items)
+        ]
+        rank = {label: i for i, label in enumerate(new_hashes)}
+        results = sorted(kept + list(new_items.values()),
+                         key=lambda item: rank.get(normalize_label(item.get("question")), len(rank)))
+    overall_score = sum(item.get("score", 0) or 0 for item in results)
+
+    # A question the model left out keeps its old hash (or none), so the next regrade retries it.
+    old_hashes = {} if full else (row.get("rubric_hashes") or {})
+    rubric_hashes = {
+        label: digest if label not in affected or label in new_items else old_hashes.get(label)
+        for label, digest in new_hashes.items()
+    }
+    rubric_hashes = {label: digest for label, digest in rubric_hashes.items() if digest is not None}
+    patch_result(SUPABASE_URL, SUPABASE_KEY, row["result_id"], {
+        "result_json": results,
+        "overall_score": overall_score,
+        "rubric_hashes": rubric_hashes,
+    })
+    record_result(assignment_id, row.get("submission_id"), "graded", results, overall_score)
+    return {
+        **summary,
+        "status": "patched",
+        "regraded_questions": sorted(new_items),
+        "removed_questions": removed,
+        "full": full,
+        "old_score": row.get("overall_score"),
+        "new_score": overall_score,
+    }
+
+
+def _regrade_in_scope(row, assignment_id, *args):
+    with usage_scope(assignment=assignment_id, submission=row.get("submission_id")):
+        return regrade_result(row, assignment_id, *args)
+
+
+def regrade_assignment(assignment_id: str, max_workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """Re-read the assignment's rubric and regrade only what changed in every graded result."""
+    setup_auth()
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    tmpdir = tempfile.mkdtemp(prefix="regrade_")
+    try:
+        question_txt, rubric_txt = get_assignment_texts(assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir,
+                                                        refresh=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if not rubric_usable(rubric_txt):
+        raise Exception(f"Could not load the rubric for assignment {assignment_id}")
+    new_hashes = rubric_fingerprint(rubric_txt)
+    answer_memo.sync_rubric(assignment_id, rubric_txt)
+    rows = fetch_latest_results(assignment_id, SUPABASE_URL, SUPABASE_KEY)
+
+    results = []
+    job_id = f"regrade-{uuid.uuid4()}"
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, usage_scope(job=job_id):
+        futures = [
+            pool.submit(contextvars.copy_context().run, _regrade_in_scope, row, assignment_id,
+                        question_txt, rubric_txt, new_hashes, SUPABASE_URL, SUPABASE_KEY)
+            for row in rows
+        ]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"status": "error", "detail": str(e)})
+
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {
+        "assignment_id": assignment_id,
+        "count": len(results),
+        "counts": counts,
+        "regraded_questions": sum(len(r.get("regraded_questions", [])) for r in results),
+        "token_usage": usage_ledger.totals("job", job_id),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regrade only the questions a rubric edit affected.")
+    parser.add_argument("assignment_id")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    report = regrade_assignment(args.assignment_id, args.workers)
+    print(f"\n✅ Regraded assignment {args.assignment_id}: {report['counts']} "
+          f"({report['regraded_questions']} questions sent to the model or rules)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
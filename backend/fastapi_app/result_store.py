@@ -0,0 +1,167 @@
+"""
+Bounded store for transcription and scoring results.
+
+Replaces the one-file-per-call writes into output_files/. Results live in a
+single SQLite file, zlib-compressed, indexed by result ID and by the input
+content hash together with the prompt and model(s) that produced them. Entries older than RESULT_TTL_SECONDS are dropped, and once the
+stored bytes exceed RESULT_STORE_MAX_BYTES the least recently read results
+are evicted first.
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, Union
+
+
+RESULT_STORE_PATH = os.environ.get("RESULT_STORE_PATH", "results.db")
+RESULT_TTL_SECONDS = int(os.environ.get("RESULT_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_STORE_MAX_BYTES = int(os.environ.get("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Run eviction every N writes rather than on every put.
+EVICT_EVERY = 50
+
+
+def content_hash(*chunks: bytes) -> str:
+    """sha256 over one or more byte strings (e.g. the uploaded PDF(s))."""
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(hashlib.sha256(chunk).digest())
+    return h.hexdigest()
+
+
+def prompt_hash(prompt: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest() if prompt is not None else None
+
+
+class ResultStore:
+
+    def __init__(self, path: str = RESULT_STORE_PATH, ttl_seconds: int = RESULT_TTL_SECONDS,
+                 max_bytes: int = RESULT_STORE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                result_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                content_hash TEXT,
+                prompt_hash TEXT,
+                model TEXT,
+                filename TEXT,
+                content BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(results)")}
+        for column in ("prompt_hash", "model"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE results ADD COLUMN {column} TEXT")
+        conn.execute("DROP INDEX IF EXISTS results_hash_idx")
+        conn.execute("DROP INDEX IF EXISTS results_assignment_idx")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_key_idx ON results (content_hash, kind, prompt_hash, model)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_access_idx ON results (last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, kind: str, content: Union[str, Dict[str, Any]], content_hash: Optional[str] = None,
+            prompt: Optional[str] = None, model: Optional[str] = None, filename: Optional[str] = None) -> str:
+        """Store a result and return its new result_id. prompt and model are part of the find_by_hash key."""
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        blob = zlib.compress(content.encode("utf-8"))
+        result_id = str(uuid.uuid4())
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO results (result_id, kind, content_hash, prompt_hash, model, filename, content, size, "
+            "created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (result_id, kind, content_hash, prompt_hash(prompt), model, filename, blob, len(blob), now, now),
+        )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+        return result_id
+
+    def _row_to_result(self, row: sqlite3.Row) -> Dict[str, Any]:
+        result = {key: row[key] for key in ("result_id", "kind", "content_hash", "model", "filename",
+                                            "created_at", "last_access")}
+        result["content"] = zlib.decompress(row["content"]).decode("utf-8")
+        return result
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT * FROM results WHERE result_id = ? AND created_at >= ?",
+            (result_id, time.time() - self.ttl_seconds),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE results SET last_access = ? WHERE result_id = ?", (time.time(), result_id))
+        return self._row_to_result(row)
+
+    def find_by_hash(self, content_hash: str, kind: str, prompt: Optional[str] = None,
+                     model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Most recent live result of `kind` produced from the same input bytes, prompt and model."""
+        row = self._conn().execute(
+            "SELECT result_id FROM results WHERE content_hash = ? AND kind = ? AND prompt_hash IS ? "
+            "AND model IS ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+            (content_hash, kind, prompt_hash(prompt), model, time.time() - self.ttl_seconds),
+        ).fetchone()
+        return self.get(row["result_id"]) if row else None
+
+    def evict(self) -> int:
+        """Drop expired results, then least recently read ones until under max_bytes."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims, freed = [], 0
+            for row in conn.execute("SELECT result_id, size FROM results ORDER BY last_access"):
+                if freed >= excess:
+                    break
+                victims.append((row["result_id"],))
+                freed += row["size"]
+            conn.executemany("DELETE FROM results WHERE result_id = ?", victims)
+            removed += len(victims)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes FROM results").fetchone()
+        return {"count": row["n"], "bytes": row["bytes"], "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds}
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    """Process-wide result store at RESULT_STORE_PATH."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore()
+    return _store
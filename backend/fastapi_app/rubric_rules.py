@@ -0,0 +1,144 @@
+"""
+Deterministic grading for rubric items that don't need a model.
+
+Each rubric entry (split per question by grading_memo.split_by_question) is
+parsed into its score levels, e.g. "0; Blank, 0; Short, honest statement" ->
+[(0, "Blank"), (0, "Short, honest statement")]. decide() then scores a
+question locally when one of these rules settles it:
+
+  fixed_score  two or more levels, all awarding the same score
+  full_marks   a sentence of the rubric is an unconditional instruction to give
+               full marks / not report on the question
+  exact_match  the rubric states the answer, the student's matches it, and no
+               level asks for an explanation or shown work
+  blank        the student left the question blank
+  non_blank    a two-level "blank vs. any attempt" item with a non-blank answer
+
+Anything else returns None and is left for the model.
+"""
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from .grading_memo import normalize_answer
+
+
+_LEVEL_START_RE = re.compile(r"(?:^|,|\n)\s*(?=[+-]?\d+(?:\.\d+)?\s*(?:pts?|points?|marks?)?\s*[;:])", re.IGNORECASE)
+_LEVEL_RE = re.compile(r"^\s*([+-]?\d+(?:\.\d+)?)\s*(?:pts?|points?|marks?)?\s*[;:]\s*(.*)$", re.IGNORECASE | re.DOTALL)
+_EXPECTED_RE = re.compile(r"(?:correct\s+answer|expected(?:\s+answer)?|answer)\s*[:=]\s*(.+)", re.IGNORECASE)
+
+_FULL_MARKS_PHRASES = ("give full marks", "award full marks", "do not add anything in your report")
+_SENTENCE_SPLIT_RE = re.compile(r"[.;!?\n]+")
+_CONDITION_RE = re.compile(r"\b(?:unless|if|only|when|whenever|except|provided|who|whose)\b")
+_REASONING_PHRASES = ("explain", "explanation", "justif", "reasoning", "derivation", "derive", "work", "steps",
+                      "show")
+_BLANK_PHRASES = ("blank", "no answer", "not answered", "unanswered", "not attempted", "no attempt")
+_ATTEMPT_PHRASES = ("any attempt", "any answer", "attempted", "non-blank", "nonblank", "answered", "submitted")
+_BLANK_ANSWERS = {"", "-", "--", "n/a", "na", "none", "blank", "no answer", "not attempted", "skipped"}
+
+
+def parse_levels(entry: str) -> List[Tuple[float, str]]:
+    """Score levels of one rubric entry as (score, description) pairs, in rubric order."""
+    levels = []
+    for chunk in _LEVEL_START_RE.split(entry or ""):
+        match = _LEVEL_RE.match(chunk)
+        if match:
+            score = float(match.group(1))
+            levels.append((int(score) if score.is_integer() else score, match.group(2).strip().rstrip(",.")))
+    return levels
+
+
+def _mentions(text: str, phrases) -> bool:
+    text = text.lower()
+    return any(phrase in text for phrase in phrases)
+
+
+def _instructs_full_marks(entry: str) -> bool:
+    """
+    True if a sentence of the entry starts with a full-marks phrase and has no
+    condition; "Do not give full marks unless ..." or "Give full marks only if
+    ..." don't count.
+    """
+    for sentence in _SENTENCE_SPLIT_RE.split(entry.lower()):
+        sentence = sentence.strip()
+        if sentence.startswith("please "):
+            sentence = sentence[len("please "):]
+        if sentence.startswith(_FULL_MARKS_PHRASES) and not _CONDITION_RE.search(sentence):
+            return True
+    return False
+
+
+def is_blank(answer: Optional[str]) -> bool:
+    return normalize_answer(answer or "") in _BLANK_ANSWERS
+
+
+def _result(label: str, score, reason: str, rule: str, improvement: str = "") -> Dict[str, Any]:
+    return {
+        "question": label,
+        "score": score,
+        "reason": reason,
+        "improvement": improvement,
+        "graded_by": f"rule:{rule}",
+    }
+
+
+def decide(label: str, entry: str, answer: Optional[str], answers_known: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Score one question locally, or return None if the model is needed.
+    With answers_known=False (the transcript couldn't be split per question)
+    only rules that don't depend on the answer are applied.
+    """
+    levels = parse_levels(entry)
+    if not levels:
+        return None
+    scores = [score for score, _ in levels]
+
+    # A single level ("5; Correct derivation") is a description of full credit, not a fixed score.
+    if len(levels) >= 2 and len(set(scores)) == 1:
+        return _result(label, scores[0], f"This item awards {scores[0]} regardless of the answer.", "fixed_score")
+
+    if _instructs_full_marks(entry):
+        return _result(label, max(scores), "Rubric instructs full marks for this item.", "full_marks")
+
+    if not answers_known:
+        return None
+
+    # A matching final answer can't earn levels that also grade the explanation or working.
+    expected = _EXPECTED_RE.search(entry)
+    if expected and not any(_mentions(desc, _REASONING_PHRASES) for _, desc in levels):
+        want = normalize_answer(expected.group(1).split(",")[0].split("\n")[0])
+        if want and normalize_answer(answer) == want:
+            return _result(label, max(scores), "Answer matches the expected answer exactly.", "exact_match")
+
+    if is_blank(answer):
+        blank_levels = [score for score, desc in levels if _mentions(desc, _BLANK_PHRASES)]
+        score = min(blank_levels) if blank_levels else min(scores)
+        return _result(label, score, "No answer was provided for this question.", "blank",
+                       "Attempt every question; partial answers can still earn credit.")
+
+    if len(levels) == 2:
+        # "Not answered" also contains "answered", so blank levels can't be attempt levels.
+        blank_level = [score for score, desc in levels if _mentions(desc, _BLANK_PHRASES)]
+        attempt_level = [score for score, desc in levels
+                         if not _mentions(desc, _BLANK_PHRASES) and _mentions(desc, _ATTEMPT_PHRASES)]
+        if blank_level and attempt_level:
+            return _result(label, attempt_level[0], "An answer was provided.", "non_blank")
+
+    return None
+
+
+def apply_rules(rubric_sections: Dict[str, str], answers: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Locally decided results for every rubric question a rule can settle.
+    A question missing from `answers` is not treated as blank (the splitter
+    may have folded it into another answer); only rules that don't depend on
+    the answer are applied to it, and otherwise it goes to the model.
+    """
+    decided = {}
+    for label, entry in rubric_sections.items():
+        if label in answers:
+            result = decide(label, entry, answers[label], True)
+        else:
+            result = decide(label, entry, "", False)
+        if result is not None:
+            decided[label] = result
+    return decided
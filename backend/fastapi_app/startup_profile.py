@@ -0,0 +1,137 @@
+"""
+Cold-start profiling for the API and CLI.
+
+In the running app, main.py records startup milestones with mark() and serves
+them at GET /debug/startup. From the command line, a fresh interpreter is used
+so the numbers reflect a real cold start:
+
+    python -m backend.fastapi_app.startup_profile --output startup.json
+    python -m backend.fastapi_app.startup_profile --baseline startup.json
+
+The report lists per-module import time (from `python -X importtime`), the
+time to import the app, to finish startup and to serve the first GET /, so
+reports from different releases can be diffed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, Any, List, Optional
+
+
+_t0 = time.perf_counter()
+_marks: Dict[str, float] = {}
+
+
+def mark(event: str):
+    """Record the first time `event` happens, in seconds since this module was imported."""
+    _marks.setdefault(event, round(time.perf_counter() - _t0, 4))
+
+
+def startup_report() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "marks": dict(_marks)}
+
+
+def parse_importtime(stderr: str, top: int = 25) -> List[Dict[str, Any]]:
+    """
+    Parse `-X importtime` output into the slowest modules by cumulative time (ms).
+    Imports running on another thread at the same time (the background client
+    init) interleave their lines, which can repeat a module or make its self
+    time negative, so each module is reported once with self time clamped at 0.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            row = {
+                "module": name.strip(),
+                "self_ms": max(int(self_us), 0) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        except ValueError:
+            continue
+        current = rows.get(row["module"])
+        if current is None or row["cumulative_ms"] > current["cumulative_ms"]:
+            rows[row["module"]] = row
+    return sorted(rows.values(), key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+_COLD_START_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import {module} as target
+t_import = time.perf_counter() - t0
+out = {{"import_s": round(t_import, 4)}}
+app = getattr(target, "app", None)
+if app is not None:
+    from fastapi.testclient import TestClient
+    with TestClient(app) as client:
+        out["startup_complete_s"] = round(time.perf_counter() - t0, 4)
+        client.get("/")
+        out["first_request_s"] = round(time.perf_counter() - t0, 4)
+        out["heavy_modules_loaded"] = sorted(
+            m for m in ("google.generativeai", "requests") if m in __import__("sys").modules
+        )
+print("__REPORT__" + json.dumps(out))
+"""
+
+
+def profile_cold_start(module: str = "backend.fastapi_app.main", top: int = 25) -> Dict[str, Any]:
+    """Import `module` in a fresh interpreter and measure import and first-request times."""
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "profile-placeholder")
+    env["WARMUP_ON_STARTUP"] = "0"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _COLD_START_SCRIPT.format(module=module)],
+        capture_output=True, text=True, env=env,
+    )
+    timings = {}
+    for line in proc.stdout.splitlines():
+        if line.startswith("__REPORT__"):
+            timings = json.loads(line[len("__REPORT__"):])
+    if proc.returncode != 0:
+        timings["error"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "timings": timings,
+        "slowest_imports": parse_importtime(proc.stderr, top),
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-timing delta (seconds) between two reports; positive means slower now."""
+    deltas = {}
+    for key, value in current.get("timings", {}).items():
+        old = baseline.get("timings", {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            deltas[key] = round(value - old, 4)
+    return deltas
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Cold-start profile for the API or a CLI module.")
+    parser.add_argument("--module", default="backend.fastapi_app.main")
+    parser.add_argument("--top", type=int, default=25, help="How many slow imports to list.")
+    parser.add_argument("--output", help="Write the JSON report to this path.")
+    parser.add_argument("--baseline", help="Compare against a previously saved report.")
+    args = parser.parse_args(argv)
+
+    report = profile_cold_start(args.module, args.top)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["delta_vs_baseline"] = compare_reports(report, json.load(f))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved startup profile to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Persisted student transcriptions.
+
+Transcribing a handwritten submission is the most expensive step, so every
+transcription is stored with its submission id, the SHA-256 of the PDF and
+the model version that produced it (transcribe tiers plus prompt hash). A
+failed grading, a grading-prompt change or a rubric regrade then reads the
+stored text instead of transcribing again, and transcription and grading can
+run as separate stages (see `worker transcribe` / `worker grade-stored`).
+Records also carry the PDF's duplicate fingerprint and, for a duplicate
+submission, the representative it was copied from (see duplicates.py).
+
+Like the grading queue, the store is a local SQLite file by default
+(TRANSCRIPTION_STORE_PATH) or, with TRANSCRIPTION_STORE_BACKEND=supabase, the
+`submission_transcriptions` table from
+backend/supabase/submission_transcriptions.sql and
+backend/supabase/submission_duplicates.sql, which is shared across nodes.
+"""
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from .registry import http_session
+
+
+class SQLiteTranscriptionStore:
+
+    def __init__(self, path: str = "transcriptions.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS submission_transcriptions (
+                submission_id TEXT NOT NULL,
+                assignment_id TEXT,
+                content_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                fingerprint TEXT,
+                duplicate_of TEXT,
+                PRIMARY KEY (submission_id, content_hash, model_version)
+            )
+            """
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(submission_transcriptions)")}
+        for column in ("fingerprint", "duplicate_of"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE submission_transcriptions ADD COLUMN {column} TEXT")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS submission_transcriptions_assignment_idx "
+            "ON submission_transcriptions (assignment_id)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, submission_id: str, assignment_id: Optional[str], content_hash: str, model_version: str,
+            transcript: str, fingerprint: Optional[str] = None, duplicate_of: Optional[str] = None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO submission_transcriptions "
+            "(submission_id, assignment_id, content_hash, model_version, transcript, created_at, fingerprint, "
+            "duplicate_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(submission_id), None if assignment_id is None else str(assignment_id), content_hash,
+             model_version, transcript, time.time(), fingerprint,
+             None if duplicate_of is None else str(duplicate_of)),
+        )
+
+    def get(self, submission_id: str, model_version: Optional[str] = None,
+            content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Newest transcription of a submission, optionally for one model version and/or PDF hash."""
+        query = "SELECT * FROM submission_transcriptions WHERE submission_id = ?"
+        params: List[Any] = [str(submission_id)]
+        if model_version is not None:
+            query += " AND model_version = ?"
+            params.append(model_version)
+        if content_hash is not None:
+            query += " AND content_hash = ?"
+            params.append(content_hash)
+        row = self._conn().execute(query + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+        return dict(row) if row else None
+
+    def find_duplicate(self, assignment_id: str, submission_id: str, content_hash: str,
+                       fingerprint: Optional[str], model_version: str) -> Optional[Dict[str, Any]]:
+        """Oldest transcription of another submission of the assignment with the same bytes or fingerprint."""
+        query = ("SELECT * FROM submission_transcriptions WHERE assignment_id = ? AND submission_id != ? "
+                 "AND model_version = ? AND (content_hash = ?")
+        params: List[Any] = [str(assignment_id), str(submission_id), model_version, content_hash]
+        if fingerprint is not None:
+            query += " OR fingerprint = ?"
+            params.append(fingerprint)
+        row = self._conn().execute(query + ") ORDER BY created_at LIMIT 1", params).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._conn().execute(
+            "SELECT model_version, COUNT(*) AS n FROM submission_transcriptions GROUP BY model_version"
+        ).fetchall()
+        return {"by_model_version": {row["model_version"]: row["n"] for row in rows},
+                "total": sum(row["n"] for row in rows)}
+
+
+_SELECT = "submission_id,assignment_id,content_hash,model_version,transcript,created_at,fingerprint,duplicate_of"
+
+
+class SupabaseTranscriptionStore:
+
+    def __init__(self, supabase_url: str, supabase_key: str):
+        self.url = f"{supabase_url.rstrip('/')}/rest/v1/submission_transcriptions"
+        self.headers = {
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
+    def put(self, submission_id: str, assignment_id: Optional[str], content_hash: str, model_version: str,
+            transcript: str, fingerprint: Optional[str] = None, duplicate_of: Optional[str] = None):
+        resp = http_session().post(
+            self.url,
+            params={"on_conflict": "submission_id,content_hash,model_version"},
+            headers={**self.headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+            json=[{
+                "submission_id": submission_id,
+                "assignment_id": assignment_id,
+                "content_hash": content_hash,
+                "model_version": model_version,
+                "transcript": transcript,
+                "fingerprint": fingerprint,
+                "duplicate_of": duplicate_of,
+            }],
+            timeout=30,
+        )
+        if resp.status_code not in (200, 201, 204):
+            raise Exception(f"Storing transcription failed: {resp.status_code} {resp.text}")
+
+    def get(self, submission_id: str, model_version: Optional[str] = None,
+            content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        params = {
+            "select": _SELECT,
+            "submission_id": f"eq.{submission_id}",
+            "order": "created_at.desc",
+            "limit": "1",
+        }
+        if model_version is not None:
+            params["model_version"] = f"eq.{model_version}"
+        if content_hash is not None:
+            params["content_hash"] = f"eq.{content_hash}"
+        resp = http_session().get(self.url, params=params, headers=self.headers, timeout=30)
+        if resp.status_code != 200:
+            raise Exception(f"Fetching transcription failed: {resp.status_code} {resp.text}")
+        rows = resp.json()
+        return rows[0] if rows else None
+
+    def find_duplicate(self, assignment_id: str, submission_id: str, content_hash: str,
+                       fingerprint: Optional[str], model_version: str) -> Optional[Dict[str, Any]]:
+        matches = f"content_hash.eq.{content_hash}"
+        if fingerprint is not None:
+            matches += f",fingerprint.eq.{fingerprint}"
+        params = {
+            "select": _SELECT,
+            "assignment_id": f"eq.{assignment_id}",
+            "submission_id": f"neq.{submission_id}",
+            "model_version": f"eq.{model_version}",
+            "or": f"({matches})",
+            "order": "created_at.asc",
+            "limit": "1",
+        }
+        resp = http_session().get(self.url, params=params, headers=self.headers, timeout=30)
+        if resp.status_code != 200:
+            raise Exception(f"Looking up duplicate transcriptions failed: {resp.status_code} {resp.text}")
+        rows = resp.json()
+        return rows[0] if rows else None
+
+    def stats(self) -> Dict[str, Any]:
+        resp = http_session().get(self.url, params={"select": "submission_id", "limit": "1"},
+                                  headers={**self.headers, "Prefer": "count=exact"}, timeout=30)
+        total = resp.headers.get("Content-Range", "*/0").split("/")[-1]
+        return {"total": int(total) if total.isdigit() else None}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_transcription_store():
+    """
+    Process-wide store selected by TRANSCRIPTION_STORE_BACKEND ('sqlite' or
+    'supabase'). SQLite is the default and stores its file at TRANSCRIPTION_STORE_PATH.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.environ.get("TRANSCRIPTION_STORE_BACKEND", "sqlite").lower()
+                if backend == "supabase":
+                    from .ai_utils import get_supabase_credentials
+                    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+                    _store = SupabaseTranscriptionStore(SUPABASE_URL, SUPABASE_KEY)
+                elif backend == "sqlite":
+                    _store = SQLiteTranscriptionStore(os.environ.get("TRANSCRIPTION_STORE_PATH", "transcriptions.db"))
+                else:
+                    raise ValueError(f"Unknown TRANSCRIPTION_STORE_BACKEND: {backend}")
+    return _store
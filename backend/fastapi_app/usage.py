@@ -0,0 +1,177 @@
+"""
+Token usage and cost accounting for model calls.
+
+Every generate_content call is recorded with its prompt, output and cached
+token counts (from response.usage_metadata) and latency. Totals are kept per
+submission, assignment and job: callers open a usage_scope(...) around the
+work, and the scope labels apply to every call made inside it, including calls
+made from threads started with contextvars.copy_context() or run_in_threadpool.
+
+A job can also be given a token budget. Past `throttle_at` of the budget each
+call is delayed by `throttle_seconds`; past the budget, check_budget() raises
+TokenBudgetExceeded and batch runs stop scheduling new submissions.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional
+
+
+# USD per 1M tokens: (input, output, cached input). Override or extend with
+# MODEL_PRICES_JSON='{"model": [input, output, cached]}'.
+MODEL_PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.03),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.01),
+    "gemini-2.5-pro": (1.25, 10.00, 0.125),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.environ.get("MODEL_PRICES_JSON", "{}")).items()})
+
+# Totals per submission/assignment/job are kept for the most recently used
+# USAGE_MAX_ENTRIES keys; the process-wide, per-model and per-kind totals always stay.
+USAGE_MAX_ENTRIES = int(os.environ.get("USAGE_MAX_ENTRIES", "10000"))
+_PINNED_LEVELS = ("all", "model", "kind")
+
+_scope: contextvars.ContextVar = contextvars.ContextVar("usage_scope", default={})
+
+
+class TokenBudgetExceeded(Exception):
+    pass
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0,
+            "total_tokens": 0, "latency_s": 0.0, "cost_usd": 0.0}
+
+
+def _usage_from_response(response) -> Dict[str, int]:
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return {"prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "total_tokens": 0}
+    prompt = getattr(meta, "prompt_token_count", 0) or 0
+    output = getattr(meta, "candidates_token_count", 0) or 0
+    cached = getattr(meta, "cached_content_token_count", 0) or 0
+    total = getattr(meta, "total_token_count", 0) or (prompt + output)
+    return {"prompt_tokens": prompt, "output_tokens": output, "cached_tokens": cached, "total_tokens": total}
+
+
+def estimate_cost(model_name: str, prompt_tokens: int, output_tokens: int, cached_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model_name)
+    if not prices:
+        return 0.0
+    input_price, output_price, cached_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price + output_tokens * output_price
+            + cached_tokens * cached_price) / 1_000_000
+
+
+class UsageLedger:
+
+    def __init__(self, max_entries: int = USAGE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._totals: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._scoped = 0
+        self._budgets: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, kind: str, model_name: str, response, latency_s: float,
+               scope: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        scope = _scope.get() if scope is None else scope
+        usage = _usage_from_response(response)
+        usage["latency_s"] = latency_s
+        usage["cost_usd"] = estimate_cost(model_name, usage["prompt_tokens"], usage["output_tokens"],
+                                          usage["cached_tokens"])
+        keys = [("all", "all"), ("model", model_name), ("kind", kind)]
+        keys += [(level, str(value)) for level, value in scope.items() if value is not None]
+        with self._lock:
+            for key in keys:
+                totals = self._totals.get(key)
+                if totals is None:
+                    totals = self._totals[key] = _empty_totals()
+                    self._scoped += key[0] not in _PINNED_LEVELS
+                self._totals.move_to_end(key)
+                totals["calls"] += 1
+                for field in ("prompt_tokens", "output_tokens", "cached_tokens", "total_tokens",
+                              "latency_s", "cost_usd"):
+                    totals[field] += usage[field]
+            self._evict()
+        return usage
+
+    def _evict(self):
+        while self._scoped > self.max_entries:
+            oldest = next(key for key in self._totals if key[0] not in _PINNED_LEVELS)
+            del self._totals[oldest]
+            self._scoped -= 1
+
+    def totals(self, level: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            totals = dict(self._totals.get((level, str(key)), _empty_totals()))
+        totals["latency_s"] = round(totals["latency_s"], 3)
+        totals["cost_usd"] = round(totals["cost_usd"], 6)
+        return totals
+
+    def summary(self, level: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = [key for (lvl, key) in self._totals if lvl == level]
+        return {key: self.totals(level, key) for key in keys}
+
+    def set_budget(self, job_id: str, max_tokens: int, throttle_at: float = 0.8, throttle_seconds: float = 5.0):
+        with self._lock:
+            self._budgets[str(job_id)] = {"max_tokens": int(max_tokens), "throttle_at": throttle_at,
+                                          "throttle_seconds": throttle_seconds}
+
+    def budget_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            budget = self._budgets.get(str(job_id))
+        if budget is None:
+            return None
+        used = self.totals("job", job_id)["total_tokens"]
+        return {**budget, "used_tokens": used,
+                "exceeded": used >= budget["max_tokens"],
+                "throttling": used >= budget["max_tokens"] * budget["throttle_at"]}
+
+    def check_budget(self):
+        """Call before each model call: throttles or raises for the current job's budget."""
+        job_id = _scope.get().get("job")
+        if job_id is None:
+            return
+        status = self.budget_status(job_id)
+        if status is None:
+            return
+        if status["exceeded"]:
+            raise TokenBudgetExceeded(
+                f"Job {job_id} used {status['used_tokens']} of {status['max_tokens']} budgeted tokens"
+            )
+        if status["throttling"]:
+            time.sleep(status["throttle_seconds"])
+
+
+usage_ledger = UsageLedger()
+
+
+@contextmanager
+def usage_scope(**labels):
+    """Attribute model calls inside the block to e.g. job=..., assignment=..., submission=..."""
+    token = _scope.set({**_scope.get(), **{k: v for k, v in labels.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def timed_generate(model, kind: str, model_name: str, *args,
+                   on_latency: Optional[Callable[[float], None]] = None, **kwargs):
+    """
+    model.generate_content(*args, **kwargs) with budget check and usage recording.
+    on_latency, if given, receives the generate_content time alone (no throttle wait).
+    """
+    usage_ledger.check_budget()
+    start = time.perf_counter()
+    response = model.generate_content(*args, **kwargs)
+    latency_s = time.perf_counter() - start
+    if on_latency is not None:
+        on_latency(latency_s)
+    usage_ledger.record(kind, model_name, response, latency_s)
+    return response
@@ -0,0 +1,274 @@
+import os
+import time
+import json
+import socket
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+
+from .registry import http_session
+
+
+# Seconds a claimed job stays invisible to other workers before it is re-queued.
+DEFAULT_LEASE_SECONDS = int(os.environ.get("GRADING_LEASE_SECONDS", "900"))
+# Attempts after which a job is parked as 'dead' instead of being re-queued.
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("GRADING_MAX_ATTEMPTS", "3"))
+
+
+def default_worker_id() -> str:
+    """Worker identity used as the lease owner: host name plus process id."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SQLiteSubmissionQueue:
+    """
+    Local stand-in for the shared grading queue, stored in a single SQLite file.
+
+    Every claim runs inside a BEGIN IMMEDIATE transaction, so several worker
+    processes on the same machine can share one file without ever leasing the
+    same job twice. Jobs whose lease has expired are claimable again.
+    """
+
+    def __init__(self, path: str = "grading_queue.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS grading_queue (
+                submission_id TEXT PRIMARY KEY,
+                assignment_id TEXT NOT NULL,
+                payload TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                enqueued_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS grading_queue_claim_idx "
+            "ON grading_queue (status, lease_expires_at, enqueued_at)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, submission_id: str, assignment_id: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+        """Add a submission to the queue. Returns False if it is already queued."""
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO grading_queue "
+            "(submission_id, assignment_id, payload, status, enqueued_at, updated_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?)",
+            (str(submission_id), str(assignment_id), json.dumps(payload or {}), now, now),
+        )
+        return cur.rowcount == 1
+
+    def claim(self, worker_id: str, limit: int = 1, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+              max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` pending (or lease-expired) jobs for `worker_id`.
+        Expired leases that used up max_attempts are left for requeue_expired to park.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT submission_id FROM grading_queue "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires_at < ? AND attempts < ?) "
+                "ORDER BY enqueued_at LIMIT ?",
+                (now, max_attempts, limit),
+            ).fetchall()
+            ids = [row["submission_id"] for row in rows]
+            for submission_id in ids:
+                conn.execute(
+                    "UPDATE grading_queue SET status = 'leased', lease_owner = ?, lease_expires_at = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE submission_id = ?",
+                    (worker_id, now + lease_seconds, now, submission_id),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._job(submission_id) for submission_id in ids]
+
+    def claim_submission(self, submission_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                         max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Optional[Dict[str, Any]]:
+        """Lease one specific job if it is claimable. Returns None if another worker holds it."""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE grading_queue SET status = 'leased', lease_owner = ?, lease_expires_at = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE submission_id = ? "
+            "AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ? AND attempts < ?))",
+            (worker_id, now + lease_seconds, now, str(submission_id), now, max_attempts),
+        )
+        return self._job(str(submission_id)) if cur.rowcount == 1 else None
+
+    def _job(self, submission_id: str) -> Dict[str, Any]:
+        row = self._conn().execute(
+            "SELECT * FROM grading_queue WHERE submission_id = ?", (submission_id,)
+        ).fetchone()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"] or "{}")
+        return job
+
+    def extend_lease(self, submission_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        """Heartbeat: push the lease deadline out while the job is still being worked on."""
+        cur = self._conn().execute(
+            "UPDATE grading_queue SET lease_expires_at = ?, updated_at = ? "
+            "WHERE submission_id = ? AND lease_owner = ? AND status = 'leased'",
+            (time.time() + lease_seconds, time.time(), str(submission_id), worker_id),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, submission_id: str, worker_id: str) -> bool:
+        cur = self._conn().execute(
+            "UPDATE grading_queue SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE submission_id = ? AND lease_owner = ?",
+            (time.time(), str(submission_id), worker_id),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, submission_id: str, worker_id: str, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        """Release a failed job back to 'pending', or park it as 'dead' after max_attempts."""
+        cur = self._conn().execute(
+            "UPDATE grading_queue SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, "
+            "lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+            "WHERE submission_id = ? AND lease_owner = ?",
+            (max_attempts, error, time.time(), str(submission_id), worker_id),
+        )
+        return cur.rowcount == 1
+
+    def requeue_expired(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """Return expired leases to 'pending' (or 'dead' once out of attempts)."""
+        cur = self._conn().execute(
+            "UPDATE grading_queue SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, "
+            "lease_owner = NULL, lease_expires_at = NULL, last_error = 'lease expired', updated_at = ? "
+            "WHERE status = 'leased' AND lease_expires_at < ?",
+            (max_attempts, time.time(), time.time()),
+        )
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM grading_queue GROUP BY status"
+        ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class SupabaseSubmissionQueue:
+    """
+    Shared grading queue backed by the `grading_queue` table in Supabase Postgres.
+
+    Claims go through the `claim_grading_jobs` RPC, which selects rows with
+    FOR UPDATE SKIP LOCKED, so workers on different nodes never lease the same
+    submission. See backend/supabase/grading_queue.sql for the schema.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str):
+        self.base_url = supabase_url.rstrip("/")
+        self.headers = {
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
+    def _rpc(self, name: str, params: Dict[str, Any]):
+        resp = http_session().post(f"{self.base_url}/rest/v1/rpc/{name}", headers=self.headers, json=params, timeout=30)
+        if resp.status_code not in (200, 204):
+            raise Exception(f"RPC {name} failed: {resp.status_code} {resp.text}")
+        return resp.json() if resp.content else None
+
+    def enqueue(self, submission_id: str, assignment_id: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+        resp = http_session().post(
+            f"{self.base_url}/rest/v1/grading_queue",
+            headers={**self.headers, "Prefer": "resolution=ignore-duplicates,return=representation"},
+            json=[{"submission_id": submission_id, "assignment_id": assignment_id, "payload": payload or {}}],
+            timeout=30,
+        )
+        if resp.status_code not in (200, 201):
+            raise Exception(f"Enqueue failed: {resp.status_code} {resp.text}")
+        return bool(resp.json())
+
+    def claim(self, worker_id: str, limit: int = 1, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+              max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> List[Dict[str, Any]]:
+        return self._rpc("claim_grading_jobs", {
+            "p_worker_id": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }) or []
+
+    def claim_submission(self, submission_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                         max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Optional[Dict[str, Any]]:
+        rows = self._rpc("claim_grading_job", {
+            "p_submission_id": submission_id,
+            "p_worker_id": worker_id,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }) or []
+        return rows[0] if rows else None
+
+    def extend_lease(self, submission_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        return bool(self._rpc("extend_grading_lease", {
+            "p_submission_id": submission_id,
+            "p_worker_id": worker_id,
+            "p_lease_seconds": lease_seconds,
+        }))
+
+    def complete(self, submission_id: str, worker_id: str) -> bool:
+        return bool(self._rpc("complete_grading_job", {
+            "p_submission_id": submission_id,
+            "p_worker_id": worker_id,
+        }))
+
+    def fail(self, submission_id: str, worker_id: str, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        return bool(self._rpc("fail_grading_job", {
+            "p_submission_id": submission_id,
+            "p_worker_id": worker_id,
+            "p_error": error,
+            "p_max_attempts": max_attempts,
+        }))
+
+    def requeue_expired(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        return int(self._rpc("requeue_expired_grading_jobs", {"p_max_attempts": max_attempts}) or 0)
+
+    def stats(self) -> Dict[str, int]:
+        return {row["status"]: row["n"] for row in (self._rpc("grading_queue_stats", {}) or [])}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_submission_queue():
+    """
+    Process-wide queue selected by GRADING_QUEUE_BACKEND ('sqlite' or 'supabase').
+    SQLite is the default and stores its file at GRADING_QUEUE_PATH.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                backend = os.environ.get("GRADING_QUEUE_BACKEND", "sqlite").lower()
+                if backend == "supabase":
+                    from .ai_utils import get_supabase_credentials
+                    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+                    _queue = SupabaseSubmissionQueue(SUPABASE_URL, SUPABASE_KEY)
+                elif backend == "sqlite":
+                    _queue = SQLiteSubmissionQueue(os.environ.get("GRADING_QUEUE_PATH", "grading_queue.db"))
+                else:
+                    raise ValueError(f"Unknown GRADING_QUEUE_BACKEND: {backend}")
+    return _queue
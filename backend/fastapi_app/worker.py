@@ -0,0 +1,232 @@
+"""
+Standalone grading worker.
+
+Run any number of these, on any number of nodes, against the same queue:
+
+    python -m backend.fastapi_app.worker enqueue <assignment_id>
+    python -m backend.fastapi_app.worker run [--batch-size N] [--once]
+
+Each worker leases submissions from the shared queue (see work_queue.py),
+grades them with the same pipeline as /final_grading, and marks them done.
+A background heartbeat keeps the lease alive while a job is running; if a
+worker dies, its lease expires and the job is picked up by another worker.
+A worker that loses its lease uploads nothing and leaves the job alone, and
+the "failed" results row is only written on a job's last attempt.
+"""
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from typing import Dict, Any
+
+from .ai_utils import (
+    setup_auth,
+    get_supabase_credentials,
+    get_assignment_texts,
+    rubric_usable,
+    iter_submission_pages,
+    grade_single_submission,
+    transcribe_submissions_for_assignment,
+    grade_stored_transcriptions,
+)
+from .file_cleanup import file_cleaner
+from .work_queue import (
+    get_submission_queue,
+    default_worker_id,
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_MAX_ATTEMPTS,
+)
+
+
+def enqueue_assignment(assignment_id: str, queue=None) -> int:
+    """Queue every submission of an assignment. Returns the number newly queued."""
+    queue = queue or get_submission_queue()
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    queued = 0
+    for page in iter_submission_pages(assignment_id, SUPABASE_URL, SUPABASE_KEY):
+        for sub in page:
+            if queue.enqueue(sub.get("id"), assignment_id, sub):
+                queued += 1
+    print(f"📥 Queued {queued} submissions for assignment {assignment_id}")
+    return queued
+
+
+class _LeaseHeartbeat:
+    """Extends a job's lease every lease_seconds / 3 until stopped. Sets `lost` if the lease is gone."""
+
+    def __init__(self, queue, submission_id: str, worker_id: str, lease_seconds: int):
+        self._stop = threading.Event()
+        self.lost = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(queue, submission_id, worker_id, lease_seconds), daemon=True
+        )
+
+    def _run(self, queue, submission_id, worker_id, lease_seconds):
+        while not self._stop.wait(max(1, lease_seconds // 3)):
+            try:
+                if not queue.extend_lease(submission_id, worker_id, lease_seconds):
+                    print(f"⚠️ Lost lease on submission {submission_id}")
+                    self.lost.set()
+                    return
+            except Exception as e:
+                print(f"⚠️ Lease heartbeat failed for {submission_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+def process_job(queue, job: Dict[str, Any], worker_id: str, lease_seconds: int,
+                SUPABASE_URL: str, SUPABASE_KEY: str, tmpdir: str,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Dict[str, Any]:
+    """
+    Grade one leased job and mark it done once its result is uploaded, or
+    release it for retry on failure. A job whose lease was lost is left to
+    whoever holds it now.
+    """
+    submission_id = job["submission_id"]
+    assignment_id = job["assignment_id"]
+    heartbeat = _LeaseHeartbeat(queue, submission_id, worker_id, lease_seconds)
+
+    def still_owned() -> bool:
+        return not heartbeat.lost.is_set() and queue.extend_lease(submission_id, worker_id, lease_seconds)
+
+    with heartbeat:
+        try:
+            question_txt, rubric_txt = get_assignment_texts(
+                assignment_id, SUPABASE_URL, SUPABASE_KEY, tmpdir
+            )
+            if not rubric_usable(rubric_txt):
+                raise Exception(f"Could not load the rubric for assignment {assignment_id}")
+            sub = job.get("payload") or {}
+            sub.setdefault("id", submission_id)
+            result = grade_single_submission(
+                sub, assignment_id, question_txt, rubric_txt, SUPABASE_URL, SUPABASE_KEY, tmpdir,
+                record_failure=job.get("attempts", 1) >= max_attempts, still_owned=still_owned
+            )
+        except Exception as e:
+            result = {"submission_id": submission_id, "status": "error", "detail": str(e)}
+
+    if result.get("status") == "lease_lost" or (heartbeat.lost.is_set() and result.get("status") != "graded"):
+        result["status"] = "lease_lost"
+    elif result.get("status") in ("graded", "skipped"):
+        queue.complete(submission_id, worker_id)
+    else:
+        queue.fail(submission_id, worker_id, result.get("detail") or result.get("status", "error"))
+    return result
+
+
+def grade_queued_submission(submission_id: str, worker_id: str = None,
+                            lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Dict[str, Any]:
+    """
+    Claim and grade one specific queued submission right away. Used by the
+    insert webhook; if a worker already holds the lease, this is a no-op.
+    """
+    setup_auth()
+    queue = get_submission_queue()
+    worker_id = worker_id or default_worker_id()
+    job = queue.claim_submission(submission_id, worker_id, lease_seconds)
+    if not job:
+        print(f"⏭️ Submission {submission_id} already claimed elsewhere")
+        return {"submission_id": submission_id, "status": "already_claimed"}
+
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    tmpdir = tempfile.mkdtemp(prefix="webhook_")
+    try:
+        return process_job(queue, job, worker_id, lease_seconds, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def run_worker(batch_size: int = 1, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+               poll_interval: float = 5.0, once: bool = False, worker_id: str = None) -> Dict[str, int]:
+    """
+    Claim-and-grade loop. Stops when the queue is empty if `once` is set,
+    otherwise polls forever.
+    """
+    setup_auth()
+    queue = get_submission_queue()
+    worker_id = worker_id or default_worker_id()
+    SUPABASE_URL, SUPABASE_KEY = get_supabase_credentials()
+    tmpdir = tempfile.mkdtemp(prefix="worker_")
+    file_cleaner.start(sweep=True)
+
+    counts = {"graded": 0, "failed": 0, "lease_lost": 0}
+
+    print(f"👷 Worker {worker_id} started")
+    try:
+        while True:
+            requeued = queue.requeue_expired()
+            if requeued:
+                print(f"♻️ Re-queued {requeued} expired leases")
+
+            jobs = queue.claim(worker_id, limit=batch_size, lease_seconds=lease_seconds)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            for job in jobs:
+                result = process_job(queue, job, worker_id, lease_seconds, SUPABASE_URL, SUPABASE_KEY, tmpdir)
+                if result.get("status") in ("graded", "skipped"):
+                    counts["graded"] += 1
+                elif result.get("status") == "lease_lost":
+                    counts["lease_lost"] += 1
+                else:
+                    counts["failed"] += 1
+    except KeyboardInterrupt:
+        print(f"🛑 Worker {worker_id} interrupted")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"👷 Worker {worker_id} finished: {counts}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grading worker for the shared submission queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="Queue all submissions of an assignment.")
+    enqueue.add_argument("assignment_id")
+
+    run = sub.add_parser("run", help="Claim and grade queued submissions.")
+    run.add_argument("--batch-size", type=int, default=1)
+    run.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS)
+    run.add_argument("--poll-interval", type=float, default=5.0)
+    run.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+    run.add_argument("--worker-id", default=None)
+
+    sub.add_parser("stats", help="Show queue counts by status.")
+
+    transcribe = sub.add_parser("transcribe", help="Transcription stage only: store transcriptions of an assignment.")
+    transcribe.add_argument("assignment_id")
+    transcribe.add_argument("--workers", type=int, default=4)
+    transcribe.add_argument("--force", action="store_true", help="Re-transcribe even if a transcription is stored.")
+
+    grade_stored = sub.add_parser("grade-stored", help="Grading stage only: grade from stored transcriptions.")
+    grade_stored.add_argument("assignment_id")
+    grade_stored.add_argument("--workers", type=int, default=4)
+
+    args = parser.parse_args(argv)
+    if args.command == "enqueue":
+        enqueue_assignment(args.assignment_id)
+    elif args.command == "run":
+        run_worker(args.batch_size, args.lease_seconds, args.poll_interval, args.once, args.worker_id)
+    elif args.command == "stats":
+        print(get_submission_queue().stats())
+    elif args.command == "transcribe":
+        print(transcribe_submissions_for_assignment(args.assignment_id, args.workers, args.force)["counts"])
+    elif args.command == "grade-stored":
+        print(grade_stored_transcriptions(args.assignment_id, args.workers)["counts"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+-- Shared grading queue for horizontally scaled workers.
+-- Apply in the Supabase SQL editor (safe to re-apply after upgrading). Workers
+-- call these functions through PostgREST (/rest/v1/rpc/<name>); see
+-- backend/fastapi_app/work_queue.py.
+
+create table if not exists grading_queue (
+    submission_id    text primary key,
+    assignment_id    text not null,
+    payload          jsonb not null default '{}'::jsonb,
+    status           text not null default 'pending',  -- pending | leased | done | dead
+    attempts         integer not null default 0,
+    lease_owner      text,
+    lease_expires_at timestamptz,
+    last_error       text,
+    enqueued_at      timestamptz not null default now(),
+    updated_at       timestamptz not null default now()
+);
+
+create index if not exists grading_queue_claim_idx
+    on grading_queue (status, lease_expires_at, enqueued_at);
+
+-- Earlier versions took no p_max_attempts; drop them so PostgREST doesn't see two overloads.
+drop function if exists claim_grading_jobs(text, integer, integer);
+drop function if exists claim_grading_job(text, text, integer);
+
+-- Lease up to p_limit jobs. SKIP LOCKED lets concurrent workers claim
+-- disjoint rows without blocking on each other. Expired leases that used up
+-- p_max_attempts are left for requeue_expired_grading_jobs to park as dead.
+create or replace function claim_grading_jobs(p_worker_id text, p_limit integer, p_lease_seconds integer,
+                                              p_max_attempts integer)
+returns setof grading_queue
+language sql
+as $$
+    update grading_queue q
+       set status = 'leased',
+           lease_owner = p_worker_id,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = q.attempts + 1,
+           updated_at = now()
+     where q.submission_id in (
+        select submission_id
+          from grading_queue
+         where status = 'pending'
+            or (status = 'leased' and lease_expires_at < now() and attempts < p_max_attempts)
+         order by enqueued_at
+         limit p_limit
+         for update skip locked
+     )
+    returning q.*;
+$$;
+
+-- Lease one specific job, e.g. right after the insert webhook queued it.
+create or replace function claim_grading_job(p_submission_id text, p_worker_id text, p_lease_seconds integer,
+                                             p_max_attempts integer)
+returns setof grading_queue
+language sql
+as $$
+    update grading_queue q
+       set status = 'leased',
+           lease_owner = p_worker_id,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = q.attempts + 1,
+           updated_at = now()
+     where q.submission_id in (
+        select submission_id
+          from grading_queue
+         where submission_id = p_submission_id
+           and (status = 'pending'
+                or (status = 'leased' and lease_expires_at < now() and attempts < p_max_attempts))
+         for update skip locked
+     )
+    returning q.*;
+$$;
+
+create or replace function extend_grading_lease(p_submission_id text, p_worker_id text, p_lease_seconds integer)
+returns boolean
+language sql
+as $$
+    with updated as (
+        update grading_queue
+           set lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+               updated_at = now()
+         where submission_id = p_submission_id
+           and lease_owner = p_worker_id
+           and status = 'leased'
+        returning 1
+    )
+    select exists (select 1 from updated);
+$$;
+
+create or replace function complete_grading_job(p_submission_id text, p_worker_id text)
+returns boolean
+language sql
+as $$
+    with updated as (
+        update grading_queue
+           set status = 'done', lease_owner = null, lease_expires_at = null, updated_at = now()
+         where submission_id = p_submission_id
+           and lease_owner = p_worker_id
+        returning 1
+    )
+    select exists (select 1 from updated);
+$$;
+
+create or replace function fail_grading_job(p_submission_id text, p_worker_id text, p_error text, p_max_attempts integer)
+returns boolean
+language sql
+as $$
+    with updated as (
+        update grading_queue
+           set status = case when attempts >= p_max_attempts then 'dead' else 'pending' end,
+               lease_owner = null, lease_expires_at = null,
+               last_error = p_error, updated_at = now()
+         where submission_id = p_submission_id
+           and lease_owner = p_worker_id
+        returning 1
+    )
+    select exists (select 1 from updated);
+$$;
+
+create or replace function requeue_expired_grading_jobs(p_max_attempts integer)
+returns integer
+language sql
+as $$
+    with updated as (
+        update grading_queue
+           set status = case when attempts >= p_max_attempts then 'dead' else 'pending' end,
+               lease_owner = null, lease_expires_at = null,
+               last_error = 'lease expired', updated_at = now()
+         where status = 'leased'
+           and lease_expires_at < now()
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
+
+create or replace function grading_queue_stats()
+returns table (status text, n bigint)
+language sql
+as $$
+    select status, count(*) from grading_queue group by status;
+$$;
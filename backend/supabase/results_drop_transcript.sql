@@ -0,0 +1,3 @@
+-- Student transcriptions now live in submission_transcriptions
+-- (submission_transcriptions.sql); apply after results_rubric_version.sql.
+alter table results drop column if exists transcript;
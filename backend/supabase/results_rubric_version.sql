@@ -0,0 +1,5 @@
+-- Rubric entry hashes and the student transcription each result was graded
+-- with, written by upload_results and used by regrade.py to regrade only the
+-- questions a rubric edit affects.
+alter table results add column if not exists rubric_hashes jsonb;
+alter table results add column if not exists transcript text;
@@ -0,0 +1,2 @@
+-- Per-submission model token and cost totals written by upload_results.
+alter table results add column if not exists token_usage jsonb;
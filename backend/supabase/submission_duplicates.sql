@@ -0,0 +1,11 @@
+-- Duplicate-submission detection (duplicates.py): each stored transcription
+-- records its PDF fingerprint and, for a duplicate, the representative
+-- submission it was copied from; copied results record the same.
+alter table submission_transcriptions add column if not exists fingerprint text;
+alter table submission_transcriptions add column if not exists duplicate_of text;
+create index if not exists submission_transcriptions_content_idx
+    on submission_transcriptions (assignment_id, content_hash);
+create index if not exists submission_transcriptions_fingerprint_idx
+    on submission_transcriptions (assignment_id, fingerprint);
+
+alter table results add column if not exists duplicate_of text;
@@ -0,0 +1,16 @@
+-- Stored student transcriptions (transcription_store.py), one row per
+-- submission, PDF content hash and transcription model version.
+create table if not exists submission_transcriptions (
+    submission_id text not null,
+    assignment_id text,
+    content_hash text not null,
+    model_version text not null,
+    transcript text not null,
+    created_at timestamptz not null default now(),
+    primary key (submission_id, content_hash, model_version)
+);
+
+create index if not exists submission_transcriptions_assignment_idx
+    on submission_transcriptions (assignment_id);
+create index if not exists submission_transcriptions_latest_idx
+    on submission_transcriptions (submission_id, created_at desc);
@@ -0,0 +1,85 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.fastapi_app import batch_grading, main
+
+
+def _stub_supabase(monkeypatch, texts):
+    monkeypatch.setattr(batch_grading, "setup_auth", lambda: None)
+    monkeypatch.setattr(batch_grading, "get_supabase_credentials", lambda: ("http://supabase.test", "key"))
+    monkeypatch.setattr(batch_grading, "get_assignment_texts", lambda aid, *args: texts[aid])
+    monkeypatch.setattr(batch_grading, "fetch_submission_page",
+                        lambda aid, url, key, after_id=None: ([{"id": f"{aid}-1"}, {"id": f"{aid}-2"}], None))
+    graded = []
+
+    def grade(sub, aid, question_txt, rubric_txt, *args):
+        graded.append((sub["id"], rubric_txt))
+        return {"submission_id": sub["id"], "status": "graded"}
+
+    monkeypatch.setattr(batch_grading, "grade_single_submission", grade)
+    return graded
+
+
+def test_assignment_without_a_rubric_is_marked_failed(monkeypatch):
+    graded = _stub_supabase(monkeypatch, {"a1": ("q1", "1) 0; Wrong, 2; Right"), "a2": ("q2", "")})
+    report = batch_grading.grade_assignments(["a1", "a2"], max_workers=2)
+    assert sorted(graded) == [("a1-1", "1) 0; Wrong, 2; Right"), ("a1-2", "1) 0; Wrong, 2; Right")]
+    assert report["assignments"]["a1"]["state"] == "done"
+    assert report["assignments"]["a2"]["state"] == "error"
+    assert report["state"] == "done"
+
+
+def test_finished_jobs_are_evicted(monkeypatch):
+    monkeypatch.setattr(batch_grading, "_jobs", {})
+    monkeypatch.setattr(batch_grading, "MAX_FINISHED_JOBS", 2)
+    old = [batch_grading.start_batch(["a1"]) for _ in range(3)]
+    for job_id in old:
+        batch_grading._jobs[job_id].finish()
+    running = batch_grading.start_batch(["a1"])
+    assert old[0] not in batch_grading._jobs
+    assert all(job_id in batch_grading._jobs for job_id in old[1:] + [running])
+
+    batch_grading._jobs[old[1]].finished_at = time.time() - batch_grading.FINISHED_JOB_TTL_SECONDS - 1
+    batch_grading.start_batch(["a1"])
+    assert old[1] not in batch_grading._jobs
+    assert batch_grading.get_batch_progress(running)["state"] == "running"
+
+
+def test_batch_endpoint_rejects_bad_max_workers(monkeypatch):
+    started = []
+    monkeypatch.setattr(main, "grade_assignments", lambda *args: started.append(args))
+    client = TestClient(main.app)
+    for bad in ("lots", 0, 10_000):
+        resp = client.post("/final_grading/batch", json={"assignment_ids": ["a1"], "max_workers": bad})
+        assert resp.status_code == 400
+    assert client.post("/final_grading/batch", json={"assignment_ids": ["a1"], "max_workers": "4"}).status_code == 202
+    assert started and started[0][1] == 4
+
+
+def test_failed_rubric_transcription_is_not_cached(monkeypatch):
+    from backend.fastapi_app import ai_utils
+
+    loads = iter([("q", "Error: model overloaded"), ("q", "1) 0; Wrong, 2; Right")])
+    monkeypatch.setattr(ai_utils, "load_assignment_texts", lambda *args: next(loads))
+    monkeypatch.setattr(ai_utils, "_assignment_text_cache", {})
+    assert ai_utils.get_assignment_texts("a1", "url", "key", "/tmp")[1].startswith("Error:")
+    assert ai_utils.get_assignment_texts("a1", "url", "key", "/tmp")[1] == "1) 0; Wrong, 2; Right"
+    assert ai_utils.get_assignment_texts("a1", "url", "key", "/tmp")[1] == "1) 0; Wrong, 2; Right"
+
+
+def test_budget_stop_records_the_dropped_backlog(monkeypatch):
+    graded = _stub_supabase(monkeypatch, {"a1": ("q1", "1) 0; Wrong, 2; Right")})
+    monkeypatch.setattr(batch_grading, "fetch_submission_page",
+                        lambda aid, url, key, after_id=None: ([{"id": f"{aid}-{i}"} for i in range(4)], None))
+    monkeypatch.setattr(batch_grading.usage_ledger, "budget_status",
+                        lambda job_id: {"exceeded": bool(graded)})
+
+    report = batch_grading.grade_assignments(["a1"], max_workers=1)
+
+    entry = report["assignments"]["a1"]
+    assert len(graded) == 1
+    assert (entry["total"], entry["done"], entry["graded"], entry["not_attempted"]) == (4, 4, 1, 3)
+    assert entry["state"] == "done"
+    assert report["state"] == "budget_exceeded"
+    assert sorted(r["status"] for r in report["results"]["a1"]) == ["graded"] + ["not_attempted"] * 3
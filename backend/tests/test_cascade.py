@@ -0,0 +1,44 @@
+import pytest
+
+from backend.fastapi_app import cascade
+from backend.fastapi_app.cascade import CascadeStats, run_cascade
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    stats = CascadeStats()
+    monkeypatch.setattr(cascade, "cascade_stats", stats)
+    return stats
+
+
+def _check(result):
+    return None if result.startswith("ok") else "too_short"
+
+
+def test_escalates_on_failed_check_and_stops_at_first_pass(stats):
+    tried = []
+
+    def attempt(model_name):
+        tried.append(model_name)
+        return "ok from flash" if model_name == "flash" else "?"
+
+    assert run_cascade("transcription", ["lite", "flash", "pro"], attempt, _check) == "ok from flash"
+    assert tried == ["lite", "flash"]
+    snapshot = stats.snapshot()["transcription"]
+    assert snapshot["lite"]["escalated"] == 1 and snapshot["lite"]["reasons"] == {"too_short": 1}
+    assert snapshot["flash"]["accepted"] == 1
+    assert "pro" not in snapshot
+
+
+def test_first_tier_pass_does_not_escalate():
+    tried = []
+    assert run_cascade("grading", ["lite", "flash"], lambda m: tried.append(m) or "ok", _check) == "ok"
+    assert tried == ["lite"]
+
+
+def test_returns_last_tier_output_when_every_tier_fails(stats):
+    result = run_cascade("grading", ["lite", "flash"], lambda m: f"bad from {m}", _check)
+    assert result == "bad from flash"
+    snapshot = stats.snapshot()["grading"]
+    assert (snapshot["lite"]["escalated"], snapshot["lite"]["failed_final"]) == (1, 0)
+    assert (snapshot["flash"]["escalated"], snapshot["flash"]["failed_final"]) == (0, 1)
@@ -0,0 +1,101 @@
+import json
+import threading
+import zlib
+
+from backend.fastapi_app import duplicates
+from backend.fastapi_app.duplicates import DuplicateGradings, pdf_fingerprint
+
+GRADING = json.dumps({"results": [{"question": "1", "score": 2}], "overall_feedback": ""})
+KEY = ("a1", "rubric", "pdf")
+
+
+def _pdf(tmp_path, name, *pages, meta=b""):
+    parts = [b"%PDF-1.4\n", meta]
+    for i, page in enumerate(pages):
+        body = zlib.compress(page)
+        parts.append(b"%d 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n" % (i + 1, len(body)))
+        parts.append(body + b"\nendstream\nendobj\n")
+    path = tmp_path / name
+    path.write_bytes(b"".join(parts))
+    return str(path)
+
+
+def test_fingerprint_ignores_metadata_but_not_page_order(tmp_path):
+    a = _pdf(tmp_path, "a.pdf", b"page one", b"page two", meta=b"% saved by viewer A\n")
+    resaved = _pdf(tmp_path, "b.pdf", b"page one", b"page two", meta=b"% saved by viewer B, later\n")
+    reordered = _pdf(tmp_path, "c.pdf", b"page two", b"page one")
+    assert pdf_fingerprint(a) == pdf_fingerprint(resaved)
+    assert pdf_fingerprint(a) != pdf_fingerprint(reordered)
+
+
+def test_fingerprint_inflates_in_bounded_chunks(tmp_path, monkeypatch):
+    page = b"x" * 10_000
+    monkeypatch.setattr(duplicates, "FINGERPRINT_CHUNK_BYTES", 1024)
+    chunked = pdf_fingerprint(_pdf(tmp_path, "a.pdf", page))
+    monkeypatch.setattr(duplicates, "FINGERPRINT_CHUNK_BYTES", 1 << 20)
+    assert chunked == pdf_fingerprint(_pdf(tmp_path, "b.pdf", page))
+
+    # Past the inflation cap the stream is compared compressed instead.
+    monkeypatch.setattr(duplicates, "FINGERPRINT_MAX_INFLATED_BYTES", 5_000)
+    assert pdf_fingerprint(_pdf(tmp_path, "c.pdf", page)) != chunked
+
+
+def test_only_duplicates_reuse_a_remembered_grading():
+    cache = DuplicateGradings()
+    calls = []
+
+    def grade_as(submission_id):
+        return lambda: calls.append(submission_id) or (GRADING, submission_id)
+
+    assert cache.grade(KEY, "s1", grade_as("s1"), reuse=False) == (GRADING, "s1")
+    assert cache.grade(KEY, "s1", grade_as("s1"), reuse=False) == (GRADING, "s1")
+    assert cache.grade(KEY, "s2", grade_as("s2"), reuse=True) == (GRADING, "s1")
+    assert calls == ["s1", "s1"]
+    assert cache.stats()["copied"] == 1
+
+
+def test_failed_gradings_are_not_remembered():
+    cache = DuplicateGradings()
+    usable = lambda grading: isinstance(grading, str) and grading.startswith("{")
+    cache.grade(KEY, "s1", lambda: ({"error": "blocked"}, "s1"), reuse=False, cacheable=usable)
+    cache.grade(KEY, "s1", lambda: ("not json", "s1"), reuse=False, cacheable=usable)
+    assert cache.stats()["remembered"] == 0
+    assert cache.grade(KEY, "s2", lambda: (GRADING, "s2"), cacheable=usable) == (GRADING, "s2")
+
+
+def test_concurrent_duplicates_share_one_grading():
+    cache = DuplicateGradings()
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def slow_grade():
+        calls.append("s1")
+        started.set()
+        release.wait(2)
+        return GRADING, "s1"
+
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("s1", cache.grade(KEY, "s1", slow_grade, reuse=False)))
+    first.start()
+    started.wait(2)
+    second = threading.Thread(target=lambda: results.setdefault("s2", cache.grade(KEY, "s2", lambda: (None, "s2"))))
+    second.start()
+    release.set()
+    first.join(2)
+    second.join(2)
+    assert results == {"s1": (GRADING, "s1"), "s2": (GRADING, "s1")}
+    assert calls == ["s1"]
+
+
+def test_rerunning_grading_calls_the_model_again(monkeypatch):
+    from backend.fastapi_app import ai_utils
+
+    calls = []
+    monkeypatch.setattr(ai_utils, "duplicate_gradings", DuplicateGradings())
+    monkeypatch.setattr(ai_utils, "grade_answers", lambda *args: calls.append(args) or GRADING)
+    monkeypatch.setattr(ai_utils, "upload_results", lambda *args, **kwargs: True)
+    sub = {"id": "s1", "user_id": "u1"}
+    for _ in range(2):
+        result = ai_utils.grade_transcribed_submission(sub, "a1", "q", "1) 0; Wrong, 2; Right", "1) 4",
+                                                       "http://s.test", "k", duplicate_key="pdf")
+        assert result["status"] == "graded"
+    assert len(calls) == 2
@@ -0,0 +1,22 @@
+from backend.fastapi_app import file_cleanup
+from backend.fastapi_app.file_cleanup import FileCleaner
+
+
+def test_sweep_configures_auth_before_listing_files(monkeypatch):
+    import google.generativeai as genai
+
+    calls = []
+    monkeypatch.setattr(file_cleanup, "configure_auth", lambda: calls.append("auth"))
+    monkeypatch.setattr(genai, "list_files", lambda: calls.append("list") or [])
+    assert FileCleaner().sweep() == 0
+    assert calls == ["auth", "list"]
+
+
+def test_stop_is_registered_at_exit_once(monkeypatch):
+    registered = []
+    monkeypatch.setattr(file_cleanup.atexit, "register", registered.append)
+    cleaner = FileCleaner(interval_s=0.01)
+    for _ in range(3):
+        cleaner.start()
+        cleaner.stop()
+    assert len(registered) == 1
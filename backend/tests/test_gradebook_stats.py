@@ -0,0 +1,81 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from backend.fastapi_app.gradebook_stats import GradebookStats
+
+
+def _result(*scores):
+    return [{"question": f"{i + 1}", "score": s} for i, s in enumerate(scores)]
+
+
+@pytest.fixture
+def gradebook(tmp_path):
+    return GradebookStats(str(tmp_path / "gradebook.db"))
+
+
+def test_aggregates_match_a_full_scan(gradebook):
+    rows = {"s1": (2, 3), "s2": (0, 3), "s3": (2, 1), "s4": (1, 0), "s5": (2, 3)}
+    for submission_id, scores in rows.items():
+        gradebook.record("a1", submission_id, "graded", _result(*scores), sum(scores))
+    summary = gradebook.summary("a1")
+
+    table = np.array(list(rows.values()), dtype=float)
+    for i, question in enumerate(summary["questions"]):
+        column = table[:, i]
+        assert question["question"] == str(i + 1)
+        assert question["count"] == column.size
+        assert question["mean"] == round(column.mean(), 4)
+        assert question["median"] == np.median(column)
+        assert question["std"] == round(column.std(), 4)
+        assert (question["min"], question["max"]) == (column.min(), column.max())
+    assert summary["questions"][0]["distribution"] == {"0": 1, "1": 1, "2": 3}
+    overall = table.sum(axis=1)
+    assert summary["overall"]["median"] == np.median(overall)
+    assert summary["overall"]["histogram"]["counts"] == np.histogram(overall, bins=10, range=(0, 5))[0].tolist()
+
+
+def test_rewriting_a_submission_replaces_its_scores(gradebook):
+    gradebook.record("a1", "s1", "graded", _result(1, 1), 2)
+    gradebook.record("a1", "s2", "graded", _result(3, 3), 6)
+    gradebook.record("a1", "s1", "graded", _result(2, 2), 4)
+    summary = gradebook.summary("a1")
+    assert summary["graded"] == 2
+    assert summary["questions"][0]["distribution"] == {"2": 1, "3": 1}
+    assert summary["overall"]["mean"] == 5.0
+
+
+def test_failed_attempts_are_counted_but_never_hide_a_grade(gradebook):
+    gradebook.record("a1", "s1", "graded", _result(2), 2)
+    gradebook.record("a1", "s1", "failed")
+    gradebook.record("a1", "s2", "failed")
+    summary = gradebook.summary("a1")
+    assert (summary["submissions"], summary["graded"], summary["failed"]) == (2, 1, 1)
+    assert summary["overall"]["count"] == 1
+    assert gradebook.summary("a1")["cached"] is True
+
+
+def test_rebuild_keeps_failed_submissions(gradebook):
+    gradebook.record("a1", "old", "graded", _result(5), 5)
+    gradebook.rebuild("a1", [
+        {"submission_id": "s1", "processing_status": "graded", "result_json": _result(1), "overall_score": 1},
+        {"submission_id": "s2", "processing_status": "failed", "result_json": None, "overall_score": None},
+    ])
+    summary = gradebook.summary("a1")
+    assert (summary["submissions"], summary["graded"], summary["failed"]) == (2, 1, 1)
+    assert summary["questions"][0]["distribution"] == {"1": 1}
+
+
+def test_existing_gradebook_files_are_backfilled(tmp_path):
+    path = str(tmp_path / "gradebook.db")
+    GradebookStats(path).record("a1", "s1", "graded", _result(2, 1), 3)
+    conn = sqlite3.connect(path)
+    for table in ("gradebook_status_counts", "gradebook_question_scores", "gradebook_overall_scores"):
+        conn.execute(f"DROP TABLE {table}")
+    conn.commit()
+    conn.close()
+
+    summary = GradebookStats(path).summary("a1")
+    assert summary["graded"] == 1
+    assert [q["mean"] for q in summary["questions"]] == [2.0, 1.0]
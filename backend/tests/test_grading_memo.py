@@ -0,0 +1,52 @@
+import json
+
+from backend.fastapi_app import ai_utils
+from backend.fastapi_app.grading_memo import split_by_question
+
+
+RUBRIC = "1.a) 0; Wrong, 2; Correct\n1.b) 0; Wrong, 3; Correct\n2) 0; Wrong, 5; Correct"
+
+
+def test_split_by_question_reads_numbered_and_part_labels():
+    text = "Question: 1.a) x = 4\nb) y = 2\n2) proof\ncontinued"
+    assert split_by_question(text) == {"1.a": "x = 4", "1.b": "y = 2", "2": "proof\ncontinued"}
+
+
+def test_split_by_question_keeps_numbered_steps_inside_an_answer():
+    transcript = "1.a) x = 4\n1.b) y = 2\n2) 1. expand\n2. simplify\n3. conclude"
+    labels = list(split_by_question(RUBRIC))
+    assert split_by_question(transcript) != split_by_question(transcript, labels)
+    assert split_by_question(transcript, labels) == {
+        "1.a": "x = 4",
+        "1.b": "y = 2",
+        "2": "1. expand\n2. simplify\n3. conclude",
+    }
+
+
+def test_split_by_question_keeps_a_numbered_list_that_restarts_at_one():
+    transcript = "Answer 1: standardize\nSteps:\n1. subtract mean\n2. divide by std\nAnswer 2: 42"
+    assert split_by_question(transcript, ["1", "2"]) == {
+        "1": "standardize\nSteps:\n1. subtract mean\n2. divide by std",
+        "2": "42",
+    }
+
+
+def test_split_by_question_only_moves_forward_through_rubric_labels():
+    transcript = "2) see working\n1.a) earlier note"
+    assert split_by_question(transcript, ["1.a", "2"]) == {"2": "see working\n1.a) earlier note"}
+
+
+def test_grade_answers_sends_original_transcript_with_skip_list(monkeypatch):
+    rubric = "1) 0; Blank, 2; Any attempt\n2) 0; Wrong, 5; Correct"
+    transcript = "1) my answer\n2) 1. first step\n2. second step"
+    seen = {}
+
+    def fake_grade(rubric_text, question_text, student_answer, model_name, skip_questions=None):
+        seen["answer"], seen["skip"] = student_answer, skip_questions
+        return json.dumps({"results": [{"question": "2", "score": 5, "reason": "ok"}], "overall_feedback": ""})
+
+    monkeypatch.setattr(ai_utils, "grade_student_answer", fake_grade)
+    grading = json.loads(ai_utils.grade_answers(None, rubric, "", transcript, model_name="test-model"))
+    assert seen == {"answer": transcript, "skip": ["1"]}
+    assert [item["question"] for item in grading["results"]] == ["1", "2"]
+    assert grading["total_score"] == 7
@@ -0,0 +1,82 @@
+import threading
+from types import SimpleNamespace
+
+from backend.fastapi_app import hedging, usage
+from backend.fastapi_app.hedging import HedgeController
+
+KEY = ("grading", "m")
+
+
+def test_deadline_is_the_latency_percentile_once_there_is_history():
+    controller = HedgeController(percentile=80, min_samples=5, min_delay_s=0.0)
+    for latency in (1, 2, 3, 4):
+        controller.observe(KEY, latency)
+    assert controller.deadline(KEY) is None
+    for latency in (10, 9, 8, 7, 6, 5):
+        controller.observe(KEY, latency)
+    assert controller.deadline(KEY) == 9
+    assert HedgeController(percentile=80, min_samples=1, min_delay_s=30.0).deadline(KEY) is None
+    floored = HedgeController(percentile=80, min_samples=1, min_delay_s=30.0)
+    floored.observe(KEY, 2.0)
+    assert floored.deadline(KEY) == 30.0
+
+
+def _slow_controller(max_rate):
+    controller = HedgeController(percentile=50, max_rate=max_rate, min_samples=1, min_delay_s=0.01)
+    controller.observe(KEY, 0.01)
+    return controller
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    controller = _slow_controller(max_rate=1.0)
+    release = threading.Event()
+    started = []
+
+    def request(on_latency):
+        started.append(1)
+        if len(started) == 1:
+            release.wait(5)
+            return "primary"
+        on_latency(0.02)
+        return "hedge"
+
+    assert controller.call(*KEY, request) == "hedge"
+    release.set()
+    stats = controller.stats()
+    assert (stats["calls"], stats["hedged"], stats["hedge_won"]) == (1, 1, 1)
+
+
+def test_hedges_are_capped_at_max_rate():
+    controller = _slow_controller(max_rate=0.5)
+    calls = []
+
+    def request(on_latency):
+        # Latency isn't reported, so the deadline stays at 0.01s and every call is slow enough to hedge.
+        calls.append(1)
+        threading.Event().wait(0.1)
+        return "done"
+
+    for _ in range(4):
+        assert controller.call(*KEY, request) == "done"
+    stats = controller.stats()
+    assert (stats["hedged"], stats["suppressed_by_cap"], stats["hedge_rate"]) == (2, 2, 0.5)
+    assert len(calls) == 6
+
+
+def test_throttle_wait_is_not_counted_as_model_latency(monkeypatch):
+    class ThrottlingLedger:
+        def check_budget(self):
+            threading.Event().wait(0.2)
+
+        def record(self, *args):
+            pass
+
+    monkeypatch.setattr(usage, "usage_ledger", ThrottlingLedger())
+    monkeypatch.setattr(hedging, "HEDGE_REQUESTS", True)
+    controller = HedgeController(min_samples=1)
+    monkeypatch.setattr(hedging, "hedge_controller", controller)
+    model = SimpleNamespace(generate_content=lambda *args, **kwargs: "response")
+
+    assert hedging.hedged_generate(model, *KEY, "prompt") == "response"
+    assert controller.stats()["calls"] == 1
+    assert max(controller._latencies[KEY]) < 0.1
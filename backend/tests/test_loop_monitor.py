@@ -0,0 +1,66 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from backend.fastapi_app.loop_monitor import LoopLagMonitor
+
+
+async def slow_handler():
+    time.sleep(0.4)
+
+
+def _app():
+    return SimpleNamespace(routes=[SimpleNamespace(endpoint=slow_handler, methods={"POST"}, path="/slow")])
+
+
+def test_blocked_loop_records_lag_and_names_the_stalled_route():
+    monitor = LoopLagMonitor(interval_s=0.02, threshold_s=0.1)
+
+    async def scenario():
+        monitor.start(_app())
+        await asyncio.sleep(0.1)
+        request_id = monitor.request_started("POST", "/slow")
+        await slow_handler()
+        monitor.request_finished(request_id)
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    stats = monitor.stats()
+    assert stats["max_lag_s"] >= 0.3
+    assert stats["stalls"] == 1
+    stall = stats["recent_stalls"][0]
+    assert stall["route"] == "POST /slow"
+    assert [r["path"] for r in stall["in_flight"]] == ["/slow"]
+    assert stall["lag_s"] >= 0.3
+    assert stats["in_flight"] == 0
+
+
+def test_start_and_stop_lifecycle():
+    monitor = LoopLagMonitor(interval_s=0.01, threshold_s=0.5)
+
+    async def scenario():
+        monitor.start()
+        ticker, watchdog = monitor._ticker, monitor._watchdog
+        monitor.start()
+        assert monitor._ticker is ticker
+        await asyncio.sleep(0.1)
+        assert monitor.stats()["enabled"]
+        await monitor.stop()
+        watchdog.join(1)
+        assert not watchdog.is_alive()
+        assert ticker.cancelled()
+        return monitor.stats()
+
+    stats = asyncio.run(scenario())
+    assert not stats["enabled"]
+    assert stats["samples"] > 0 and stats["stalls"] == 0
+
+    async def restart():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    samples = stats["samples"]
+    asyncio.run(restart())
+    assert monitor.stats()["samples"] > samples
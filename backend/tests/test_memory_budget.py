@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.fastapi_app import ai_utils, main
+from backend.fastapi_app.memory_budget import MemoryBudget, MemoryBudgetFull
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def test_reserve_times_out_instead_of_blocking():
+    budget = MemoryBudget(max_bytes=100)
+    with budget.reserve(80):
+        with pytest.raises(MemoryBudgetFull):
+            budget.reserve(40, timeout=0.05)
+    assert budget.stats()["in_use_bytes"] == 0
+    assert budget.stats()["rejected"] == 1
+
+
+def test_reservation_grows_and_releases_everything():
+    budget = MemoryBudget(max_bytes=100)
+    with budget.reserve(30) as reservation:
+        reservation.grow(50)
+        assert budget.stats()["in_use_bytes"] == 80
+        with pytest.raises(MemoryBudgetFull):
+            budget.reserve(30, timeout=0.05)
+    assert budget.stats()["in_use_bytes"] == 0
+
+
+def test_download_streams_to_disk_holding_one_chunk(tmp_path, monkeypatch):
+    budget = MemoryBudget(max_bytes=10_000)
+    held = []
+    monkeypatch.setattr(ai_utils, "memory_budget", budget)
+    monkeypatch.setattr(ai_utils, "DOWNLOAD_CHUNK_BYTES", 64)
+    body = b"%PDF" + b"x" * 296
+    response = _Response(body)
+    chunks = response.iter_content
+
+    def iter_content(chunk_size):
+        for chunk in chunks(chunk_size):
+            held.append(budget.stats()["in_use_bytes"])
+            yield chunk
+
+    response.iter_content = iter_content
+    monkeypatch.setattr(ai_utils, "http_session", lambda: type("S", (), {"get": lambda *a, **k: response})())
+    target = tmp_path / "sub.pdf"
+    assert ai_utils.download_file("http://storage.test/sub.pdf", str(target)) == (200, "")
+    assert target.read_bytes() == body
+    assert held == [64] * 5
+    assert budget.stats()["in_use_bytes"] == 0
+
+
+def test_failed_download_leaves_no_partial_file(tmp_path, monkeypatch):
+    class _Broken(_Response):
+        def iter_content(self, chunk_size):
+            yield b"%PDF"
+            raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(ai_utils, "memory_budget", MemoryBudget(max_bytes=10_000))
+    monkeypatch.setattr(ai_utils, "http_session", lambda: type("S", (), {"get": lambda *a, **k: _Broken(b"")})())
+    target = tmp_path / "sub.pdf"
+    with pytest.raises(ConnectionError):
+        ai_utils.download_file("http://storage.test/sub.pdf", str(target))
+    assert not target.exists()
+    assert ai_utils.memory_budget.stats()["in_use_bytes"] == 0
+
+
+def test_final_grading_runs_off_the_event_loop(monkeypatch):
+    def grade(assignment_id):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return {"count": 1, "results": [{"submission_id": "s1", "status": "graded"}]}
+        raise AssertionError("graded on the event loop")
+
+    monkeypatch.setattr(main, "grade_submissions_for_assignment", grade)
+    response = TestClient(main.app).post("/final_grading", json={"assignment_id": "a1"})
+    assert response.status_code == 200
+    assert response.json()["graded_count"] == 1
@@ -0,0 +1,11 @@
+import pytest
+
+from backend.fastapi_app import registry
+
+
+def test_missing_api_key_raises_instead_of_exiting(monkeypatch):
+    monkeypatch.setattr(registry, "_auth_configured", False)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    with pytest.raises(registry.AuthConfigurationError):
+        registry.get_model("gemini-2.5-flash")
+    assert not registry.clients_ready()
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from backend.fastapi_app import ai_utils, regrade
+from backend.fastapi_app.grading_memo import AnswerMemo, rubric_entry_hash, rubric_fingerprint, split_by_question
+from backend.fastapi_app.regrade import diff_rubric
+
+OLD_RUBRIC = "1) 0; Wrong, 2; Right\n2) 0; Wrong, 3; Right"
+NEW_RUBRIC = "1) 0; Wrong, 2; Right\n2) 0; Wrong, 4; Right\n3) 0; Wrong, 1; Right"
+
+
+def test_diff_rubric_reports_changed_new_and_removed_questions():
+    old = {"1": "a", "2": "b", "4": "d"}
+    new = {"1": "a", "2": "B", "3": "c"}
+    assert diff_rubric(old, new) == (["2", "3"], ["4"], False)
+    assert diff_rubric(new, dict(new)) == ([], [], False)
+
+
+def test_diff_rubric_falls_back_to_a_full_regrade():
+    new = {"1": "a", "2": "b"}
+    assert diff_rubric(None, new) == (["1", "2"], [], True)
+    assert diff_rubric({"*": "x"}, new) == (["1", "2"], [], True)
+    assert diff_rubric({"1": "a"}, {"*": "y"}) == ([], [], True)
+
+
+@pytest.fixture
+def regrade_env(monkeypatch):
+    memo = AnswerMemo()
+    monkeypatch.setattr(ai_utils, "answer_memo", memo)
+    monkeypatch.setattr(regrade, "answer_memo", memo)
+    transcript = "1) 4\n2) 6\n3) 9"
+    store = type("Store", (), {"get": lambda self, submission_id, **kw: {"transcript": transcript}})()
+    monkeypatch.setattr(regrade, "get_transcription_store", lambda: store)
+    patches = []
+    monkeypatch.setattr(regrade, "patch_result", lambda url, key, result_id, fields: patches.append(fields))
+    monkeypatch.setattr(regrade, "record_result", lambda *args: None)
+    row = {
+        "result_id": 7, "submission_id": "s1", "overall_score": 5,
+        "rubric_hashes": rubric_fingerprint(OLD_RUBRIC),
+        "result_json": [{"question": "1", "score": 2}, {"question": "2", "score": 3}],
+    }
+    return memo, row, patches
+
+
+def _model_returns(monkeypatch, results):
+    monkeypatch.setattr(ai_utils, "grade_student_answer",
+                        lambda **kwargs: json.dumps({"results": results, "overall_feedback": ""}))
+
+
+def test_partial_regrade_keeps_memo_entries_of_unaffected_questions(regrade_env, monkeypatch):
+    memo, row, patches = regrade_env
+    _model_returns(monkeypatch, [{"question": "2", "score": 4}, {"question": "3", "score": 1}])
+    memo.sync_rubric("a1", NEW_RUBRIC)
+    q1_hash = rubric_entry_hash(split_by_question(NEW_RUBRIC), "1", NEW_RUBRIC)
+    memo.store("a1", "1", q1_hash, "4", {"question": "1", "score": 2})
+
+    report = regrade.regrade_result(row, "a1", "", NEW_RUBRIC, rubric_fingerprint(NEW_RUBRIC), "http://s.test", "k")
+    assert report["regraded_questions"] == ["2", "3"]
+    assert memo.lookup("a1", "1", q1_hash, "4") is not None
+    assert patches[0]["overall_score"] == 7
+    assert patches[0]["rubric_hashes"] == rubric_fingerprint(NEW_RUBRIC)
+
+
+def test_question_the_model_left_out_keeps_its_old_hash(regrade_env, monkeypatch):
+    _, row, patches = regrade_env
+    _model_returns(monkeypatch, [{"question": "3", "score": 1}])
+    new_hashes = rubric_fingerprint(NEW_RUBRIC)
+    regrade.regrade_result(row, "a1", "", NEW_RUBRIC, new_hashes, "http://s.test", "k")
+    assert patches[0]["rubric_hashes"] == {"1": new_hashes["1"], "2": row["rubric_hashes"]["2"], "3": new_hashes["3"]}
+    assert diff_rubric(patches[0]["rubric_hashes"], new_hashes) == (["2"], [], False)
+
+
+def test_formatting_only_rubric_edit_changes_no_hashes(regrade_env):
+    _, row, patches = regrade_env
+    reformatted = "1)  0 ; wrong,\n   2; RIGHT\n2) 0;Wrong , $3$; \\, Right."
+    assert rubric_fingerprint(reformatted) == rubric_fingerprint(OLD_RUBRIC)
+
+    report = regrade.regrade_result(row, "a1", "", reformatted, rubric_fingerprint(reformatted), "http://s.test", "k")
+    assert report["status"] == "unchanged"
+    assert patches == []
+    assert rubric_fingerprint("1) 0; Wrong, 2; Right\n2) 0; Wrong, 4; Right")["2"] != row["rubric_hashes"]["2"]
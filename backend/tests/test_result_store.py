@@ -0,0 +1,64 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.fastapi_app import main, result_store
+from backend.fastapi_app.result_store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(path=str(tmp_path / "results.db"), ttl_seconds=60, max_bytes=10 ** 6)
+
+
+def test_find_by_hash_keys_on_prompt_and_model(store):
+    result_id = store.put("answer", "transcript", content_hash="h", prompt="prompt A", model="flash-lite,flash")
+
+    assert store.find_by_hash("h", "answer", prompt="prompt A", model="flash-lite,flash")["result_id"] == result_id
+    assert store.find_by_hash("h", "answer", prompt="prompt B", model="flash-lite,flash") is None
+    assert store.find_by_hash("h", "answer", prompt="prompt A", model="flash") is None
+    assert store.find_by_hash("h", "rubric", prompt="prompt A", model="flash-lite,flash") is None
+
+
+def test_expired_results_are_hidden_and_evicted(store, monkeypatch):
+    result_id = store.put("answer", "old", content_hash="h")
+    now = time.time()
+    monkeypatch.setattr(result_store.time, "time", lambda: now + 61)
+
+    assert store.get(result_id) is None
+    assert store.find_by_hash("h", "answer") is None
+    assert store.evict() == 1
+    assert store.stats()["count"] == 0
+
+
+def test_size_eviction_drops_least_recently_read(store, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(result_store.time, "time", lambda: clock[0])
+    store.ttl_seconds = 10 ** 6
+    ids = []
+    for i in range(3):
+        clock[0] += 1
+        ids.append(store.put("score", f"result {i} " + "x" * 200))
+    clock[0] += 1
+    store.get(ids[0])
+    store.max_bytes = store.stats()["bytes"] - 1
+
+    assert store.evict() == 1
+    assert store.get(ids[1]) is None
+    assert store.get(ids[0]) is not None and store.get(ids[2]) is not None
+
+
+def test_get_result_endpoint(store, monkeypatch):
+    monkeypatch.setattr(result_store, "_store", store)
+    result_id = store.put("score", {"total": 7}, content_hash="h", filename="score_output.txt")
+    client = TestClient(main.app)
+
+    response = client.get(f"/results/{result_id}")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["result_id"] == result_id
+    assert body["filename"] == "score_output.txt"
+    assert body["content"] == '{"total": 7}'
+
+    assert client.get("/results/missing").status_code == 404
@@ -0,0 +1,57 @@
+from backend.fastapi_app.rubric_rules import apply_rules, decide, parse_levels
+
+
+def test_parse_levels_keeps_rubric_order():
+    assert parse_levels("0; Blank, 2 pts: Partly right, 4; Correct") == [(0, "Blank"), (2, "Partly right"), (4, "Correct")]
+
+
+def test_fixed_score_and_full_marks():
+    assert decide("1", "0; Blank, 0; Short, honest statement", "anything")["score"] == 0
+    full = decide("2", "0; Wrong, 3; Right. Give full marks to everyone.", "", False)
+    assert (full["score"], full["graded_by"]) == (3, "rule:full_marks")
+
+
+def test_non_blank_answer_gets_the_attempt_level_not_the_negated_one():
+    result = decide("1", "0; Not answered, 1; Answered", "x = 4")
+    assert (result["score"], result["graded_by"]) == (1, "rule:non_blank")
+    assert decide("1", "0; Not attempted, 2; Attempted", "some work")["score"] == 2
+
+
+def test_blank_answer_gets_the_blank_level():
+    result = decide("1", "0; Not answered, 1; Answered", "  n/a ")
+    assert (result["score"], result["graded_by"]) == (0, "rule:blank")
+
+
+def test_expected_answer_checked_before_blank():
+    result = decide("1", "0; Wrong, 2; Right. Correct answer: none", "None")
+    assert (result["score"], result["graded_by"]) == (2, "rule:exact_match")
+
+
+def test_open_items_are_left_for_the_model():
+    assert decide("1", "0; Wrong, 1; Partly, 2; Right", "x = 4") is None
+
+
+def test_missing_labels_are_not_treated_as_blank():
+    rubric = {"1.c": "0; Blank, 2; Any attempt", "1.d": "0; Wrong, 2; Right", "2": "1; Participation, 1; Always"}
+    decided = apply_rules(rubric, {"1.c": "c work\nd. 42"})
+    assert decided["1.c"]["score"] == 2
+    assert "1.d" not in decided
+    assert decided["2"]["graded_by"] == "rule:fixed_score"
+
+
+def test_single_level_entry_goes_to_the_model():
+    assert decide("1.a", "5; Correct derivation with clear explanation", "I dont know") is None
+
+
+def test_full_marks_only_for_unconditional_instructions():
+    assert decide("1", "0; Wrong, 3; Right. Do not give full marks unless the units are stated.", "5 m") is None
+    assert decide("1", "0; Wrong, 3; Right. Give full marks only if the units are stated.", "5 m") is None
+    assert decide("1", "0; Wrong, 3; Right. Don't award full marks for a guess.", "5 m") is None
+    result = decide("1", "0; Wrong, 3; Right. Please award full marks; the question had a typo.", "", False)
+    assert (result["score"], result["graded_by"]) == (3, "rule:full_marks")
+
+
+def test_exact_match_skipped_when_levels_grade_the_working():
+    entry = "0; Wrong, 1; Correct answer without working, 3; Correct with explanation. Answer: 42"
+    assert decide("1", entry, "42") is None
+    assert decide("1", "0; Wrong, 2; Right. Answer: 42", "42")["graded_by"] == "rule:exact_match"
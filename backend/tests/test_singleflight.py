@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from backend.fastapi_app.singleflight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, n):
+    """Start n callers; returns (results, errors) once they all finish."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _wait_for_waiters(flight, n):
+    deadline = time.time() + 5
+    while flight.stats()["coalesced"] < n and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_with_one_key_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def transcribe():
+        runs.append(1)
+        release.wait(5)
+        return "transcript"
+
+    threads, results, errors = _run_concurrently(flight, "pdf", transcribe, 5)
+    _wait_for_waiters(flight, 4)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert runs == [1]
+    assert results == ["transcript"] * 5 and errors == []
+    assert flight.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_exception_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def failing():
+        runs.append(1)
+        release.wait(5)
+        raise RuntimeError("model overloaded")
+
+    threads, results, errors = _run_concurrently(flight, "pdf", failing, 3)
+    _wait_for_waiters(flight, 2)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(runs) == 1 and results == []
+    assert len(errors) == 3
+    assert all(isinstance(e, RuntimeError) and str(e) == "model overloaded" for e in errors)
+
+    # The failure is forgotten: the next call runs the function again.
+    assert flight.do("pdf", lambda: "retried") == "retried"
+    assert flight.stats()["executed"] == 2
+
+    def fails_alone():
+        raise ValueError("again")
+
+    with pytest.raises(ValueError):
+        flight.do("pdf", fails_alone)
+    assert flight.stats()["in_flight"] == 0
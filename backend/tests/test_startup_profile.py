@@ -0,0 +1,16 @@
+from backend.fastapi_app.startup_profile import parse_importtime
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   json.decoder
+import time:       300 |        420 | json
+import time:       -50 |       2000 |     google.generativeai
+import time:       900 |       2500 |     google.generativeai
+"""
+
+
+def test_parse_importtime_reports_each_module_once_without_negative_self_time():
+    rows = parse_importtime(IMPORTTIME)
+    assert [row["module"] for row in rows] == ["google.generativeai", "json", "json.decoder"]
+    assert rows[0] == {"module": "google.generativeai", "self_ms": 0.9, "cumulative_ms": 2.5}
+    assert all(row["self_ms"] >= 0 for row in rows)
@@ -0,0 +1,57 @@
+import pytest
+
+from backend.fastapi_app import ai_utils
+
+
+class _Page:
+    status_code = 200
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def json(self):
+        return self.rows
+
+
+def test_pagination_continues_past_a_capped_page(monkeypatch):
+    # The server caps pages at 2 rows although 3 were asked for.
+    ids = [1, 2, 3, 4, 5]
+    calls = []
+
+    def get(url, params=None, headers=None, timeout=None):
+        calls.append(params.get("id"))
+        after = int(params["id"][3:]) if "id" in params else 0
+        return _Page([{"id": i} for i in ids if i > after][:2])
+
+    monkeypatch.setattr(ai_utils, "http_session", lambda: type("S", (), {"get": staticmethod(get)})())
+    pages = list(ai_utils.iter_submission_pages("a1", "http://supabase.test", "key", page_size=3))
+    assert [row["id"] for page in pages for row in page] == ids
+    assert calls == [None, "gt.2", "gt.4", "gt.5"]
+
+
+def test_prefetch_producer_stops_when_the_consumer_closes(monkeypatch):
+    produced = []
+
+    def pages():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    monkeypatch.setattr(ai_utils, "PREFETCH_PUT_TIMEOUT_S", 0.01)
+    with ai_utils.prefetch(pages()) as it:
+        assert next(it) == 0
+        thread = it._thread
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert len(produced) < 5
+
+
+def test_prefetch_reraises_producer_errors():
+    def pages():
+        yield 1
+        raise RuntimeError("page fetch failed")
+
+    it = ai_utils.prefetch(pages())
+    assert next(it) == 1
+    with pytest.raises(RuntimeError, match="page fetch failed"):
+        next(it)
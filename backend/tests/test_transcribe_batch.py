@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+import transcribe
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_transcribe(pdf_path, prompt):
+        calls.append(pdf_path)
+        if "broken" in pdf_path:
+            return "Error: could not read the PDF"
+        return f"transcript of {os.path.basename(pdf_path)}"
+
+    monkeypatch.setattr(transcribe, "transcribe_pdf_from_path", fake_transcribe)
+    monkeypatch.setattr(transcribe, "setup_auth", lambda: None)
+    out_dir = tmp_path / "out"
+
+    def run(*inputs, extra=()):
+        return transcribe.batch_main([*map(str, inputs), "--type", "answer", "--workers", "2",
+                                      "--output-dir", str(out_dir), *extra])
+
+    run.calls = calls
+    run.out_dir = out_dir
+    return run
+
+
+def _pdf(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF-1.4")
+    return path
+
+
+def test_manifest_records_outputs_and_failures(tmp_path, batch):
+    ok = _pdf(tmp_path / "in" / "hw1.pdf")
+    _pdf(tmp_path / "in" / "broken.pdf")
+
+    assert batch(tmp_path / "in") == 1
+
+    manifest = json.loads((batch.out_dir / "manifest.json").read_text())
+    assert (manifest["done"], manifest["skipped"], manifest["failed"]) == (1, 0, 1)
+    by_input = {os.path.basename(e["input"]): e for e in manifest["files"]}
+    assert by_input["broken.pdf"]["status"] == "failed"
+    assert by_input["broken.pdf"]["error"].startswith("Error:")
+    assert by_input["broken.pdf"]["output"] is None
+    output = by_input["hw1.pdf"]["output"]
+    assert output == transcribe.batch_output_path(str(ok), "answer", str(batch.out_dir))
+    assert open(output, encoding="utf-8").read() == "transcript of hw1.pdf"
+
+
+def test_rerun_skips_finished_files_unless_forced(tmp_path, batch):
+    _pdf(tmp_path / "in" / "hw1.pdf")
+    _pdf(tmp_path / "in" / "hw2.pdf")
+    assert batch(tmp_path / "in") == 0
+    assert len(batch.calls) == 2
+
+    assert batch(tmp_path / "in") == 0
+    assert len(batch.calls) == 2
+    manifest = json.loads((batch.out_dir / "manifest.json").read_text())
+    assert (manifest["done"], manifest["skipped"]) == (0, 2)
+
+    assert batch(tmp_path / "in", extra=["--force"]) == 0
+    assert len(batch.calls) == 4
+
+
+def test_colliding_names_are_tagged_independently_of_input_order(tmp_path):
+    a = str(_pdf(tmp_path / "a" / "hw.pdf"))
+    b = str(_pdf(tmp_path / "b" / "hw.pdf"))
+    other = str(_pdf(tmp_path / "a" / "other.pdf"))
+
+    forward = transcribe.batch_output_paths([a, b, other], "answer", "out")
+    backward = transcribe.batch_output_paths([other, b, a], "answer", "out")
+
+    assert forward == backward
+    assert forward[a] != forward[b]
+    assert forward[other] == transcribe.batch_output_path(other, "answer", "out")
+    assert all(forward[p] != transcribe.batch_output_path(p, "answer", "out") for p in (a, b))
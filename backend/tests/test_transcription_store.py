@@ -0,0 +1,44 @@
+import pytest
+
+from backend.fastapi_app import ai_utils
+from backend.fastapi_app.transcription_store import SQLiteTranscriptionStore
+
+SUB = {"id": "s1", "user_id": "u1", "file_url": "submissions/s1.pdf"}
+
+
+@pytest.fixture
+def pdf_env(tmp_path, monkeypatch):
+    store = SQLiteTranscriptionStore(str(tmp_path / "transcriptions.db"))
+    monkeypatch.setattr(ai_utils, "get_transcription_store", lambda: store)
+    monkeypatch.setattr(ai_utils, "get_signed_url", lambda *args: "http://storage.test/s1.pdf")
+    env = {"store": store, "pdf": b"%PDF-1.4 first upload", "transcribed": []}
+
+    def download(url, local_name):
+        with open(local_name, "wb") as f:
+            f.write(env["pdf"])
+        return 200, ""
+
+    def transcribe(path, prompt):
+        env["transcribed"].append(path)
+        return f"Answer: transcription {len(env['transcribed'])}"
+
+    monkeypatch.setattr(ai_utils, "download_file", download)
+    monkeypatch.setattr(ai_utils, "transcribe_pdf_from_path", transcribe)
+    return env
+
+
+def test_stored_transcription_is_reused_for_the_same_pdf(pdf_env, tmp_path):
+    first = ai_utils.transcribe_submission(SUB, "a1", "http://s.test", "k", str(tmp_path))
+    again = ai_utils.transcribe_submission(SUB, "a1", "http://s.test", "k", str(tmp_path))
+    assert (first["status"], again["status"]) == ("transcribed", "stored")
+    assert again["transcript"] == first["transcript"]
+    assert len(pdf_env["transcribed"]) == 1
+
+
+def test_reuploaded_pdf_is_transcribed_again(pdf_env, tmp_path):
+    ai_utils.transcribe_submission(SUB, "a1", "http://s.test", "k", str(tmp_path))
+    pdf_env["pdf"] = b"%PDF-1.4 corrected upload"
+    second = ai_utils.transcribe_submission(SUB, "a1", "http://s.test", "k", str(tmp_path))
+    assert second["status"] == "transcribed"
+    assert second["transcript"] == "Answer: transcription 2"
+    assert pdf_env["store"].get("s1")["transcript"] == "Answer: transcription 2"
@@ -0,0 +1,108 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.fastapi_app import ai_utils, usage
+from backend.fastapi_app.usage import TokenBudgetExceeded, UsageLedger, usage_scope
+
+
+def _response(tokens):
+    return SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=tokens, candidates_token_count=0,
+                                                          cached_content_token_count=0, total_token_count=tokens))
+
+
+def test_scoped_totals_are_bounded_but_global_totals_stay():
+    ledger = UsageLedger(max_entries=2)
+    for submission_id in ("s1", "s2", "s3"):
+        ledger.record("grading", "gemini-2.5-flash", _response(10), 0.1, scope={"submission": submission_id})
+    assert ledger.totals("submission", "s1")["calls"] == 0
+    assert ledger.totals("submission", "s3")["total_tokens"] == 10
+    assert ledger.totals("all", "all")["total_tokens"] == 30
+    assert ledger.totals("model", "gemini-2.5-flash")["calls"] == 3
+
+
+def test_recently_used_totals_survive_eviction():
+    ledger = UsageLedger(max_entries=2)
+    ledger.record("grading", "m", _response(1), 0.0, scope={"job": "j1"})
+    ledger.record("grading", "m", _response(1), 0.0, scope={"submission": "s1"})
+    ledger.record("grading", "m", _response(1), 0.0, scope={"job": "j1"})
+    ledger.record("grading", "m", _response(1), 0.0, scope={"submission": "s2"})
+    assert ledger.totals("job", "j1")["calls"] == 2
+    assert ledger.totals("submission", "s1")["calls"] == 0
+
+
+def test_spent_budget_is_not_attempted_and_writes_nothing(monkeypatch):
+    def over_budget(*args, **kwargs):
+        raise TokenBudgetExceeded("Job j1 used 100 of 100 budgeted tokens")
+
+    uploads = []
+    monkeypatch.setattr(ai_utils, "transcribe_submission", over_budget)
+    monkeypatch.setattr(ai_utils, "upload_results", lambda *args, **kwargs: uploads.append(args))
+    with usage_scope(job="j1"):
+        result = ai_utils.grade_single_submission({"id": "s1", "file_url": "x.pdf"}, "a1", "q", "r",
+                                                  "http://supabase.test", "key", "/tmp")
+    assert result["status"] == "not_attempted"
+    assert uploads == []
+
+
+class _Recorder:
+    def __init__(self):
+        self.rows = []
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        self.rows.extend(json.loads(data))
+        return SimpleNamespace(status_code=201, raise_for_status=lambda: None)
+
+
+def test_upload_results_omits_unset_optional_columns(monkeypatch):
+    session = _Recorder()
+    monkeypatch.setattr(ai_utils, "http_session", lambda: session)
+    monkeypatch.setattr(ai_utils, "record_result", lambda *args: None)
+    assert ai_utils.upload_results("http://supabase.test", "key", "s1", "u1", "failed", None, "a1")
+    assert ai_utils.upload_results("http://supabase.test", "key", "s2", "u1", "failed", None, "a1",
+                                   token_usage={"total_tokens": 3})
+    assert not {"token_usage", "rubric_hashes", "duplicate_of"} & set(session.rows[0])
+    assert session.rows[1]["token_usage"] == {"total_tokens": 3}
+    assert "rubric_hashes" not in session.rows[1]
+
+
+class _Model:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, *args, **kwargs):
+        self.calls += 1
+        response = _response(10)
+        response.candidates = [SimpleNamespace(finish_reason=1)]
+        response.text = '{"results": [{"question": "1", "score": 2}]}'
+        return response
+
+
+def _budgeted_ledger(monkeypatch, used_tokens):
+    ledger = UsageLedger()
+    ledger.set_budget("j1", 100, throttle_at=0.5, throttle_seconds=3.0)
+    ledger.record("grading", "m", _response(used_tokens), 0.0, scope={"job": "j1"})
+    monkeypatch.setattr(usage, "usage_ledger", ledger)
+    sleeps = []
+    monkeypatch.setattr(usage.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_throttle_sleeps_once_per_model_call(monkeypatch):
+    sleeps = _budgeted_ledger(monkeypatch, 60)
+    model = _Model()
+    monkeypatch.setattr(ai_utils, "get_model", lambda *args: model)
+    with usage_scope(job="j1"):
+        ai_utils.grade_student_answer("1) 0; Wrong, 2; Right", "", "x = 4", model_name="m")
+    assert (model.calls, sleeps) == (1, [3.0])
+
+
+def test_spent_budget_stops_the_cascade_instead_of_escalating(monkeypatch):
+    _budgeted_ledger(monkeypatch, 100)
+    models = []
+    monkeypatch.setattr(ai_utils, "get_model", lambda name, *args: models.append(name) or _Model())
+    monkeypatch.setattr(ai_utils, "GRADING_MODEL_TIERS", ["cheap", "pricey"])
+    with usage_scope(job="j1"), pytest.raises(TokenBudgetExceeded):
+        ai_utils.grade_answers(None, "1) 0; Wrong, 1; Partly, 2; Right", "", "1) x = 4")
+    assert models == ["cheap"]
@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.fastapi_app import main, work_queue
+from backend.fastapi_app.work_queue import SQLiteSubmissionQueue
+
+INSERT = {"type": "INSERT", "table": "submissions", "record": {"id": "s1", "assignment_id": "a1"}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "_queue", SQLiteSubmissionQueue(str(tmp_path / "queue.db")))
+    graded = []
+    monkeypatch.setattr(main, "grade_queued_submission", graded.append)
+    client = TestClient(main.app)
+    client.graded = graded
+    return client
+
+
+def test_webhook_is_refused_without_a_configured_secret(client, monkeypatch):
+    monkeypatch.delenv("SUPABASE_WEBHOOK_SECRET", raising=False)
+    assert client.post("/webhooks/submissions", json=INSERT).status_code == 503
+    assert client.graded == []
+
+
+def test_webhook_rejects_a_wrong_secret(client, monkeypatch):
+    monkeypatch.setenv("SUPABASE_WEBHOOK_SECRET", "s3cret")
+    resp = client.post("/webhooks/submissions", json=INSERT, headers={"X-Webhook-Secret": "nope"})
+    assert resp.status_code == 401
+    assert client.post("/webhooks/submissions", json=INSERT).status_code == 401
+
+
+def test_webhook_queues_once_and_grades(client, monkeypatch):
+    monkeypatch.setenv("SUPABASE_WEBHOOK_SECRET", "s3cret")
+    headers = {"X-Webhook-Secret": "s3cret"}
+    first = client.post("/webhooks/submissions", json=INSERT, headers=headers)
+    second = client.post("/webhooks/submissions", json=INSERT, headers=headers)
+    assert (first.status_code, first.json()["status"]) == (202, "queued")
+    assert second.json()["status"] == "duplicate"
+    assert client.graded == ["s1"]
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from backend.fastapi_app import worker
+from backend.fastapi_app.work_queue import SQLiteSubmissionQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteSubmissionQueue(str(tmp_path / "queue.db"))
+
+
+def _expire(queue, submission_id):
+    queue._conn().execute("UPDATE grading_queue SET lease_expires_at = ? WHERE submission_id = ?",
+                          (time.time() - 1, submission_id))
+
+
+def test_enqueue_is_idempotent_and_claim_leases_once(queue):
+    assert queue.enqueue("s1", "a1", {"id": "s1"})
+    assert not queue.enqueue("s1", "a1")
+    jobs = queue.claim("w1")
+    assert [job["submission_id"] for job in jobs] == ["s1"]
+    assert jobs[0]["attempts"] == 1
+    assert queue.claim("w2") == []
+    assert queue.claim_submission("s1", "w2") is None
+
+
+def test_complete_and_extend_require_the_lease_owner(queue):
+    queue.enqueue("s1", "a1")
+    queue.claim("w1")
+    assert not queue.extend_lease("s1", "w2")
+    assert not queue.complete("s1", "w2")
+    assert queue.extend_lease("s1", "w1")
+    assert queue.complete("s1", "w1")
+    assert queue.stats() == {"done": 1}
+
+
+def test_fail_retries_until_max_attempts(queue):
+    queue.enqueue("s1", "a1")
+    for attempt in range(1, 4):
+        assert queue.claim("w1")[0]["attempts"] == attempt
+        queue.fail("s1", "w1", "boom", max_attempts=3)
+    assert queue.stats() == {"dead": 1}
+    assert queue.claim("w1") == []
+
+
+def test_expired_lease_is_reclaimed_only_while_attempts_remain(queue):
+    queue.enqueue("s1", "a1")
+    queue.claim("w1")
+    _expire(queue, "s1")
+    assert queue.claim("w2", max_attempts=2)[0]["lease_owner"] == "w2"
+    _expire(queue, "s1")
+    assert queue.claim("w3", max_attempts=2) == []
+    assert queue.claim_submission("s1", "w3", max_attempts=2) is None
+    assert queue.requeue_expired(max_attempts=2) == 1
+    assert queue.stats() == {"dead": 1}
+
+
+@pytest.fixture
+def process(queue, monkeypatch):
+    calls = []
+
+    def run(outcome, attempts_before=0, lose_lease=False, rubric="r"):
+        monkeypatch.setattr(worker, "get_assignment_texts", lambda *args, **kwargs: ("q", rubric))
+
+        def fake_grade(sub, *args, record_failure=True, still_owned=None):
+            calls.append({"record_failure": record_failure})
+            if lose_lease:
+                queue._conn().execute("UPDATE grading_queue SET lease_owner = 'other' WHERE submission_id = 's1'")
+            if not still_owned():
+                return {"submission_id": "s1", "status": "lease_lost"}
+            return {"submission_id": "s1", "status": outcome}
+
+        monkeypatch.setattr(worker, "grade_single_submission", fake_grade)
+        queue.enqueue("s1", "a1", {"id": "s1"})
+        queue._conn().execute("UPDATE grading_queue SET attempts = ? WHERE submission_id = 's1'", (attempts_before,))
+        job = queue.claim("w1", max_attempts=3)[0]
+        return worker.process_job(queue, job, "w1", 60, "url", "key", "/tmp", max_attempts=3)
+
+    run.calls = calls
+    return run
+
+
+def test_job_completes_only_after_a_confirmed_upload(queue, process):
+    assert process("upload_failed")["status"] == "upload_failed"
+    assert queue.stats() == {"pending": 1}
+
+
+def test_graded_job_is_completed(queue, process):
+    process("graded")
+    assert queue.stats() == {"done": 1}
+
+
+def test_failed_row_is_written_only_on_the_last_attempt(queue, process):
+    process("download_failed")
+    assert process.calls[-1]["record_failure"] is False
+    queue._conn().execute("DELETE FROM grading_queue")
+    process("download_failed", attempts_before=2)
+    assert process.calls[-1]["record_failure"] is True
+    assert queue.stats() == {"dead": 1}
+
+
+def test_lost_lease_skips_upload_and_completion(queue, process):
+    assert process("graded", lose_lease=True)["status"] == "lease_lost"
+    row = queue._conn().execute("SELECT status, lease_owner FROM grading_queue").fetchone()
+    assert (row["status"], row["lease_owner"]) == ("leased", "other")
+
+
+@pytest.mark.parametrize("rubric", ["", "Error: transcription failed"])
+def test_job_fails_without_a_usable_rubric(queue, process, rubric):
+    result = process("graded", rubric=rubric)
+    assert result["status"] == "error"
+    assert process.calls == []
+    assert queue.stats() == {"pending": 1}
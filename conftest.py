@@ -0,0 +1,3 @@
+# Lets pytest import the `backend.fastapi_app` package from the repository root.
+# test_grade.py is a manual script that grades a live assignment, not a test module.
+collect_ignore = ["backend/fastapi_app/test_grade.py"]
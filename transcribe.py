@@ -6,12 +6,20 @@
 import os
 import sys
 import time
-import google.generativeai as genai
-from google.generativeai import types
+import glob
+import hashlib
+import json
 import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# google.generativeai is imported inside the functions that use it, so the
+# usage/argument checks below respond without loading the SDK.
 
 def setup_auth():
     """Sets up authentication for the Gemini API by checking for an env var."""
+    import google.generativeai as genai
+
     try:
         # Check if GOOGLE_API_KEY is set in the environment
         api_key = os.environ["GEMINI_API_KEY"]
@@ -30,6 +38,8 @@ def grade_student_answer(rubric_text: str, student_answer: str, model_name: str
     Grades a student's multi-question answer based on a multi-question rubric.
     Returns structured JSON with per-question scoring and improvement suggestions.
     """
+    import google.generativeai as genai
+    from google.generativeai import types
 
     model = genai.GenerativeModel(model_name=model_name)
 
@@ -88,7 +98,9 @@ def transcribe_pdf_from_path(pdf_path: str, system_prompt: str, model_name: str
     Returns:
         The transcribed text as a string, or an error message.
     """
-    
+    import google.generativeai as genai
+    from google.generativeai import types
+
     # 1. Instantiate the model.
     # Use a model that supports file inputs, like 1.5 Flash or Pro.
     # We pass the system_instruction here for broad compatibility.
@@ -165,10 +177,172 @@ def transcribe_pdf_from_path(pdf_path: str, system_prompt: str, model_name: str
 
     return text_output
 
+
+PROMPT_ANSWERSCRIPT = (
+    "You are an expert transcriptionist specializing in handwritten documents."
+    "Transcribe the attached PDF, which contains handwritten questions and answers."
+    "Your task is to produce a clean, plain-text version of the content."
+    "Follow these rules precisely:"
+    "1. Preserve the question and answer (Q&A) format."
+    "2. Start each question with the prefix 'Question:' on a new line."
+    "3. Start each answer with the prefix 'Answer:' on a new line."
+    "4. For any handwritten math, transcribe it into clear, readable LaTeX format (e.g., $E = mc^2$, $\\frac{a}{b}$)."
+)
+
+PROMPT_RUBRIC = (
+    "You are an AI assistant specializing in educational assessment."
+    "Analyze the attached PDF, which appears to be a scoring rubric or grading guide."
+    "Your task is to extract and transcribe this rubric into a clean, plain-text format."
+    "Preserve all scoring criteria, sub-criteria, and their associated point values."
+    "Structure the output logically, clearly linking criteria to their points."
+    "For example, transcribe content like '+1 if correct answer but no explanation, +2 if correct answer with some explanation'."
+)
+
+PROMPTS = {"answer": PROMPT_ANSWERSCRIPT, "rubric": PROMPT_RUBRIC}
+
+
+def _expand_inputs(patterns):
+    """PDF paths from files, directories (searched recursively) and glob patterns, de-duplicated."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*.pdf"), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(sorted(m for m in matches if m.lower().endswith(".pdf") and os.path.isfile(m)))
+    return list(dict.fromkeys(paths))
+
+
+def batch_output_path(pdf_path: str, transcription_type: str, output_dir: str) -> str:
+    """Deterministic output name (no UUID) so an interrupted batch can resume."""
+    name_without_ext = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{name_without_ext}__{transcription_type}_output.txt")
+
+
+def batch_output_paths(pdf_paths, transcription_type: str, output_dir: str):
+    """
+    Output path per input. Files with the same name in different directories
+    are all tagged with a hash of their own path, so each file's output name
+    doesn't depend on which of them was listed first.
+    """
+    outputs = {pdf_path: batch_output_path(pdf_path, transcription_type, output_dir) for pdf_path in pdf_paths}
+    counts = {}
+    for output_path in outputs.values():
+        counts[output_path] = counts.get(output_path, 0) + 1
+    for pdf_path, output_path in outputs.items():
+        if counts[output_path] > 1:
+            tag = hashlib.sha1(os.path.abspath(pdf_path).encode()).hexdigest()[:8]
+            base, suffix = output_path.rsplit("__", 1)
+            outputs[pdf_path] = f"{base}_{tag}__{suffix}"
+    return outputs
+
+
+def _transcribe_one(pdf_path: str, transcription_type: str, output_path: str):
+    start = time.perf_counter()
+    entry = {"input": pdf_path, "output": output_path, "status": "done", "error": None}
+    try:
+        result = transcribe_pdf_from_path(pdf_path, PROMPTS[transcription_type])
+        if result.startswith("Error:"):
+            entry.update(status="failed", output=None, error=result)
+        else:
+            # Write to a temp name first so a killed run never leaves a partial
+            # file that the next run would mistake for a finished one.
+            tmp_path = output_path + ".part"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(result)
+            os.replace(tmp_path, output_path)
+    except Exception as e:
+        entry.update(status="failed", output=None, error=str(e))
+    entry["seconds"] = round(time.perf_counter() - start, 2)
+    return entry
+
+
+def batch_main(argv):
+    """
+    Transcribe many PDFs concurrently:
+
+        python transcribe.py --batch <dir|glob|file.pdf> [...] --type answer|rubric
+                             [--workers 4] [--output-dir transcriptions] [--manifest PATH] [--force]
+
+    Files whose output already exists are skipped, so rerunning the same
+    command resumes an interrupted batch. A JSON manifest records each file's
+    output, timing and error.
+    """
+    parser = argparse.ArgumentParser(prog="transcribe.py --batch", description="Transcribe many PDFs concurrently.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--type", dest="transcription_type", choices=sorted(PROMPTS), required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output-dir", default="transcriptions")
+    parser.add_argument("--manifest", default=None, help="Defaults to <output-dir>/manifest.json")
+    parser.add_argument("--force", action="store_true", help="Re-transcribe files that already have output")
+    args = parser.parse_args(argv)
+
+    pdf_paths = _expand_inputs(args.inputs)
+    if not pdf_paths:
+        print("Error: No PDF files matched the given inputs.")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.json")
+
+    entries = []
+    pending = []
+    for pdf_path, output_path in batch_output_paths(pdf_paths, args.transcription_type, args.output_dir).items():
+        if os.path.exists(output_path) and not args.force:
+            entries.append({"input": pdf_path, "output": output_path, "status": "skipped",
+                            "error": None, "seconds": 0.0})
+        else:
+            pending.append((pdf_path, output_path))
+
+    print(f"Found {len(pdf_paths)} PDF(s): {len(pending)} to transcribe, "
+          f"{len(pdf_paths) - len(pending)} already done. Workers: {args.workers}")
+
+    if pending:
+        setup_auth()
+
+    start = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(_transcribe_one, pdf_path, args.transcription_type, output_path)
+                   for pdf_path, output_path in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            entries.append(entry)
+            done += 1
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed * 60 if elapsed > 0 else 0.0
+            mark = "OK " if entry["status"] == "done" else "ERR"
+            print(f"[{done}/{len(pending)}] {mark} {entry['input']} ({entry['seconds']}s) "
+                  f"- {rate:.1f} files/min")
+
+    elapsed = time.perf_counter() - start
+    order = {path: i for i, path in enumerate(pdf_paths)}
+    entries.sort(key=lambda e: order[e["input"]])
+    summary = {
+        "type": args.transcription_type,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 2),
+        "done": sum(e["status"] == "done" for e in entries),
+        "skipped": sum(e["status"] == "skipped" for e in entries),
+        "failed": sum(e["status"] == "failed" for e in entries),
+        "files": entries,
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nBatch finished in {elapsed:.1f}s: {summary['done']} transcribed, "
+          f"{summary['skipped']} skipped, {summary['failed']} failed.")
+    print(f"Manifest written to: {manifest_path}")
+    return 1 if summary["failed"] else 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        sys.exit(batch_main(sys.argv[2:]))
+
     # --- UPDATED: Now requires 3 arguments ---
     if len(sys.argv) < 3:
         print("Usage: python transcribe.py <file.pdf> <transcription_type>")
+        print("       python transcribe.py --batch <dir|glob> [...] --type <transcription_type> [--workers N]")
         print("Valid <transcription_type> options:")
         print("  'answer' : Transcribes a handwritten Q&A answer script.")
         print("  'rubric' : Transcribes a scoring rubric / grading guide.")
@@ -181,26 +355,6 @@ if __name__ == "__main__":
         print(f"Error: File not found at {pdf_path}")
         sys.exit(1)
 
-    PROMPT_ANSWERSCRIPT = (
-        "You are an expert transcriptionist specializing in handwritten documents."
-        "Transcribe the attached PDF, which contains handwritten questions and answers."
-        "Your task is to produce a clean, plain-text version of the content."
-        "Follow these rules precisely:"
-        "1. Preserve the question and answer (Q&A) format."
-        "2. Start each question with the prefix 'Question:' on a new line."
-        "3. Start each answer with the prefix 'Answer:' on a new line."
-        "4. For any handwritten math, transcribe it into clear, readable LaTeX format (e.g., $E = mc^2$, $\\frac{a}{b}$)."
-    )
-
-    PROMPT_RUBRIC = (
-        "You are an AI assistant specializing in educational assessment."
-        "Analyze the attached PDF, which appears to be a scoring rubric or grading guide."
-        "Your task is to extract and transcribe this rubric into a clean, plain-text format."
-        "Preserve all scoring criteria, sub-criteria, and their associated point values."
-        "Structure the output logically, clearly linking criteria to their points."
-        "For example, transcribe content like '+1 if correct answer but no explanation, +2 if correct answer with some explanation'."
-    )
-
     selected_prompt = ""
     if transcription_type == 'answer':
         selected_prompt = PROMPT_ANSWERSCRIPT